@@ -0,0 +1,126 @@
+"""FAISS index construction for the classifier reference set.
+
+Index types (all inner product over L2-normalized embeddings, i.e. cosine):
+    flat   exact brute-force scan, best below ~10k vectors
+    hnsw   graph index, high recall and low latency, ~1.5x the memory of flat
+    ivf    inverted lists over k-means cells, searches ``nprobe`` cells
+    ivfpq  ivf with product-quantized vectors, ~16-32x smaller, for millions of pages
+``auto`` picks one from the corpus size.
+"""
+import math
+import os
+
+import faiss
+import numpy as np
+
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "auto")
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))             # ivf / ivfpq cells visited per query
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", "64"))       # hnsw candidate list size
+ANN_HNSW_M = int(os.getenv("ANN_HNSW_M", "32"))
+CENTROIDS_PATH = os.getenv("LABEL_CENTROIDS_PATH", "label_centroids.npz")
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+# faiss wants ~39 training points per cell
+MIN_POINTS_PER_CELL = 39
+
+
+def choose_index_type(n: int) -> str:
+    if n < 10_000:
+        return "flat"
+    if n < 1_000_000:
+        return "ivf"
+    return "ivfpq"
+
+
+def default_nlist(n: int) -> int:
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CELL))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # 8 dims por sub-cuantizador (384 -> 48 bytes por vector)
+    for m in (dim // 8, dim // 4, dim // 2, dim):
+        if m and dim % m == 0:
+            return m
+    return dim
+
+
+def build_index(embeddings: np.ndarray, kind: str = ANN_INDEX_TYPE,
+                nlist: int | None = None) -> faiss.Index:
+    """Build (and train) an index of ``kind`` over ``embeddings``."""
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n, dim = embeddings.shape
+    if kind == "auto":
+        kind = choose_index_type(n)
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {kind}")
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+    else:
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8,
+                                     faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+
+    index.add(embeddings)
+    configure_search(index)
+    return index
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    while hasattr(index, "index") and not isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def index_type(index: faiss.Index) -> str:
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def configure_search(index: faiss.Index, nprobe: int = ANN_NPROBE,
+                     ef_search: int = ANN_EF_SEARCH) -> faiss.Index:
+    """Apply the recall/latency knobs of the index type (no-op for flat)."""
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe, inner.nlist)
+    return index
+
+
+def compute_centroids(embeddings: np.ndarray, labels: list[str]) -> tuple[list[str], np.ndarray]:
+    """Normalized mean embedding of every label: ``(label table, float32[labels, dim])``."""
+    table = sorted(set(labels))
+    position = {label: i for i, label in enumerate(table)}
+    label_ids = np.array([position[label] for label in labels], dtype=np.int64)
+    centroids = np.zeros((len(table), embeddings.shape[1]), dtype="float32")
+    np.add.at(centroids, label_ids, embeddings)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return table, centroids
+
+
+def save_centroids(path, labels: list[str], centroids: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.savez(f, labels=np.array(labels), centroids=centroids)
+
+
+def load_centroids(path=CENTROIDS_PATH) -> tuple[list[str], np.ndarray] | None:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return [str(label) for label in data["labels"]], data["centroids"].astype("float32")
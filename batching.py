@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Groups concurrent calls from many threads into one batched call.
+
+    ``submit`` blocks the calling thread; a background thread collects items
+    for up to ``max_wait`` seconds (or until ``max_batch`` items are pending)
+    and hands them to ``batch_fn``, which must return one result per item.
+    """
+
+    def __init__(self, batch_fn, max_batch: int = 16, max_wait: float = 0.005,
+                 name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        # callbacks(batch_size, fill_ratio, queue_delays) — used to export metrics
+        self.observers = []
+        self.stats = {"batches": 0, "items": 0, "fill_sum": 0.0,
+                      "queue_delay_sum": 0.0, "queue_delay_max": 0.0}
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        self._ensure_thread()
+        return future.result()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def snapshot(self) -> dict:
+        batches = max(self.stats["batches"], 1)
+        items = max(self.stats["items"], 1)
+        return {
+            "batches": self.stats["batches"],
+            "items": self.stats["items"],
+            "avg_batch_size": self.stats["items"] / batches,
+            "avg_fill": self.stats["fill_sum"] / batches,
+            "avg_queue_delay_ms": 1000 * self.stats["queue_delay_sum"] / items,
+            "max_queue_delay_ms": 1000 * self.stats["queue_delay_max"],
+        }
+
+    def _ensure_thread(self):
+        # arrancado bajo demanda: cada proceso (p.ej. workers del pool) tiene el suyo
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            delays = [started - enqueued for _, _, enqueued in batch]
+            self._record(len(batch), delays)
+            try:
+                results = self.batch_fn([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record(self, size: int, delays: list[float]):
+        fill = size / self.max_batch
+        self.stats["batches"] += 1
+        self.stats["items"] += size
+        self.stats["fill_sum"] += fill
+        self.stats["queue_delay_sum"] += sum(delays)
+        self.stats["queue_delay_max"] = max(self.stats["queue_delay_max"], *delays)
+        for observer in self.observers:
+            observer(size, fill, delays)
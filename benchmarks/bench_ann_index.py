@@ -0,0 +1,80 @@
+"""Recall@k and query latency of each FAISS index type against the flat baseline.
+
+Vectors come from an existing flat index (``--index vector_index.faiss``) or are
+synthetic clustered unit vectors (``--synthetic N``, 384 dims like MiniLM).
+
+    python benchmarks/bench_ann_index.py --synthetic 200000 --nprobe 8 16 32 --ef 32 64 128
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import build_index, configure_search  # noqa: E402
+
+
+def synthetic(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    x = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def measure(index, queries, exact, k) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    _, found = index.search(queries, k)
+    latency = (time.perf_counter() - t0) / len(queries)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, exact)])
+    return recall, latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", type=Path, help="flat index to take the vectors from")
+    parser.add_argument("--synthetic", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=["hnsw", "ivf", "ivfpq"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+
+    if args.index:
+        flat_src = faiss.read_index(str(args.index))
+        x = flat_src.reconstruct_n(0, flat_src.ntotal)
+    else:
+        x = synthetic(args.synthetic, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = x[rng.choice(len(x), min(args.queries, len(x)), replace=False)]
+    # las consultas reales no están en el índice: se perturban un poco
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    flat = build_index(x, "flat")
+    _, exact = flat.search(queries, args.k)
+    _, flat_latency = measure(flat, queries, exact, args.k)
+    print(f"{len(x)} vectors, {x.shape[1]} dims, {len(queries)} queries, recall@{args.k}")
+    print(f"{'index':<8} {'param':>12} {'recall':>8} {'µs/query':>10} {'speedup':>8} {'build s':>8}")
+    print(f"{'flat':<8} {'-':>12} {1.0:>8.3f} {1e6 * flat_latency:>10.1f} {1.0:>8.1f} {'-':>8}")
+
+    for kind in args.types:
+        t0 = time.perf_counter()
+        index = build_index(x, kind)
+        build = time.perf_counter() - t0
+        params = [("ef_search", v) for v in args.ef] if kind == "hnsw" else [("nprobe", v) for v in args.nprobe]
+        for name, value in params:
+            configure_search(index, **{name: value})
+            recall, latency = measure(index, queries, exact, args.k)
+            print(f"{kind:<8} {f'{name}={value}':>12} {recall:>8.3f} {1e6 * latency:>10.1f} "
+                  f"{flat_latency / latency:>8.1f} {build:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Mean extraction latency and escalation rate of the model cascade vs. the large model alone.
+
+Ollama is replaced by a local stub (httpx MockTransport) answering after a
+fixed latency per model; ``--weak`` is the share of documents the small model
+answers with low confidence or missing fields, so they escalate. The
+routing code is the real one (``extractor.extract_entities_with_ollama``).
+
+    python benchmarks/bench_cascade.py --docs 200 --small-ms 400 --large-ms 2500 --weak 0.1 0.3 0.5
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extractor  # noqa: E402
+from ollama_client import OllamaClient  # noqa: E402
+
+FIELDS = ["invoice_number", "vendor_name", "date", "total_amount", "due_date", "currency"]
+
+
+def answer(confidence: float, found: int) -> str:
+    return json.dumps({f: {"value": "x" if i < found else "not found", "confidence": confidence if i < found else 0}
+                       for i, f in enumerate(FIELDS)})
+
+
+def stub(latencies: dict, weak: set, calls: dict) -> OllamaClient:
+    async def handler(request):
+        payload = json.loads(request.content)
+        model, doc = payload["model"], payload["messages"][-1]["content"].rsplit("\n", 1)[-1]
+        calls[model] = calls.get(model, 0) + 1
+        await asyncio.sleep(latencies[model])
+        if model == "small" and doc in weak:
+            content = answer(0.3, 2)
+        else:
+            content = answer(0.9, len(FIELDS))
+        return httpx.Response(200, json={"message": {"content": content}, "done": True})
+
+    return OllamaClient(url="http://ollama.test/api/chat", transport=httpx.MockTransport(handler), parallel=1)
+
+
+async def run(docs: list[str]) -> float:
+    t0 = time.perf_counter()
+    for doc in docs:   # uno detrás de otro: latencia por documento, sin colas
+        await extractor.extract_entities_with_ollama("invoice", doc)
+    return (time.perf_counter() - t0) / len(docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--small-ms", type=float, default=400)
+    parser.add_argument("--large-ms", type=float, default=2500)
+    parser.add_argument("--weak", type=float, nargs="+", default=[0.1, 0.3, 0.5])
+    args = parser.parse_args()
+
+    docs = [f"doc-{i}" for i in range(args.docs)]
+    latencies = {"small": args.small_ms / 1000, extractor.MODEL_OLLAMA: args.large_ms / 1000}
+    with patch.object(extractor, "OLLAMA_STREAM", False), \
+            patch.object(extractor, "DOCUMENT_SCHEMA", {"invoice": FIELDS}), \
+            patch.object(extractor, "ROUTING", {}):
+        with patch.object(extractor, "ollama_client", stub(latencies, set(), {})):
+            baseline = asyncio.run(run(docs))
+        print(f"{'large only':<14} {baseline * 1000:8.0f} ms/doc")
+        for weak in args.weak:
+            weak_docs = set(random.Random(0).sample(docs, round(weak * len(docs))))
+            calls = {}
+            with patch.object(extractor, "ollama_client", stub(latencies, weak_docs, calls)), \
+                    patch.object(extractor, "OLLAMA_SMALL_MODEL", "small"):
+                mean = asyncio.run(run(docs))
+            print(f"cascade {weak:>5.0%}  {mean * 1000:8.0f} ms/doc   escalated {calls.get(extractor.MODEL_OLLAMA, 0) / len(docs):.0%}   "
+                  f"speedup {baseline / mean:4.2f}x")
+
+
+if __name__ == "__main__":
+    main()
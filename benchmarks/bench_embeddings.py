@@ -0,0 +1,111 @@
+"""Throughput, latency and classification agreement of each embedding backend vs. PyTorch fp32.
+
+The reference set is the labelled OCR text stored in ``metadata.pkl`` (or the
+build state). The reference index is built from the ``torch`` embeddings, as
+the published index is; every backend then classifies each reference text
+against it (leave-one-out k-NN vote, like ``classifier.py``). Reported:
+
+  docs/s      batch encoding throughput (``--batch-size``)
+  p50/p95 ms  single-document encode latency (one request, no micro-batching)
+  cos         mean / min cosine between the backend and the fp32 embedding of each text
+  agree       share of texts that get the same label as with the fp32 embeddings
+  acc         share of texts whose predicted label is their true label
+
+    python benchmarks/bench_embeddings.py metadata.pkl --limit 2000 --backends torch torch-int8 onnx onnx-int8
+"""
+import argparse
+import pickle
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from classifier import vote  # noqa: E402
+from embeddings import BACKENDS, load_model, make_encoder  # noqa: E402
+
+
+def reference_set(path: Path, limit: int) -> tuple[list[str], list[str]]:
+    if path.suffix == ".pkl":
+        with open(path, "rb") as f:
+            records = pickle.load(f)
+        records = records.values() if isinstance(records, dict) else records
+        rows = [(r["text"], r["label"]) for r in records if r.get("text")]
+    else:
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute("SELECT text, label FROM entries WHERE removed = 0 AND text IS NOT NULL"
+                                " ORDER BY id").fetchall()
+    # muestra aleatoria pero reproducible
+    rows = [rows[i] for i in np.random.default_rng(0).permutation(len(rows))[:limit]]
+    return [t for t, _ in rows], [label for _, label in rows]
+
+
+def knn_labels(index, embeddings: np.ndarray, labels: list[str], k: int) -> list[str]:
+    scores, found = index.search(embeddings, k + 1)
+    out = []
+    for i, (row_scores, row_ids) in enumerate(zip(scores, found)):
+        hits = [{"label": labels[j], "score": float(s)} for j, s in zip(row_ids, row_scores) if j not in (i, -1)]
+        out.append(vote(hits[:k])[0])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("reference", type=Path, nargs="?", default=Path("metadata.pkl"),
+                        help="metadata.pkl with texts, or the build state .sqlite3")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--limit", type=int, default=2000, help="reference texts to use")
+    parser.add_argument("--latency-docs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    texts, labels = reference_set(args.reference, args.limit)
+    print(f"{len(texts)} reference texts, {len(set(labels))} labels")
+
+    results, baseline = {}, None
+    for backend in ["torch", *[b for b in args.backends if b != "torch"]]:
+        try:
+            model = load_model(backend)
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+            if backend == "torch":
+                return   # sin la referencia fp32 no hay nada con qué comparar
+            continue
+        encode = make_encoder(model, args.batch_size)
+        encode(texts[:args.batch_size])   # warm-up
+        t0 = time.perf_counter()
+        embeddings = encode(texts)
+        throughput = len(texts) / (time.perf_counter() - t0)
+        latencies = []
+        for text in texts[:args.latency_docs]:
+            t0 = time.perf_counter()
+            encode([text])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        if baseline is None:
+            baseline = faiss.IndexFlatIP(embeddings.shape[1])
+            baseline.add(embeddings)
+            reference_embeddings = embeddings
+            reference_labels = knn_labels(baseline, embeddings, labels, args.k)
+        predicted = knn_labels(baseline, embeddings, labels, args.k)
+        cos = np.sum(embeddings * reference_embeddings, axis=1)
+        results[backend] = (throughput, *np.percentile(latencies, [50, 95]), cos.mean(), cos.min(),
+                            np.mean([a == b for a, b in zip(predicted, reference_labels)]),
+                            np.mean([a == b for a, b in zip(predicted, labels)]))
+        if backend not in args.backends:
+            del results[backend]
+
+    print(f"{'backend':<11} {'docs/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'cos':>7} {'min cos':>8} "
+          f"{'agree':>6} {'acc':>6}")
+    for backend, (tput, p50, p95, cos_mean, cos_min, agree, acc) in results.items():
+        print(f"{backend:<11} {tput:>8.1f} {p50:>7.2f} {p95:>7.2f} {cos_mean:>7.4f} {cos_min:>8.4f} "
+              f"{agree:>6.3f} {acc:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Startup time and RSS of the classifier metadata: pickled list vs memory-mapped store.
+
+Each variant is loaded in a fresh interpreter; the store is created from the
+pickle first when it does not exist yet.
+
+    python benchmarks/bench_metadata_store.py metadata.pkl metadata_store --lookups 1000
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from metadata_store import write_store  # noqa: E402
+
+CHILD = r"""
+import json, pickle, random, sys, time
+sys.path.insert(0, {root!r})
+import numpy as np
+from metadata_store import MetadataStore
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+before = rss_mb()
+t0 = time.perf_counter()
+if {kind!r} == "pickle":
+    with open({pkl!r}, "rb") as f:
+        metadata = pickle.load(f)
+else:
+    metadata = MetadataStore({store!r})
+load = time.perf_counter() - t0
+ids = random.Random(0).choices(range(len(metadata)), k={lookups})
+t0 = time.perf_counter()
+for i in ids:
+    metadata[i]["label"], metadata[i]["path"]
+lookup = (time.perf_counter() - t0) / max(len(ids), 1)
+print(json.dumps({{"load_s": load, "rss_mb": rss_mb() - before, "lookup_us": lookup * 1e6}}))
+"""
+
+
+def run(kind: str, args) -> dict:
+    code = CHILD.format(root=str(ROOT), kind=kind, pkl=str(args.pickle_path),
+                        store=str(args.store_dir), lookups=args.lookups)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pickle_path", type=Path, nargs="?", default=Path("metadata.pkl"))
+    parser.add_argument("store_dir", type=Path, nargs="?", default=Path("metadata_store"))
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    if not args.store_dir.exists():
+        import pickle
+        with open(args.pickle_path, "rb") as f:
+            write_store(args.store_dir, pickle.load(f))
+
+    print(f"{'format':<8} {'load ms':>9} {'RSS MB':>8} {'lookup µs':>10}")
+    for kind in ("pickle", "store"):
+        r = run(kind, args)
+        print(f"{kind:<8} {1000 * r['load_s']:>9.2f} {r['rss_mb']:>8.1f} {r['lookup_us']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
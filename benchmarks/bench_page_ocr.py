@@ -0,0 +1,47 @@
+"""Page OCR throughput (pages/sec): serial path vs. the page process pool.
+
+The text layer is disabled so every page goes through EasyOCR.
+
+    python benchmarks/bench_page_ocr.py contract.pdf --workers 2 4 8 16
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ocr  # noqa: E402
+
+
+def pages_per_second(pdfs: list[Path], workers: int, max_in_flight: int) -> tuple[int, float]:
+    pages = 0
+    t0 = time.perf_counter()
+    for pdf in pdfs:
+        pages += sum(1 for _ in ocr.iter_pdf_pages(pdf, use_text_layer=False,
+                                                   workers=workers,
+                                                   max_in_flight=max_in_flight))
+    return pages, pages / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="+", type=Path)
+    parser.add_argument("--workers", nargs="+", type=int, default=[2, 4, 8])
+    parser.add_argument("--max-in-flight", type=int, default=0)
+    args = parser.parse_args()
+
+    pages, serial = pages_per_second(args.pdfs, workers=0, max_in_flight=0)
+    print(f"{'workers':>8}{'pages':>7}{'pages/s':>10}{'speedup':>9}")
+    print(f"{'serial':>8}{pages:>7}{serial:>10.2f}{1.0:>8.1f}x")
+    for workers in args.workers:
+        ocr.shutdown_page_pool()
+        # arranque del pool (carga de un Reader por proceso) fuera de la medición
+        list(ocr.get_page_pool(workers).map(time.sleep, [0.5] * workers))
+        pages, rate = pages_per_second(args.pdfs, workers, args.max_in_flight)
+        print(f"{workers:>8}{pages:>7}{rate:>10.2f}{rate / serial:>8.1f}x")
+    ocr.shutdown_page_pool()
+
+
+if __name__ == "__main__":
+    main()
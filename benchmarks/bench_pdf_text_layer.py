@@ -0,0 +1,50 @@
+"""Text-layer fast path vs. OCR-only on one or more PDF corpora.
+
+Each argument is a directory of PDFs (e.g. one born-digital, one scanned, one
+mixed). Every PDF is processed twice through ``ocr.ocr_pdf_pages``: once with
+the native text layer allowed and once forcing OCR on every page.
+
+    python benchmarks/bench_pdf_text_layer.py corpora/digital corpora/scanned corpora/mixed
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ocr import ocr_pdf_pages  # noqa: E402
+
+
+def run_corpus(pdfs: list[Path], use_text_layer: bool) -> dict:
+    pages = text_pages = 0
+    t0 = time.perf_counter()
+    for pdf in pdfs:
+        result = ocr_pdf_pages(pdf, use_text_layer=use_text_layer)
+        pages += len(result)
+        text_pages += sum(p["source"] == "text" for p in result)
+    return {"pages": pages, "text_pages": text_pages, "seconds": time.perf_counter() - t0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpora", nargs="+", type=Path)
+    args = parser.parse_args()
+
+    print(f"{'corpus':<24}{'pages':>7}{'text':>7}{'ocr-only s':>12}{'fast-path s':>13}"
+          f"{'pages/s':>10}{'speedup':>9}")
+    for corpus in args.corpora:
+        pdfs = sorted(corpus.glob("*.pdf"))
+        if not pdfs:
+            print(f"{corpus.name:<24}  (no PDFs)")
+            continue
+        baseline = run_corpus(pdfs, use_text_layer=False)
+        fast = run_corpus(pdfs, use_text_layer=True)
+        print(f"{corpus.name:<24}{fast['pages']:>7}{fast['text_pages']:>7}"
+              f"{baseline['seconds']:>12.2f}{fast['seconds']:>13.2f}"
+              f"{fast['pages'] / fast['seconds']:>10.2f}"
+              f"{baseline['seconds'] / fast['seconds']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
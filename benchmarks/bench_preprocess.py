@@ -0,0 +1,56 @@
+"""Time and OCR accuracy of each preprocessing profile on sample images.
+
+Accuracy is the character similarity (difflib ratio) of the OCR output against
+``<image>.txt`` when a ground-truth file sits next to the image, otherwise
+against the output of the "quality" profile.
+
+    python benchmarks/bench_preprocess.py docs/
+"""
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ocr import READTEXT_OPTIONS, reader  # noqa: E402
+from preprocessing import PROFILES, load_gray, preprocess_image  # noqa: E402
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp"}
+
+
+def run_profile(img, profile: str) -> tuple[str, float, float]:
+    t0 = time.perf_counter()
+    pre = preprocess_image(img, profile)
+    t1 = time.perf_counter()
+    text = "\n".join(reader.readtext(pre, detail=0, paragraph=True, **READTEXT_OPTIONS))
+    return text, t1 - t0, time.perf_counter() - t1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", type=Path, nargs="?", default=Path("docs"))
+    args = parser.parse_args()
+
+    images = sorted(p for p in args.folder.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    totals = {name: {"pre": 0.0, "ocr": 0.0, "acc": 0.0} for name in PROFILES}
+    for path in images:
+        img = load_gray(path)
+        outputs = {name: run_profile(img, name) for name in PROFILES}
+        truth_file = path.with_suffix(".txt")
+        truth = truth_file.read_text(encoding="utf-8") if truth_file.exists() else outputs["quality"][0]
+        for name, (text, pre_s, ocr_s) in outputs.items():
+            totals[name]["pre"] += pre_s
+            totals[name]["ocr"] += ocr_s
+            totals[name]["acc"] += difflib.SequenceMatcher(None, truth, text).ratio()
+
+    n = max(len(images), 1)
+    print(f"{len(images)} images from {args.folder}")
+    print(f"{'profile':<10}{'preprocess ms':>15}{'ocr ms':>10}{'accuracy':>10}")
+    for name, t in totals.items():
+        print(f"{name:<10}{1000 * t['pre'] / n:>15.1f}{1000 * t['ocr'] / n:>10.1f}{t['acc'] / n:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""OCR latency and accuracy of the resolution policy per target text height.
+
+Each sample image is also enlarged (``--upscale``) to stand in for phone
+photos and 600 dpi scans. For every target text height (``OCR_TARGET_TEXT_PX``,
+0 = policy off, the image OCR'd as is) it reports the pixels left after the
+policy, preprocessing and EasyOCR time, and the character similarity (difflib
+ratio) against ``<image>.txt`` or else the output with the policy off.
+``--no-ocr`` times only the resize + preprocessing (no EasyOCR weights needed).
+
+    python benchmarks/bench_resolution.py docs/ --upscale 1 2 4 --targets 0 16 24 32
+"""
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import preprocessing  # noqa: E402
+from ocr import READTEXT_OPTIONS, reader  # noqa: E402
+from preprocessing import estimate_text_height, fit_resolution, load_gray, preprocess_image  # noqa: E402
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp"}
+
+
+def run(img, target: float, profile: str, ocr: bool) -> tuple[str, int, float, float]:
+    with patch.object(preprocessing, "OCR_TARGET_TEXT_PX", target), \
+            patch.object(preprocessing, "OCR_MAX_PIXELS", 0):
+        pixels = fit_resolution(img).size
+        t0 = time.perf_counter()
+        pre = preprocess_image(img, profile)
+        t1 = time.perf_counter()
+    text = "\n".join(reader.readtext(pre, detail=0, paragraph=True, **READTEXT_OPTIONS)) if ocr else ""
+    return text, pixels, t1 - t0, time.perf_counter() - t1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", type=Path, nargs="?", default=Path("docs"))
+    parser.add_argument("--upscale", type=float, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--targets", type=float, nargs="+", default=[0, 16, 24, 32])
+    parser.add_argument("--profile", default=preprocessing.DEFAULT_PROFILE, choices=preprocessing.PROFILES)
+    parser.add_argument("--no-ocr", action="store_true")
+    args = parser.parse_args()
+
+    images = sorted(p for p in args.folder.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    targets = [0, *[t for t in args.targets if t]]   # la referencia va primero
+    print(f"{len(images)} images from {args.folder}, profile {args.profile}")
+    print(f"{'image':<28}{'x':>4}{'text px':>8}{'target':>7}{'MP':>7}{'preproc ms':>11}{'ocr ms':>8}{'accuracy':>9}")
+    for path in images:
+        truth_file = path.with_suffix(".txt")
+        for factor in args.upscale:
+            img = load_gray(path)
+            if factor != 1:
+                img = cv2.resize(img, None, fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
+            text_px = estimate_text_height(img)
+            reference = truth_file.read_text(encoding="utf-8") if truth_file.exists() else None
+            for target in targets:
+                text, pixels, pre_s, ocr_s = run(img, target, args.profile, not args.no_ocr)
+                reference = text if reference is None else reference
+                acc = "-" if args.no_ocr else f"{difflib.SequenceMatcher(None, reference, text).ratio():.3f}"
+                print(f"{path.name[:27]:<28}{factor:>4g}{text_px or 0:>8.1f}{target or 'off':>7}"
+                      f"{pixels / 1e6:>7.2f}{pre_s * 1000:>11.0f}{ocr_s * 1000:>8.0f}{acc:>9}")
+
+
+if __name__ == "__main__":
+    main()
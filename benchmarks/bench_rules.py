@@ -0,0 +1,81 @@
+"""Coverage of the deterministic extractors over labelled OCR text, per document type.
+
+Runs ``rules.extract_fields`` on the texts stored in ``metadata.pkl`` with the
+fields of each label in ``document_schema.json`` and reports, per type:
+
+  fields    share of schema fields a rule filled with confidence >= --min-confidence
+  skipped   share of documents whose LLM call is skipped (every field covered)
+  partial   share of documents sent to the LLM with only the missing fields
+  tok saved mean estimated tokens (prompt + completion) not sent to the LLM
+  ms/doc    rule extraction time per document
+
+It measures how often the rules answer, not whether the answer is right
+(the reference set has no ground-truth entities).
+
+    python benchmarks/bench_rules.py metadata.pkl --limit 300
+"""
+import argparse
+import json
+import pickle
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rules import OUTPUT_TOKENS_PER_FIELD, RULES_MIN_CONFIDENCE, extract_fields  # noqa: E402
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1   # como extractor.estimate_tokens, sin importar el cliente de Ollama
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("reference", type=Path, nargs="?", default=Path("metadata.pkl"))
+    parser.add_argument("--schema", type=Path, default=Path("document_schema.json"))
+    parser.add_argument("--limit", type=int, default=300, help="documents per type")
+    parser.add_argument("--min-confidence", type=float, default=RULES_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    schema = json.loads(args.schema.read_text())
+    with open(args.reference, "rb") as f:
+        records = pickle.load(f)
+    records = records.values() if isinstance(records, dict) else records
+
+    by_type = defaultdict(list)
+    for r in records:
+        if r.get("text") and r["label"] in schema and len(by_type[r["label"]]) < args.limit:
+            by_type[r["label"]].append(r["text"])
+
+    print(f"{'type':<23} {'docs':>5} {'fields':>7} {'skipped':>8} {'partial':>8} {'tok saved':>10} {'ms/doc':>7}")
+    totals = defaultdict(float)
+    for doc_type, texts in sorted(by_type.items()):
+        fields = schema[doc_type]
+        filled = skipped = partial = saved = 0
+        t0 = time.perf_counter()
+        for text in texts:
+            found = extract_fields(doc_type, fields, text)
+            covered = sum(v["confidence"] >= args.min_confidence for v in found.values())
+            filled += covered
+            if covered == len(fields):
+                skipped += 1
+                saved += estimate_tokens(text) + OUTPUT_TOKENS_PER_FIELD * covered
+            elif covered:
+                partial += 1
+                saved += OUTPUT_TOKENS_PER_FIELD * covered
+        ms = (time.perf_counter() - t0) * 1000 / len(texts)
+        n = len(texts)
+        print(f"{doc_type:<23} {n:>5} {filled / (n * len(fields)):>7.1%} {skipped / n:>8.1%} "
+              f"{partial / n:>8.1%} {saved / n:>10.1f} {ms:>7.2f}")
+        for key, value in (("docs", n), ("fields", filled), ("slots", n * len(fields)),
+                           ("skipped", skipped), ("partial", partial), ("saved", saved)):
+            totals[key] += value
+    n = totals["docs"]
+    print(f"{'all':<23} {int(n):>5} {totals['fields'] / totals['slots']:>7.1%} {totals['skipped'] / n:>8.1%} "
+          f"{totals['partial'] / n:>8.1%} {totals['saved'] / n:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
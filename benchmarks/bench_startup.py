@@ -0,0 +1,119 @@
+"""API startup time and per-worker memory: lazy vs eager models, preload+fork vs per-worker load.
+
+Every scenario runs in a fresh interpreter (cwd = repo root, same env as this
+script, so FAISS_INDEX_PATH / FAISS_META_PATH apply):
+
+  lazy      ``import main`` only; models are built on first use / warm-up
+  eager     ``import main`` + building every model (what importing used to do)
+  preload   parent builds the models, then forks ``--workers`` children that warm up
+  per-worker  parent imports only; each forked child builds and warms its own models
+
+For the fork scenarios each child reports its RSS, USS (private pages) and PSS
+(shared pages split among the processes that map them) from /proc/self/smaps_rollup.
+
+    python benchmarks/bench_startup.py --workers 4
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+CHILD = r"""
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+
+def memory_mb():
+    out = {{}}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                out[key] = int(rest.split()[0]) / 1024
+    return {{"rss_mb": out["Rss"], "pss_mb": out["Pss"],
+             "uss_mb": out["Private_Clean"] + out["Private_Dirty"]}}
+
+t0 = time.perf_counter()
+import main
+from models import models
+result = {{"import_s": time.perf_counter() - t0, "torch_imported": "torch" in sys.modules}}
+scenario, workers = {scenario!r}, {workers}
+
+if scenario == "eager":
+    t0 = time.perf_counter()
+    models.load_all()
+    result["load_s"] = time.perf_counter() - t0
+if scenario in ("lazy", "eager"):
+    result.update(memory_mb())
+    print(json.dumps(result))
+    sys.exit(0)
+
+if scenario == "preload":
+    t0 = time.perf_counter()
+    models.load_all()
+    result["load_s"] = time.perf_counter() - t0
+
+children = []
+for _ in range(workers):
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        t0 = time.perf_counter()
+        models.warm_up()
+        child = {{"ready_s": time.perf_counter() - t0}}
+        time.sleep(1)   # todos los hijos vivos a la vez => PSS reparte lo compartido
+        child.update(memory_mb())
+        os.write(w, json.dumps(child).encode())
+        os._exit(0)
+    os.close(w)
+    children.append((pid, r))
+
+reports = []
+for pid, r in children:
+    with os.fdopen(r) as f:
+        reports.append(json.loads(f.read()))
+    os.waitpid(pid, 0)
+for key in ("ready_s", "rss_mb", "uss_mb", "pss_mb"):
+    result[key] = sum(rep[key] for rep in reports) / len(reports)
+result["total_pss_mb"] = sum(rep["pss_mb"] for rep in reports) + memory_mb()["pss_mb"]
+print(json.dumps(result))
+"""
+
+
+def run(scenario: str, workers: int) -> dict:
+    code = CHILD.format(root=str(ROOT), scenario=scenario, workers=workers)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--scenarios", nargs="+", default=["lazy", "eager", "preload", "per-worker"],
+                        choices=["lazy", "eager", "preload", "per-worker"])
+    args = parser.parse_args()
+
+    print(f"{'scenario':<11} {'import s':>9} {'load s':>7} {'ready s':>8} {'RSS MB':>8} "
+          f"{'USS MB':>8} {'PSS MB':>8} {'total PSS':>10}  torch@import")
+    for scenario in args.scenarios:
+        r = run(scenario, args.workers)
+        if "error" in r:
+            print(f"{scenario:<11} failed: {r['error']}")
+            continue
+
+        def col(key, width, fmt=".2f"):
+            return f"{r[key]:>{width}{fmt}}" if key in r else f"{'-':>{width}}"
+
+        print(f"{scenario:<11} {col('import_s', 9)} {col('load_s', 7)} {col('ready_s', 8)} "
+              f"{col('rss_mb', 8, '.0f')} {col('uss_mb', 8, '.0f')} {col('pss_mb', 8, '.0f')} "
+              f"{col('total_pss_mb', 10, '.0f')}  {r['torch_imported']}")
+
+
+if __name__ == "__main__":
+    main()
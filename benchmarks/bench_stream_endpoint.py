@@ -0,0 +1,83 @@
+"""Time to first result and total time of a multi-file upload: /extract_entities/ vs. /extract_entities/stream.
+
+OCR, classification and the LLM are simulated with a fixed latency per file
+(``--file-ms``, jittered ±50%), so the numbers isolate how results reach the
+client. The app is served by uvicorn in a thread of this process (httpx's ASGI
+transport would buffer the streamed body).
+
+    python benchmarks/bench_stream_endpoint.py --files 50 --file-ms 200
+"""
+import argparse
+import asyncio
+import random
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main as api  # noqa: E402
+
+
+def serve() -> tuple[uvicorn.Server, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(api.app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def measure(base_url: str, path: str, files: list, lines: bool) -> tuple[float, float]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        t0 = time.perf_counter()
+        first = None
+        async with client.stream("POST", path, files=files) as response:
+            if lines:
+                async for _ in response.aiter_lines():
+                    first = first or time.perf_counter() - t0
+            else:
+                await response.aread()
+                first = time.perf_counter() - t0
+        return first, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--file-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    delays = {f"doc{i}.png": args.file_ms / 1000 * rng.uniform(0.5, 1.5) for i in range(args.files)}
+
+    def ocr(source, profile=None):
+        # en memoria (bytes) o volcado a disco (Path)
+        data = source if isinstance(source, bytes) else Path(source).read_bytes()
+        time.sleep(delays[data.decode()])
+        return "texto"
+
+    files = [("files", (name, name.encode(), "image/png")) for name in delays]
+    print(f"{args.files} files, ~{args.file_ms:.0f} ms each, MAX_FILES_IN_FLIGHT={api.MAX_FILES_IN_FLIGHT}")
+    with patch.object(api, "ocr_image", ocr), \
+            patch.object(api, "classify_document", return_value=("invoice", 0.9, [])), \
+            patch.object(api, "extract_entities_with_ollama", return_value=({}, "{}")), \
+            patch.object(api.result_cache, "get", return_value=None):
+        server, base_url = serve()
+        for label, path, lines in (("batch", "/extract_entities/", False),
+                                   ("stream", "/extract_entities/stream", True)):
+            first, total = asyncio.run(measure(base_url, path, files, lines))
+            print(f"{label:<7} first result {first:6.2f} s   all results {total:6.2f} s")
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Wall-clock time of one multi-page PDF, stage after stage vs. the streaming pipeline.
+
+The stages are simulated with fixed latencies (OCR per page, classification,
+one LLM call per prompt), so the numbers isolate the scheduling: sequential
+time is the sum of the stages, streaming should approach the slowest one.
+
+    python benchmarks/bench_streaming.py --pages 30 --ocr-ms 400 --classify-ms 50 --llm-ms 3000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extractor  # noqa: E402
+import main as api  # noqa: E402
+from ollama_client import ChatResult  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--ocr-ms", type=float, default=400)
+    parser.add_argument("--classify-ms", type=float, default=50)
+    parser.add_argument("--llm-ms", type=float, default=3000, help="per prompt (one per chunk)")
+    parser.add_argument("--llm-parallel", type=int, default=1,
+                        help="prompts the simulated server runs at once (Ollama on CPU: 1)")
+    parser.add_argument("--page-chars", type=int, default=3000)
+    args = parser.parse_args()
+
+    line = "total amount due " + "x" * 60
+
+    def pages(path, profile=None):
+        for i in range(1, args.pages + 1):
+            time.sleep(args.ocr_ms / 1000)
+            yield {"page": i, "source": "ocr",
+                   "text": "\n".join([line] * (args.page_chars // len(line)))}
+
+    def classify(text, snapshot=None):
+        time.sleep(args.classify_ms / 1000)
+        return ("invoice", 0.9, [])
+
+    server = {}
+
+    async def chat(payload):
+        # un semáforo por event loop (cada variante corre en su propio asyncio.run)
+        loop = asyncio.get_running_loop()
+        async with server.setdefault(loop, asyncio.Semaphore(args.llm_parallel)):
+            await asyncio.sleep(args.llm_ms / 1000)
+        return ChatResult('{"total_amount": {"value": "10", "confidence": 0.9}}', None, 0.1, 1)
+
+    print(f"{args.pages} pages: OCR {args.pages * args.ocr_ms / 1000:.1f} s, "
+          f"classify {args.classify_ms / 1000:.2f} s, LLM {args.llm_ms / 1000:.1f} s per prompt "
+          f"(up to {extractor.OLLAMA_MAX_CHUNKS} prompts, {args.llm_parallel} at a time)")
+    for streaming in (False, True):
+        with patch.object(api, "iter_pdf_pages", pages), \
+                patch.object(api, "ocr_pdf_pages", lambda path, profile=None: list(pages(path))), \
+                patch.object(api, "classify_document", classify), \
+                patch.object(api, "PIPELINE_STREAMING", streaming), \
+                patch.object(api.result_cache, "get", return_value=None), \
+                patch.object(extractor.ollama_client, "chat", chat):
+            t0 = time.perf_counter()
+            result = asyncio.run(api.process_file(f"bench-{streaming}.pdf", content_hash=str(streaming),
+                                                   debug=True))
+            wall = time.perf_counter() - t0
+        print(f"{'streaming' if streaming else 'sequential':<11} {wall:6.2f} s   stages: "
+              + ", ".join(f"{k}={v:.2f}" for k, v in result["timings"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,445 @@
-from pathlib import Path
-import numpy as np
-from PIL import Image
-import easyocr
-from sentence_transformers import SentenceTransformer
-import faiss
+"""Incremental builder of the classifier reference index.
+
+Every sample under ``docs-sm/<label>/`` is OCR'd once: its text and embedding
+are stored in a SQLite state database keyed by the sha256 of the file, so a
+re-run only processes new or changed files and a crash loses at most one
+embedding batch. The FAISS index, the metadata (``metadata.pkl`` and
+``metadata_store/``) and the label centroids are then published from that
+state: new rows are appended to the existing index, removals re-add the
+remaining vectors (no OCR, no re-encoding, IVF training is kept).
+
+    python build_index.py                      # add new files of docs-sm
+    python build_index.py add --workers 8 --prune
+    python build_index.py remove docs-sm/memo/old_scan.png
+    python build_index.py remove --label memo
+    python build_index.py rebuild --index-type hnsw
+    python build_index.py stats
+"""
+import argparse
 import os
-import cv2
 import pickle
-from typing import Union
-import torch
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+import multiprocessing
+
+import faiss
+import numpy as np
+
+from ann_index import (ANN_INDEX_TYPE, CENTROIDS_PATH, build_index, choose_index_type,
+                       configure_search, index_type, save_centroids)
+from cache import file_hash
+from embeddings import BACKENDS, EMBEDDING_BACKEND, encoder_id, load_model, make_encoder
+from metadata_store import write_store
 
 BASE_DIR = Path("docs-sm")
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp"}
 OUTPUT_INDEX = "vector_index.faiss"
 OUTPUT_METADATA = "metadata.pkl"
+OUTPUT_METADATA_STORE = "metadata_store"
+BUILD_STATE_DB = os.getenv("INDEX_BUILD_DB", "index_build.sqlite3")
+
+_reader = None
+
+
+class BuildState:
+    """Per-file OCR text and embedding of the reference set, on SQLite.
+
+    ``indexed`` marks the rows contained in the published index. Removed
+    rows are tombstoned (``removed = 1``) until the next publish drops them
+    from the index. Row ids only grow, so index order is id order.
+    """
+
+    def __init__(self, db_path: str | Path = BUILD_STATE_DB):
+        self.db_path = str(db_path)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    content_hash TEXT NOT NULL UNIQUE,
+                    path TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    text TEXT,
+                    embedding BLOB,
+                    removed INTEGER NOT NULL DEFAULT 0,
+                    indexed INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_path ON entries (path);
+                CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def lookup(self) -> tuple[dict[str, dict], dict[str, str]]:
+        """``({hash: {id, path, removed}}, {live path: hash})``."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, content_hash, path, removed FROM entries").fetchall()
+        by_hash = {r["content_hash"]: dict(r) for r in rows}
+        by_path = {r["path"]: r["content_hash"] for r in rows if not r["removed"]}
+        return by_hash, by_path
+
+    def add(self, rows: list[dict]) -> None:
+        """Insert ``{"hash", "path", "label", "text", "embedding"}`` rows in one transaction."""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO entries (content_hash, path, label, text, embedding, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(r["hash"], r["path"], r["label"], r["text"],
+                  None if r["embedding"] is None else np.asarray(r["embedding"], dtype="float32").tobytes(),
+                  now) for r in rows],
+            )
+
+    def revive(self, content_hash: str, path: str, label: str) -> None:
+        """Bring back a removed file as a new (appended) row, reusing its text and embedding."""
+        with closing(self._connect()) as conn, conn:
+            old = conn.execute("SELECT * FROM entries WHERE content_hash = ?", (content_hash,)).fetchone()
+            conn.execute("DELETE FROM entries WHERE id = ?", (old["id"],))
+            conn.execute(
+                "INSERT INTO entries (content_hash, path, label, text, embedding, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, path, label, old["text"], old["embedding"], time.time()),
+            )
+
+    def relocate(self, content_hash: str, path: str, label: str) -> None:
+        """A known file found under another path or label: same row and vector, new path/label."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE entries SET path = ?, label = ?, removed = 0, updated_at = ? WHERE content_hash = ?",
+                (path, label, time.time(), content_hash),
+            )
+
+    def remove(self, paths: list[str] = (), labels: list[str] = (), hashes: list[str] = ()) -> int:
+        """Tombstone the rows of ``paths`` (files or directories), ``labels`` or ``hashes``."""
+        clauses, params = [], []
+        for p in paths:
+            clauses.append("(path = ? OR path LIKE ?)")
+            params += [str(p), str(Path(p)) + os.sep + "%"]
+        for label in labels:
+            clauses.append("label = ?")
+            params.append(label)
+        for h in hashes:
+            clauses.append("content_hash = ?")
+            params.append(h)
+        if not clauses:
+            return 0
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                f"UPDATE entries SET removed = 1, updated_at = ? WHERE removed = 0 AND ({' OR '.join(clauses)})",
+                [time.time(), *params],
+            )
+            return cur.rowcount
+
+    def counts(self) -> dict:
+        with closing(self._connect()) as conn:
+            row = conn.execute("""
+                SELECT COUNT(*) AS total,
+                       SUM(removed = 0 AND embedding IS NOT NULL) AS live,
+                       SUM(embedding IS NULL) AS empty,
+                       SUM(removed) AS removed,
+                       SUM(indexed) AS indexed,
+                       SUM(indexed = 1 AND removed = 1) AS pending_removal,
+                       SUM(indexed = 0 AND removed = 0 AND embedding IS NOT NULL) AS pending_add
+                FROM entries
+            """).fetchone()
+        return {k: row[k] or 0 for k in row.keys()}
+
+    def live(self, only_new: bool = False, chunk: int = 10_000):
+        """Yield chunks of live rows in index (id) order."""
+        columns = "id, path, label, text, embedding"
+        where = "removed = 0 AND embedding IS NOT NULL" + (" AND indexed = 0" if only_new else "")
+        with closing(self._connect()) as conn:
+            cur = conn.execute(f"SELECT {columns} FROM entries WHERE {where} ORDER BY id")
+            while rows := cur.fetchmany(chunk):
+                yield rows
+
+    def get_setting(self, key: str) -> str | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_setting(self, key: str, value: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def with_text(self, chunk: int = 10_000):
+        """Yield chunks of ``(id, text)`` of every row with text, tombstones included."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute("SELECT id, text FROM entries WHERE text IS NOT NULL ORDER BY id")
+            while rows := cur.fetchmany(chunk):
+                yield rows
+
+    def set_embeddings(self, ids: list[int], vectors: np.ndarray) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE entries SET embedding = ?, updated_at = ? WHERE id = ?",
+                [(np.asarray(v, dtype="float32").tobytes(), time.time(), i) for i, v in zip(ids, vectors)],
+            )
+
+    def mark_published(self) -> None:
+        with closing(self._connect()) as conn, conn:
+            # las lápidas se quedan: un archivo que vuelve reutiliza su texto y embedding
+            conn.execute("UPDATE entries SET indexed = (removed = 0 AND embedding IS NOT NULL)")
 
-#models
-reader = easyocr.Reader(['en', 'es'], gpu=True)
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
 
-embeddings_list = []
-metadata_list = []
+def _vectors(rows) -> np.ndarray:
+    return np.stack([np.frombuffer(r["embedding"], dtype="float32") for r in rows])
 
-processed_one = False    
 
+def scan(base_dir: Path) -> list[tuple[Path, str]]:
+    """``(file, label)`` for every sample under ``base_dir/<label>/``."""
+    return [
+        (file, label_dir.name)
+        for label_dir in sorted(p for p in base_dir.iterdir() if p.is_dir())
+        for file in sorted(label_dir.glob("*"))
+        if file.suffix.lower() in ALLOWED_EXTENSIONS
+    ]
 
-def preprocess_image(path: Union[str, Path]) -> np.ndarray:
-    # --- 1. Leer y a gris ---
-    img_gray = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
 
-    # --- 2. Suavizado / eliminación de ruido ---
-    denoised = cv2.fastNlMeansDenoising(img_gray, h=15, templateWindowSize=7,
-                                        searchWindowSize=21)
+def _init_ocr_worker(gpu: bool):
+    global _reader
+    import cv2
+    import easyocr
+    import torch
 
-    # --- 3. Binarización adaptativa ---
-    bin_img = cv2.adaptiveThreshold(
-        denoised, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
-        blockSize=31,   # cuanto más grande, más contexto usa
-        C=10            # constante que ajusta el umbral
-    )
+    if not gpu:
+        # un hilo por proceso: el paralelismo lo dan los procesos
+        cv2.setNumThreads(1)
+        torch.set_num_threads(1)
+    _reader = easyocr.Reader(['en', 'es'], gpu=gpu)
 
-    # --- 4. Deskew ---
-    coords = np.column_stack(np.where(bin_img == 0))
-    angle = cv2.minAreaRect(coords)[-1]
-    # cv2 devuelve ángulos en (-90, 0]; convertimos a [-45, 45]
-    if angle < -45:
-        angle = -(90 + angle)
+
+def ocr_file(path: str) -> tuple[str, str | None, str | None]:
+    """``(path, text, error)`` for one sample; runs inside the OCR workers."""
+    from ocr import READTEXT_OPTIONS
+    from preprocessing import preprocess_image
+
+    try:
+        img = preprocess_image(Path(path))
+        # mismos ajustes de EasyOCR que la API: el texto indexado se parece al de las consultas
+        return path, "\n".join(_reader.readtext(img, detail=0, paragraph=True, **READTEXT_OPTIONS)), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def ocr_files(paths: list[str], workers: int, gpu: bool):
+    """Yield ``ocr_file`` results in input order, OCR'ing in ``workers`` processes."""
+    if workers <= 1:
+        if _reader is None:
+            _init_ocr_worker(gpu)
+        yield from map(ocr_file, paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_ocr_worker, initargs=(gpu,)) as pool:
+        yield from pool.map(ocr_file, paths, chunksize=2)
+
+
+def add_files(state: BuildState, base_dir: Path, encode, ocr=ocr_files, workers: int = 1,
+              gpu: bool = False, batch_size: int = 64, prune: bool = False) -> dict:
+    """OCR + embed the files of ``base_dir`` that the state does not know yet.
+
+    ``encode(texts) -> float32[len(texts), dim]`` (normalized). Rows are
+    committed every ``batch_size`` files: that is the checkpoint a re-run
+    resumes from.
+    """
+    by_hash, by_path = state.lookup()
+    files = [(str(file), label, file_hash(file)) for file, label in scan(base_dir)]
+    on_disk = {path: digest for path, _, digest in files}
+    todo, seen, queued = [], set(), set()
+    stats = {"new": 0, "revived": 0, "changed": 0, "moved": 0, "pruned": 0, "empty": 0, "errors": 0,
+             "unchanged": 0, "duplicates": 0}
+    for path, label, digest in files:
+        seen.add(path)
+        if by_path.get(path) not in (None, digest):
+            stats["changed"] += state.remove(hashes=[by_path[path]])
+            by_hash[by_path.pop(path)]["removed"] = 1
+        known = by_hash.get(digest)
+        if digest in queued:
+            stats["duplicates"] += 1
+        elif known is None:
+            todo.append((path, label, digest))
+            queued.add(digest)
+        elif known["removed"]:
+            state.revive(digest, path, label)
+            known.update(path=path, removed=0)
+            stats["revived"] += 1
+        elif known["path"] == path:
+            stats["unchanged"] += 1
+        elif on_disk.get(known["path"]) == digest:
+            # copia del mismo archivo: el índice ya tiene su vector
+            stats["duplicates"] += 1
+        else:
+            # movido (p. ej. a otra carpeta de etiqueta): se actualiza la fila, sin OCR ni --prune
+            state.relocate(digest, path, label)
+            by_path.pop(known["path"], None)
+            by_path[path] = digest
+            known.update(path=path)
+            stats["moved"] += 1
+    if prune:
+        stats["pruned"] = state.remove(paths=[p for p in by_path if p not in seen])
+
+    labels = {path: (label, digest) for path, label, digest in todo}
+    batch = []
+
+    def flush():
+        with_text = [r for r in batch if r["text"]]
+        if with_text:
+            vectors = encode([r["text"] for r in with_text])
+            for row, vector in zip(with_text, vectors):
+                row["embedding"] = vector
+        state.add(batch)
+        batch.clear()
+
+    for i, (path, text, error) in enumerate(ocr([p for p, _, _ in todo], workers, gpu), 1):
+        label, digest = labels[path]
+        if error is not None:
+            print(f"Error procesando {path}: {error}")
+            stats["errors"] += 1
+            continue
+        text = (text or "").strip()
+        stats["new" if text else "empty"] += 1
+        batch.append({"hash": digest, "path": path, "label": label, "text": text or None, "embedding": None})
+        if len(batch) >= batch_size:
+            flush()
+            print(f"{i}/{len(todo)} archivos procesados")
+    if batch:
+        flush()
+    return stats
+
+
+def reencode(state: BuildState, encode, batch_size: int = 64) -> int:
+    """Re-embed the stored texts (no OCR) after a change of embedding model/backend."""
+    done = 0
+    for rows in state.with_text(chunk=batch_size):
+        state.set_embeddings([r["id"] for r in rows], encode([r["text"] for r in rows]))
+        done += len(rows)
+    return done
+
+
+def publish(state: BuildState, index_path: str | Path = OUTPUT_INDEX, kind: str = ANN_INDEX_TYPE,
+            metadata_path: str | Path | None = OUTPUT_METADATA,
+            store_dir: str | Path = OUTPUT_METADATA_STORE,
+            centroids_path: str | Path = CENTROIDS_PATH, rebuild: bool = False) -> dict:
+    """Bring the index, metadata and centroids in line with the state.
+
+    New rows are appended to the published index; when rows were removed
+    (or the published index does not match the state) the live vectors are
+    re-added, keeping the IVF training. ``rebuild`` or a change of index
+    type trains a fresh index.
+    """
+    counts = state.counts()
+    if counts["live"] == 0:
+        raise ValueError("No indexable documents in the build state")
+    kind = choose_index_type(counts["live"]) if kind == "auto" else kind
+
+    index = faiss.read_index(str(index_path)) if Path(index_path).exists() else None
+    if index is not None and index_type(index) != kind:
+        rebuild = True
+    in_sync = index is not None and index.ntotal == counts["indexed"]
+    if not rebuild and in_sync and counts["pending_removal"] == 0:
+        mode = "append"
+        for rows in state.live(only_new=True):
+            index.add(_vectors(rows))
+    elif not rebuild and index is not None and index_type(index) in ("ivf", "ivfpq"):
+        mode = "readd"
+        index.reset()
+        for rows in state.live():
+            index.add(_vectors(rows))
     else:
-        angle = -angle
-
-    h, w = bin_img.shape
-    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-    deskewed = cv2.warpAffine(bin_img, M, (w, h),
-                              flags=cv2.INTER_CUBIC,
-                              borderMode=cv2.BORDER_REPLICATE)
-    return deskewed
-
-
-#process all files
-for label_dir in BASE_DIR.iterdir():
-    if label_dir.is_dir():
-        label = label_dir.name
-        for file in label_dir.glob("*"):
-            if file.suffix.lower() in ALLOWED_EXTENSIONS:
-                try:
-                    print(f"OCR → {file}")
-                    img = preprocess_image(file) 
-                    #img = np.array(Image.open(file))
-                    text = "\n".join(reader.readtext(img, detail=0, paragraph=True))
-                    if not text.strip():
-                        continue
-                    emb = embedding_model.encode([text], normalize_embeddings=True)
-                    embeddings_list.append(emb[0])
-                    metadata_list.append({
-                        "path": str(file),
-                        "label": label,
-                        "text": text
-                    })
-                except Exception as e:
-                    print(f"Error procesando {file}: {e}") 
-
-#save vector on FAIIS
-if embeddings_list:
-    embeddings_np = np.array(embeddings_list, dtype="float32")
-    dim = embeddings_np.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings_np)
-
-    faiss.write_index(index, OUTPUT_INDEX)
-    with open(OUTPUT_METADATA, "wb") as f:
-        pickle.dump(metadata_list, f)
-
-    print("FAISS y metadata guardados.")
-else:
-    print("No se encontraron documentos válidos.")
+        mode = "build"
+        index = build_index(np.concatenate([_vectors(rows) for rows in state.live()]), kind)
+    configure_search(index)
+
+    # metadata and centroids, in index order
+    records, sums, label_counts = [], {}, {}
+    for rows in state.live():
+        vectors = _vectors(rows)
+        for row, vector in zip(rows, vectors):
+            records.append({"path": row["path"], "label": row["label"], "text": row["text"]})
+            sums[row["label"]] = sums.get(row["label"], 0) + vector
+            label_counts[row["label"]] = label_counts.get(row["label"], 0) + 1
+    labels = sorted(sums)
+    centroids = np.stack([sums[label] for label in labels]).astype("float32")
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+    _atomic_write(index_path, lambda tmp: faiss.write_index(index, tmp))
+    _atomic_write(centroids_path, lambda tmp: save_centroids(tmp, labels, centroids))
+    if metadata_path:
+        _atomic_write(metadata_path, lambda tmp: _dump_pickle(records, tmp))
+    write_store(store_dir, records)
+    state.mark_published()
+    return {"mode": mode, "type": index_type(index), "vectors": index.ntotal, "labels": label_counts}
+
+
+def _atomic_write(path, write) -> None:
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _dump_pickle(records: list[dict], path: str) -> None:
+    with open(path, "wb") as f:
+        pickle.dump(records, f)
+
+
+def load_encoder(batch_size: int, backend: str = EMBEDDING_BACKEND):
+    return make_encoder(load_model(backend), batch_size)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Build or update the classifier FAISS index.")
+    parser.add_argument("command", nargs="?", default="add", choices=["add", "remove", "rebuild", "stats"])
+    parser.add_argument("paths", nargs="*", help="remove: files or directories to drop from the index")
+    parser.add_argument("--docs", type=Path, default=BASE_DIR, help="samples, one sub-directory per label")
+    parser.add_argument("--label", action="append", default=[], help="remove: every sample of this label")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="OCR processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="texts per embedding batch / checkpoint")
+    parser.add_argument("--gpu", action="store_true", help="run EasyOCR on the GPU (use --workers 1)")
+    parser.add_argument("--prune", action="store_true", help="add: remove entries whose file is gone")
+    parser.add_argument("--index-type", default=ANN_INDEX_TYPE, help="flat, hnsw, ivf, ivfpq or auto")
+    parser.add_argument("--state", default=BUILD_STATE_DB, help="build state database")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=BACKENDS, help="embedding backend")
+    parser.add_argument("--reencode", action="store_true",
+                        help="rebuild: re-embed the stored texts with --backend (no OCR)")
+    parser.add_argument("--no-pickle", action="store_true", help="only write metadata_store/, not metadata.pkl")
+    args = parser.parse_args(argv)
+
+    state = BuildState(args.state)
+    if args.command == "stats":
+        print(state.counts())
+        return
+    if args.reencode and args.command != "rebuild":
+        parser.error("--reencode only applies to rebuild")
+    encoder = encoder_id(args.backend)
+    recorded = state.get_setting("encoder")
+    # todos los vectores del índice tienen que salir del mismo encoder
+    if args.command == "add" and recorded not in (None, encoder):
+        parser.error(f"the state was embedded with {recorded}; use `rebuild --reencode --backend ...`")
+    if args.reencode:
+        print(f"{reencode(state, load_encoder(args.batch_size, args.backend), args.batch_size)} textos re-embebidos")
+        state.set_setting("encoder", encoder)
+    if args.command == "add":
+        state.set_setting("encoder", encoder)
+        stats = add_files(state, args.docs, load_encoder(args.batch_size, args.backend),
+                          workers=args.workers, gpu=args.gpu, batch_size=args.batch_size, prune=args.prune)
+        print(stats)
+    elif args.command == "remove":
+        print(f"{state.remove(paths=args.paths, labels=args.label)} entradas eliminadas")
 
+    if state.counts()["live"] == 0:
+        print("No se encontraron documentos válidos.")
+        return
+    result = publish(state, kind=args.index_type, rebuild=args.command == "rebuild",
+                     metadata_path=None if args.no_pickle else OUTPUT_METADATA)
+    print(f"FAISS y metadata guardados: {result}")
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+# Config
+CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")   # memory | sqlite | redis | none
+CACHE_MAX_ITEMS = int(os.getenv("RESULT_CACHE_MAX_ITEMS", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024
+CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.sqlite3")
+CACHE_URL = os.getenv("RESULT_CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "0"))   # seconds, only used by redis; 0 = no TTL
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str | Path, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU bounded by entry count and total value size."""
+
+    def __init__(self, max_items: int = CACHE_MAX_ITEMS, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._data[key] = value
+            self._size += len(value)
+            while len(self._data) > self.max_items or self._size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+class SQLiteBackend:
+    """On-disk LRU shared by every worker of the host."""
+
+    def __init__(self, path: str | Path = CACHE_PATH, max_items: int = CACHE_MAX_ITEMS,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.path = str(path)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # una conexión por proceso: con preload_app el módulo se importa en el master y los
+        # workers forkeados no pueden compartir su conexión (ni un lock quizá tomado al forkear)
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> bytes | None:
+        conn = self._connection()
+        with self._lock, conn:
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        conn = self._connection()
+        with self._lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            while count > self.max_items or size > self.max_bytes:
+                key_, size_ = conn.execute(
+                    "SELECT key, size FROM entries ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                conn.execute("DELETE FROM entries WHERE key = ?", (key_,))
+                count, size = count - 1, size - size_
+
+    def clear(self) -> None:
+        conn = self._connection()
+        with self._lock, conn:
+            conn.execute("DELETE FROM entries")
+
+
+class RedisBackend:
+    """Any Redis-compatible store; eviction is left to the server's maxmemory policy."""
+
+    def __init__(self, url: str = CACHE_URL, ttl: int = CACHE_TTL, namespace: str = "idu-cache:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESULT_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl or None
+        self.namespace = namespace
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(self.namespace + key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self._client.set(self.namespace + key, value, ex=self.ttl)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(self.namespace + "*"):
+            self._client.delete(key)
+
+
+class ResultCache:
+    """JSON values per pipeline stage, keyed by the document hash plus stage parameters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key(stage: str, *parts) -> str:
+        return ":".join([stage, *(str(p) for p in parts)])
+
+    def get(self, stage: str, *parts) -> Any | None:
+        if self.backend is None:
+            return None
+        raw = self.backend.get(self.key(stage, *parts))
+        return None if raw is None else json.loads(raw)
+
+    def set(self, stage: str, value: Any, *parts) -> None:
+        if self.backend is not None:
+            self.backend.set(self.key(stage, *parts), json.dumps(value).encode("utf-8"))
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    @property
+    def blocking(self) -> bool:
+        # SQLite (hasta 30 s esperando un lock) y Redis hacen E/S: fuera del event loop
+        return self.backend is not None and not isinstance(self.backend, MemoryBackend)
+
+    async def aget(self, stage: str, *parts) -> Any | None:
+        if self.blocking:
+            return await asyncio.to_thread(self.get, stage, *parts)
+        return self.get(stage, *parts)
+
+    async def aset(self, stage: str, value: Any, *parts) -> None:
+        if self.blocking:
+            await asyncio.to_thread(self.set, stage, value, *parts)
+        else:
+            self.set(stage, value, *parts)
+
+
+def make_cache(backend: str = CACHE_BACKEND) -> ResultCache:
+    if backend == "memory":
+        return ResultCache(MemoryBackend())
+    if backend == "sqlite":
+        return ResultCache(SQLiteBackend())
+    if backend == "redis":
+        return ResultCache(RedisBackend())
+    if backend == "none":
+        return ResultCache(None)
+    raise ValueError(f"Unknown RESULT_CACHE_BACKEND: {backend}")
+
+
+result_cache = make_cache()
@@ -1,38 +1,138 @@
-import faiss
-import pickle
+import os
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from batching import MicroBatcher
+from embeddings import encoder_id, load_model
+from models import models
+from registry import INDEX_PATH, META_PATH, META_STORE_DIR, Snapshot, registry
+from metrics import QUEUE_DEPTH, observe_batch, stage_timer
 
-#paths
-INDEX_PATH = "vector_index.faiss"
-META_PATH = "metadata.pkl"
+# micro-batching: concurrent classify_document calls share one encode + search
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "16"))
+CLASSIFY_BATCH_WAIT_MS = float(os.getenv("CLASSIFY_BATCH_WAIT_MS", "5"))
+# neighbours voting for the label, weighted by similarity (1 = nearest neighbour decides)
+CLASSIFY_TOP_K = int(os.getenv("CLASSIFY_TOP_K", "5"))
+# knn: neighbour vote · centroid: nearest label centroid, O(labels) · hybrid: centroid, knn when unsure
+CLASSIFY_MODE = os.getenv("CLASSIFY_MODE", "knn")
+CLASSIFY_CENTROID_MARGIN = float(os.getenv("CLASSIFY_CENTROID_MARGIN", "0.05"))
+# part of the classification cache key: another encoder or voting rule, another label
+CLASSIFY_SETTINGS = f"{encoder_id()}/{CLASSIFY_MODE}/k{CLASSIFY_TOP_K}/m{CLASSIFY_CENTROID_MARGIN:g}"
 
-#Load faiss data
-index = faiss.read_index(INDEX_PATH)
-with open(META_PATH, "rb") as f:
-    metadata = pickle.load(f) 
+#Load faiss data: aliases of the active registry snapshot, rebound on every reload
+index = metadata = centroids = None
 
-#Loading the model embendig
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2") 
 
-def classify_document(text: str, top_k: int = 1):
-    # text conversion to embending
-    embedding = embedding_model.encode([text], normalize_embeddings=True).astype("float32")
+def _use_snapshot(snapshot: Snapshot):
+    global index, metadata, centroids
+    index, metadata, centroids = snapshot.index, snapshot.metadata, snapshot.centroids
 
-    # compare the vector
-    scores, indices = index.search(embedding, top_k)
 
-    # save the data
-    hits = []
-    for idx, score in zip(indices[0], scores[0]):
-        hits.append({
-            "label": metadata[idx]["label"],
-            "path": metadata[idx]["path"],
-            "score": float(score)
-        })
+registry.subscribers.append(_use_snapshot)
+# un índice a medio escribir o desalineado no tumba el import: /readyz da 503 y el watcher reintenta
+if (_snapshot := registry.try_load()) is not None:
+    _use_snapshot(_snapshot)
 
-    # Send the data
-    predicted_label = hits[0]["label"]
-    confidence = hits[0]["score"]
 
-    return predicted_label, confidence, hits
+def _warm_up_embedding(model):
+    # el índice tiene que venir del mismo modelo (el backend puede cambiar: mismos pesos)
+    dim = model.encode(["warm up"], normalize_embeddings=True).shape[1]
+    if registry.loaded and dim != registry.current.index.d:
+        raise ValueError(f"{encoder_id()} gives {dim}-d embeddings but the index has {registry.current.index.d}")
+
+
+#Loading the model embendig: lazily, on first encode or at warm-up (EMBEDDING_BACKEND)
+embedding_model = models.register("embedding_model", load_model, warmup=_warm_up_embedding)
+
+
+def vote(hits: list[dict]) -> tuple[str, float]:
+    """Similarity-weighted vote; the confidence is the best score of the winning label."""
+    weights = {}
+    for hit in hits:
+        weights[hit["label"]] = weights.get(hit["label"], 0.0) + max(hit["score"], 0.0)
+    label = max(weights, key=weights.get)   # en empate gana el vecino mejor situado
+    return label, max(hit["score"] for hit in hits if hit["label"] == label)
+
+
+def _classify_by_centroid(embeddings: np.ndarray, top_k: int, require_margin: bool,
+                          label_centroids: tuple) -> list:
+    labels, matrix = label_centroids
+    with stage_timer("centroid_search"):
+        similarities = embeddings @ matrix.T
+    results = []
+    for row in similarities:
+        order = np.argsort(-row)
+        margin = row[order[0]] - row[order[1]] if len(order) > 1 else np.inf
+        if require_margin and margin < CLASSIFY_CENTROID_MARGIN:
+            results.append(None)
+            continue
+        hits = [{"label": labels[j], "path": None, "score": float(row[j])} for j in order[:top_k]]
+        results.append((labels[order[0]], float(row[order[0]]), hits))
+    return results
+
+
+def classify_documents(texts: list[str], top_k: int = 1, snapshot: Snapshot | None = None) -> list[tuple]:
+    """``snapshot`` pins the index version (default: the active one)."""
+    if snapshot is not None:
+        index_, metadata_, centroids_ = snapshot.index, snapshot.metadata, snapshot.centroids
+    else:
+        index_, metadata_, centroids_ = index, metadata, centroids
+
+    # text conversion to embending, one batch for all the texts
+    with stage_timer("embedding"):
+        embeddings = embedding_model.encode(texts, normalize_embeddings=True).astype("float32")
+
+    results = [None] * len(texts)
+    if centroids_ is not None and CLASSIFY_MODE in ("centroid", "hybrid"):
+        results = _classify_by_centroid(embeddings, top_k, CLASSIFY_MODE == "hybrid", centroids_)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    # compare the vectors, one search over the whole matrix
+    with stage_timer("faiss_search"):
+        scores, indices = index_.search(embeddings[pending], max(top_k, CLASSIFY_TOP_K))
+
+    for i, row_scores, row_indices in zip(pending, scores, indices):
+        # save the data
+        hits = []
+        for idx, score in zip(row_indices, row_scores):
+            if idx < 0:   # faiss pads with -1 when there are fewer than top_k vectors
+                continue
+            hits.append({
+                "label": metadata_[idx]["label"],
+                "path": metadata_[idx]["path"],
+                "score": float(score)
+            })
+
+        # Send the data
+        predicted_label, confidence = vote(hits)
+        results[i] = (predicted_label, confidence, hits[:top_k])
+
+    return results
+
+
+def _classify_batch(items: list[tuple[str, int, Snapshot | None]]) -> list[tuple]:
+    # un batch puede mezclar peticiones de antes y después de un reload
+    results = [None] * len(items)
+    groups = {}
+    for i, (_, _, snapshot) in enumerate(items):
+        groups.setdefault(id(snapshot), []).append(i)
+    for positions in groups.values():
+        top_k = max(items[i][1] for i in positions)
+        batch = classify_documents([items[i][0] for i in positions], top_k, items[positions[0]][2])
+        for i, (label, conf, hits) in zip(positions, batch):
+            results[i] = (label, conf, hits[:items[i][1]])
+    return results
+
+
+batcher = MicroBatcher(_classify_batch, max_batch=CLASSIFY_BATCH_SIZE,
+                       max_wait=CLASSIFY_BATCH_WAIT_MS / 1000, name="classify-batcher")
+batcher.observers.append(observe_batch)
+# inc/dec y no set_function: con varios workers el gauge se suma entre procesos
+batcher.observers.append(lambda size, fill, delays: QUEUE_DEPTH.labels("classify_batcher").dec(size))
+
+
+def classify_document(text: str, top_k: int = 1, snapshot: Snapshot | None = None):
+    if CLASSIFY_BATCH_SIZE <= 1:
+        return classify_documents([text], top_k, snapshot)[0]
+    QUEUE_DEPTH.labels("classify_batcher").inc()
+    return batcher.submit((text, top_k, snapshot))
@@ -0,0 +1,53 @@
+"""Embedding model backends shared by the classifier and the index builder.
+
+All backends run the same ``EMBEDDING_MODEL`` weights, so their vectors live
+in the same space and an index built with one can be queried with another;
+the int8 ones trade a little precision for CPU speed
+(``benchmarks/bench_embeddings.py`` measures the agreement).
+
+  torch       SentenceTransformer on PyTorch, fp32 (reference)
+  torch-int8  same, nn.Linear layers dynamically quantized to int8
+  onnx        ONNX Runtime export (needs ``optimum[onnxruntime]``)
+  onnx-int8   ONNX Runtime, int8 quantized export (``EMBEDDING_ONNX_INT8_FILE``)
+"""
+import os
+
+import numpy as np
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# export int8 del repo del modelo en el Hub; elegir la variante de la CPU (avx2, avx512, arm64...)
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def encoder_id(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL) -> str:
+    return f"{model_name}@{backend}"
+
+
+def load_model(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL):
+    """A SentenceTransformer (``.encode``) running on ``backend``."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    # import diferido: sentence_transformers arrastra torch/transformers (segundos de import)
+    from sentence_transformers import SentenceTransformer
+
+    if backend.startswith("onnx"):
+        model_kwargs = {"file_name": EMBEDDING_ONNX_INT8_FILE} if backend == "onnx-int8" else None
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    model = SentenceTransformer(model_name)
+    if backend == "torch-int8":
+        import torch
+        # pesos int8, activaciones cuantizadas al vuelo: sólo CPU
+        model = torch.ao.quantization.quantize_dynamic(
+            model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def make_encoder(model, batch_size: int = 32):
+    """``encode(texts) -> float32[len(texts), dim]``, L2-normalized (cosine = inner product)."""
+    def encode(texts: list[str]) -> np.ndarray:
+        return model.encode(texts, batch_size=batch_size, normalize_embeddings=True).astype("float32")
+    return encode
@@ -1,79 +1,396 @@
-import requests
-import json, pathlib
+import json
+import asyncio
 import os
+import time
+from contextlib import nullcontext
+from logging_setup import logger
+from metrics import LLM_ESCALATIONS, LLM_TIER_CALLS, LLM_TIER_SECONDS
+from ollama_client import client as ollama_client
+from registry import SCHEMA_PATH, Snapshot, registry
 
 # Constants
 
-OLLAMA_API = os.getenv("OLLAMA_API","http://localhost:11434/api/chat")
-HEADERS = {"Content-Type": "application/json"}
 MODEL_OLLAMA = os.getenv("OLLAMA_MODEL","llama3.2")
-SCHEMA_PATH = pathlib.Path(__file__).with_name("document_schema.json")
+# cascada: primero el modelo pequeño, MODEL_OLLAMA sólo si su respuesta no pasa los umbrales ("" = sin cascada)
+OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", "")
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.5"))   # every found field
+CASCADE_MIN_COVERAGE = float(os.getenv("CASCADE_MIN_COVERAGE", "0.5"))       # share of fields found
+CASCADE_SMALL_MAX_TOKENS = int(os.getenv("CASCADE_SMALL_MAX_TOKENS", "0"))   # longer texts skip the small model
+# identifica la cascada en la clave de caché de las extracciones
+MODEL_CASCADE = (f"{OLLAMA_SMALL_MODEL}>{MODEL_OLLAMA}@{CASCADE_MIN_CONFIDENCE}/{CASCADE_MIN_COVERAGE}"
+                 f"/{CASCADE_SMALL_MAX_TOKENS}" if OLLAMA_SMALL_MODEL else MODEL_OLLAMA)
+# streaming permite medir time-to-first-token y cortar generaciones largas
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "1") == "1"
+# presupuesto de tokens: contexto del modelo y tokens reservados para la respuesta
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+OLLAMA_OUTPUT_TOKENS = int(os.getenv("OLLAMA_OUTPUT_TOKENS", "1024"))
+# documentos más largos que el contexto se extraen por chunks, como mucho estos
+OLLAMA_MAX_CHUNKS = int(os.getenv("OLLAMA_MAX_CHUNKS", "4"))
+CHARS_PER_TOKEN = 4
+# "format" con el JSON Schema del tipo de documento (Ollama >= 0.5); 0 => "json" a secas
+STRUCTURED_OUTPUT = os.getenv("OLLAMA_STRUCTURED_OUTPUT", "1") == "1"
 
 
-with SCHEMA_PATH.open(encoding="utf-8") as f:
-    DOCUMENT_SCHEMA: dict[str, list[str]] = json.load(f)
+# Instrucciones fijas al principio del prompt: idénticas en todas las llamadas, así el
+# servidor reutiliza su KV/prefix cache y sólo hace prefill del texto variable.
+SYSTEM_PROMPT = (
+    "You are an intelligent extraction engine designed to process business documents.\n"
+    "For each requested field extract the value and assign a confidence score "
+    "between 0 and 1, based on how certain you are about the value.\n\n"
+    "Respond with a **valid JSON object** where each field name maps to an object with two keys:\n"
+    "- `value`: the extracted value (string or list of strings)\n"
+    "- `confidence`: a float between 0 and 1 indicating your confidence in the extracted value\n\n"
+    "If a value is not found, set:\n"
+    "- `value`: \"not found\"\n"
+    "- `confidence`: 0.0\n\n"
+    "Example format:\n"
+    "{\n"
+    "  \"field_name\": {\n"
+    "    \"value\": \"example value\",\n"
+    "    \"confidence\": 0.92\n"
+    "  },\n"
+    "  ...\n"
+    "}"
+)
+# part of the extraction cache key: bump it when the prompt or the answer format changes
+PROMPT_VERSION = "1"
 
 
-def build_prompt(document_type: str, field_list: list[str], text: str) -> str:
+def build_user_message(document_type: str, field_list: list[str], text: str) -> str:
+    # prefijo por tipo (estable entre documentos del mismo tipo) y después el texto variable
     fields = ", ".join(field_list)
     return (
-        f"You are an intelligent extraction engine designed to process {document_type} documents.\n"
-        f"For each of the following fields — {fields} — extract the value and assign a confidence score "
-        f"between 0 and 1, based on how certain you are about the value.\n\n"
-        "Respond with a **valid JSON object** where each field name maps to an object with two keys:\n"
-        "- `value`: the extracted value (string or list of strings)\n"
-        "- `confidence`: a float between 0 and 1 indicating your confidence in the extracted value\n\n"
-        "If a value is not found, set:\n"
-        "- `value`: \"not found\"\n"
-        "- `confidence`: 0.0\n\n"
-        "Example format:\n"
-        "{\n"
-        "  \"field_name\": {\n"
-        "    \"value\": \"example value\",\n"
-        "    \"confidence\": 0.92\n"
-        "  },\n"
-        "  ...\n"
-        "}\n\n"
+        f"Document type: {document_type}\n"
+        f"Fields to extract: {fields}\n\n"
         "Now extract the information from the following text:\n\n"
         f"{text}"
     )
 
 
-def build_payload(prompt):
-    messages = [{"role": "user", "content": prompt}]
+def build_messages(document_type: str, field_list: list[str], text: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_message(document_type, field_list, text)},
+    ]
+
+
+def build_prompt(document_type: str, field_list: list[str], text: str) -> str:
+    """The whole prompt as one string (system message + user message)."""
+    return SYSTEM_PROMPT + "\n\n" + build_user_message(document_type, field_list, text)
+
+
+def build_json_schema(field_list: list[str]) -> dict:
+    """JSON Schema of the expected answer, passed to Ollama as structured output format."""
+    entity = {
+        "type": "object",
+        "properties": {
+            "value": {"anyOf": [
+                {"type": "string"},
+                {"type": "array", "items": {"type": "string"}},
+            ]},
+            "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        },
+        "required": ["value", "confidence"],
+    }
+    return {
+        "type": "object",
+        "properties": {f: entity for f in field_list},
+        "required": list(field_list),
+    }
+
+
+# schema of the active registry snapshot, rebound on every reload
+DOCUMENT_SCHEMA: dict[str, list[str]] = {}
+ROUTING: dict[str, dict] = {}
+SCHEMA_VERSION = None
+JSON_SCHEMAS: dict[str, dict] = {}
+
+
+def _use_snapshot(snapshot: Snapshot):
+    global DOCUMENT_SCHEMA, ROUTING, SCHEMA_VERSION, JSON_SCHEMAS
+    if snapshot.schema_version != SCHEMA_VERSION:
+        JSON_SCHEMAS = {doc_type: build_json_schema(fields) for doc_type, fields in snapshot.schema.items()}
+    DOCUMENT_SCHEMA, ROUTING, SCHEMA_VERSION = snapshot.schema, snapshot.routing, snapshot.schema_version
+
+
+registry.subscribers.append(_use_snapshot)
+# un índice a medio escribir o desalineado no tumba el import: /readyz da 503 y el watcher reintenta
+if (_snapshot := registry.try_load()) is not None:
+    _use_snapshot(_snapshot)
+
+
+def build_payload(prompt, stream: bool = OLLAMA_STREAM, fmt=None, model: str | None = None):
+    """``prompt`` is either a single user prompt or a list of chat messages."""
+    messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
     return {
-        "model": MODEL_OLLAMA,
+        "model": model or MODEL_OLLAMA,
         "messages": messages,
-        "stream": False,
-        "format": "json" 
+        "stream": stream,
+        "format": fmt or "json",
+        # contexto fijo y salida acotada => latencia de prefill/generación acotada
+        "options": {"num_ctx": OLLAMA_NUM_CTX, "num_predict": OLLAMA_OUTPUT_TOKENS},
     }
 
-def extract_entities_with_ollama(document_type: str, document_text: str):
-    field_list = DOCUMENT_SCHEMA.get(document_type)
-    if not field_list:
-        raise ValueError(f"'{document_type}' no está definido en document_schema.json")
 
-    prompt   = build_prompt(document_type, field_list, document_text)
-    payload  = build_payload(prompt)
+def estimate_tokens(text: str) -> int:
+    # aproximación sin tokenizer: ~4 caracteres por token en textos latinos
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def text_budget(document_type: str, field_list: list[str]) -> int:
+    """Tokens left for the document text once instructions and answer are reserved."""
+    overhead = estimate_tokens(build_prompt(document_type, field_list, ""))
+    return max(OLLAMA_NUM_CTX - OLLAMA_OUTPUT_TOKENS - overhead, 1)
+
+
+def split_into_chunks(text: str, max_tokens: int, overlap_tokens: int = 64) -> list[str]:
+    """Split on line boundaries into chunks of at most ``max_tokens``.
+
+    The last lines of a chunk are repeated at the start of the next one so a
+    value is not lost when it sits right on a boundary.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 4)
+    lines = []
+    for line in text.splitlines():
+        # líneas más largas que un chunk se cortan a la fuerza
+        lines.extend(line[i:i + max_chars] for i in range(0, max(len(line), 1), max_chars))
+
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            carry, carried = [], 0
+            for prev in reversed(current):
+                if carried + len(prev) + 1 > overlap_chars:
+                    break
+                carry.insert(0, prev)
+                carried += len(prev) + 1
+            # el solape no puede hacer pasar del límite a la línea que abre el chunk
+            while carry and carried + len(line) + 1 > max_chars:
+                carried -= len(carry.pop(0)) + 1
+            current, size = carry, carried
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def chunk_score(chunk: str, field_list: list[str]) -> int:
+    """How often the words of the field names appear in ``chunk``."""
+    keywords = {word for field in field_list for word in field.lower().split("_") if len(word) > 2}
+    return sum(chunk.lower().count(word) for word in keywords)
+
 
-    resp = requests.post(OLLAMA_API, json=payload, headers=HEADERS).json()
-    print(resp["message"])
-    raw  = resp["message"]["content"]
+def select_chunks(chunks: list[str], field_list: list[str], max_chunks: int) -> list[str]:
+    """Keep the ``max_chunks`` chunks that mention the fields the most (in document order).
+
+    The first chunk is always kept: headers usually carry ids, dates and parties.
+    """
+    if len(chunks) <= max_chunks:
+        return chunks
+    scores = [chunk_score(chunk, field_list) for chunk in chunks]
+    ranked = sorted(range(1, len(chunks)), key=lambda i: scores[i], reverse=True)
+    keep = sorted([0, *ranked[:max_chunks - 1]])
+    return [chunks[i] for i in keep]
+
+
+def merge_results(field_list: list[str], results: list[dict]) -> dict:
+    """Per field, keep the most confident value that was actually found."""
+    merged = {}
+    for f in field_list:
+        candidates = [
+            r[f] for r in results
+            if isinstance(r.get(f), dict) and r[f].get("value") not in (None, "", "not found")
+        ]
+        merged[f] = max(candidates, key=lambda c: c.get("confidence") or 0.0,
+                        default={"value": "not found", "confidence": 0.0})
+    return merged
+
+
+def route(document_type: str, routing: dict[str, dict] | None = None) -> dict:
+    """Cascade settings of a document type: its schema ``routing`` over the env defaults.
+
+    ``models`` lists the tiers, smallest first; a single model disables the cascade.
+    """
+    settings = (ROUTING if routing is None else routing).get(document_type, {})
+    models = settings.get("models") or [m for m in (OLLAMA_SMALL_MODEL, MODEL_OLLAMA) if m]
+    return {
+        "models": list(dict.fromkeys(models)),
+        "required": settings.get("required", []),
+        "min_confidence": settings.get("min_confidence", CASCADE_MIN_CONFIDENCE),
+        "min_coverage": settings.get("min_coverage", CASCADE_MIN_COVERAGE),
+        "small_max_tokens": settings.get("small_max_tokens", CASCADE_SMALL_MAX_TOKENS),
+    }
+
+
+def escalation_reason(result: dict, field_list: list[str], settings: dict) -> str | None:
+    """Why an answer is not good enough to stop at this tier (None = accept it)."""
+    if any(not isinstance(result.get(f), dict) or "value" not in result[f] for f in field_list):
+        return "invalid_schema"
+    found = {f: result[f] for f in field_list if result[f].get("value") not in (None, "", "not found")}
+    if any(f not in found for f in settings["required"] if f in field_list):
+        return "missing_required"
+    if len(found) < settings["min_coverage"] * len(field_list):
+        return "low_coverage"
+    if any(not isinstance(e.get("confidence"), (int, float)) or e["confidence"] < settings["min_confidence"]
+           for e in found.values()):
+        return "low_confidence"
+    return None
+
+
+async def _extract(document_type: str, field_list: list[str], text: str,
+                   model: str | None = None) -> tuple[dict, str]:
+    messages = build_messages(document_type, field_list, text)
+    schema   = JSON_SCHEMAS.get(document_type) if STRUCTURED_OUTPUT else None
+    if STRUCTURED_OUTPUT and (schema is None or schema["required"] != list(field_list)):
+        schema = build_json_schema(field_list)
+    payload  = build_payload(messages, fmt=schema, model=model)
+
+    chat = await ollama_client.chat(payload)
+    logger.info("LLM generation", extra={
+        "phase": "llm",
+        "model": payload["model"],
+        "ttft": chat.ttft,
+        "generation_time": chat.total,
+        "attempts": chat.attempts,
+        "truncated": chat.truncated,
+    })
+    raw  = chat.content
 
     try:
         data = json.loads(raw)
     except json.JSONDecodeError as e:
-        raise ValueError(f"JSON inválido:\n{raw}") from e
+        # se mantiene el tipo para que la API responda 502 LLMResponseInvalid
+        raise json.JSONDecodeError(f"JSON inválido: {e.msg}", e.doc, e.pos) from e
+    if not isinstance(data, dict):
+        # una lista o un escalar es JSON válido pero no una respuesta: mismo trato que el JSON roto
+        raise json.JSONDecodeError(f"JSON inválido: se esperaba un objeto, no {type(data).__name__}", raw, 0)
+    return data, raw
 
-    # Asegúrate de que todos los campos existan
-    result = {
-        f: data.get(f, {"value": "not found", "confidence": 0.0})
-        for f in field_list
-    }
-    
-    return result , raw
 
+async def extract_entities_with_ollama(document_type: str, document_text: str,
+                                       snapshot: Snapshot | None = None, fields: list[str] | None = None):
+    """``snapshot`` pins the schema version (default: the active one); ``fields``
+    asks only for a subset of the document type's fields.
+
+    Runs the model cascade of the type: every tier but the last one answers
+    only if its result passes the thresholds of ``route()``.
+    """
+    schema = snapshot.schema if snapshot is not None else DOCUMENT_SCHEMA
+    field_list = schema.get(document_type)
+    if not field_list:
+        raise ValueError(f"'{document_type}' no está definido en document_schema.json")
+    if fields:
+        field_list = [f for f in field_list if f in fields]
+
+    settings = route(document_type, snapshot.routing if snapshot is not None else None)
+    models = settings["models"]
+    if settings["small_max_tokens"] and estimate_tokens(document_text) > settings["small_max_tokens"]:
+        models = models[-1:]
+    for tier, model in enumerate(models, 1):
+        t0 = time.perf_counter()
+        try:
+            result, raw = await _extract_with(model, document_type, field_list, document_text)
+            reason = escalation_reason(result, field_list, settings) if tier < len(models) else None
+        except Exception as e:
+            if tier == len(models):
+                raise
+            # p.ej. el modelo pequeño no está descargado: responde el siguiente
+            reason = "invalid_json" if isinstance(e, json.JSONDecodeError) else "error"
+        finally:
+            LLM_TIER_SECONDS.labels(model).observe(time.perf_counter() - t0)
+            LLM_TIER_CALLS.labels(document_type, model).inc()
+        if reason is None:
+            return result, raw
+        LLM_ESCALATIONS.labels(document_type, model, reason).inc()
+        logger.info("LLM escalation", extra={"phase": "llm", "model": model, "next_model": models[tier],
+                                             "reason": reason})
+
+
+async def _extract_with(model: str, document_type: str, field_list: list[str],
+                        document_text: str) -> tuple[dict, str]:
+    chunks = split_into_chunks(document_text, text_budget(document_type, field_list))
+    if len(chunks) == 1:
+        data, raw = await _extract(document_type, field_list, document_text, model)
+        # Asegúrate de que todos los campos existan
+        result = {
+            f: data.get(f, {"value": "not found", "confidence": 0.0})
+            for f in field_list
+        }
+        return result , raw
+
+    # documento largo: un prompt por chunk, en paralelo (limitado por el cliente)
+    selected = select_chunks(chunks, field_list, OLLAMA_MAX_CHUNKS)
+    outcomes = await asyncio.gather(
+        *(_extract(document_type, field_list, chunk, model) for chunk in selected),
+        return_exceptions=True,
+    )
+    parsed = [o for o in outcomes if not isinstance(o, BaseException)]
+    if not parsed:
+        raise outcomes[0]
+    result = merge_results(field_list, [data for data, _ in parsed])
+    return result, "\n".join(raw for _, raw in parsed)
+
+
+class StreamingExtraction:
+    """Extraction fed with the text as it arrives (page by page).
+
+    Every chunk that fills up is sent to the LLM right away, while later
+    pages are still being OCR'd: the first ``OLLAMA_MAX_CHUNKS - 1`` in
+    document order, the last slot goes to the best scoring of the rest once
+    the text is complete. When the whole text fits in one prompt nothing is
+    sent early (``started`` stays False) and the caller extracts as usual.
+    Documents long enough to be streamed go to the last tier of the cascade.
+    """
+
+    def __init__(self, document_type: str, snapshot: Snapshot | None = None, limit=nullcontext):
+        schema = snapshot.schema if snapshot is not None else DOCUMENT_SCHEMA
+        self.document_type = document_type
+        self.field_list = schema.get(document_type)
+        if not self.field_list:
+            raise ValueError(f"'{document_type}' no está definido en document_schema.json")
+        self.budget = text_budget(document_type, self.field_list)
+        self.model = route(document_type, snapshot.routing if snapshot is not None else None)["models"][-1]
+        self._limit = limit          # () -> async context manager around every LLM call
+        self._buffer = ""
+        self._tasks: list[asyncio.Task] = []
+        self._held: list[str] = []   # chunks completos sin hueco todavía
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks or self._held)
 
+    def feed(self, text: str) -> None:
+        self._buffer = f"{self._buffer}\n{text}" if self._buffer else text
+        if len(self._buffer) <= self.budget * CHARS_PER_TOKEN:
+            return
+        # el último chunk puede crecer con las páginas siguientes: se queda en el buffer
+        *full, self._buffer = split_into_chunks(self._buffer, self.budget)
+        for chunk in full:
+            if len(self._tasks) < OLLAMA_MAX_CHUNKS - 1:
+                self._tasks.append(asyncio.create_task(self._call(chunk)))
+            else:
+                self._held.append(chunk)
 
+    async def _call(self, chunk: str) -> tuple[dict, str]:
+        async with self._limit():
+            return await _extract(self.document_type, self.field_list, chunk, self.model)
 
+    async def finish(self) -> tuple[dict, str]:
+        rest = [c for c in (*self._held, self._buffer) if c.strip()]
+        slots = max(OLLAMA_MAX_CHUNKS - len(self._tasks), 0)
+        keep = sorted(sorted(range(len(rest)), key=lambda i: chunk_score(rest[i], self.field_list),
+                             reverse=True)[:slots])
+        tasks = [*self._tasks, *(asyncio.create_task(self._call(rest[i])) for i in keep)]
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        parsed = [o for o in outcomes if not isinstance(o, BaseException)]
+        if not parsed:
+            raise outcomes[0]
+        result = merge_results(self.field_list, [data for data, _ in parsed])
+        return result, "\n".join(raw for _, raw in parsed)
 
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,52 @@
+# gunicorn -c gunicorn.conf.py main:app
+#
+# preload_app: el master importa la app y construye los modelos una sola vez; los
+# workers se crean con fork y comparten los pesos (copy-on-write) en vez de cargar
+# cada uno su copia de EasyOCR + SentenceTransformer.
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+
+# 0 => cada worker carga sus modelos en el warm-up del lifespan (sin compartir memoria)
+MODELS_PRELOAD = os.getenv("MODELS_PRELOAD", "1") == "1"
+# hilos de torch por worker: N workers × todos los cores sobre-suscribe la CPU
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+# /metrics agrega todos los workers cuando está definido (ver metrics.py)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server):
+    # ficheros de métricas de una ejecución anterior: contarían como workers vivos
+    if PROMETHEUS_MULTIPROC_DIR:
+        import shutil
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def when_ready(server):
+    # corre en el master, con la app ya importada y antes del primer fork
+    if not MODELS_PRELOAD:
+        return
+    from models import models
+    # sólo construir: nada de inferencia en el master, que arrancaría los pools de
+    # hilos de torch/OpenMP y un fork con esos hilos vivos puede bloquearse. La
+    # inferencia de prueba la hace cada worker en su lifespan (MODEL_WARMUP).
+    models.load_all()
+    server.log.info("Models preloaded in master: %s", ", ".join(models.status()))
+
+
+def post_fork(server, worker):
+    if TORCH_THREADS_PER_WORKER:
+        import torch
+        torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+
+
+def child_exit(server, worker):
+    # los gauges livesum dejan de contar al worker que ha muerto
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
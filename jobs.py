@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+
+import httpx
+
+from logging_setup import logger
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.sqlite3")
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+# a running job whose worker stops renewing the lease is handed to another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+WEBHOOK_TIMEOUT = float(os.getenv("JOBS_WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_RETRIES = int(os.getenv("JOBS_WEBHOOK_RETRIES", "3"))
+
+
+class JobQueue:
+    """Durable work queue on SQLite, shared by the API and every worker process of the host.
+
+    Per-file results are stored as soon as they are computed, so a job picked
+    up again after a crash only processes the files that were still pending.
+    """
+
+    def __init__(self, db_path: str | Path = JOBS_DB, lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db_path = str(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    webhook TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    lease_until REAL,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+                CREATE TABLE IF NOT EXISTS job_files (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    profile TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    PRIMARY KEY (job_id, position)
+                );
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, files: list[dict], webhook: str | None = None, job_id: str | None = None) -> str:
+        """``files``: ``{"filename", "path", "profile"}`` already stored on disk."""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, status, webhook, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, webhook, now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, filename, path, profile, status)"
+                " VALUES (?, ?, ?, ?, ?, 'queued')",
+                [(job_id, i, f["filename"], str(f["path"]), f.get("profile")) for i, f in enumerate(files)],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return job_id
+
+    def fail_exhausted(self) -> list[str]:
+        """Mark failed the expired jobs that used up their attempts; returns their ids."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )]
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'Too many attempts', lease_until = NULL,"
+                " updated_at = ? WHERE id = ?",
+                [(now, job_id) for job_id in ids],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return ids
+
+    def claim(self, worker: str) -> dict | None:
+        """Atomically take the oldest queued job (or one whose lease expired with attempts left)."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued'"
+                " OR (status = 'running' AND lease_until < ? AND attempts < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?,"
+                " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get(row["id"], with_paths=True)
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """Extend the lease; False when the job is no longer ``worker``'s (expired and taken over)."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, worker),
+            )
+            return cur.rowcount > 0
+
+    def save_file_result(self, job_id: str, position: int, result: dict, worker: str) -> bool:
+        status = "failed" if "error" in result else "done"
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE job_files SET status = ?, result = ? WHERE job_id = ? AND position = ?"
+                " AND EXISTS (SELECT 1 FROM jobs WHERE id = ? AND worker = ? AND status = 'running')",
+                (status, json.dumps(result), job_id, position, job_id, worker),
+            )
+            return cur.rowcount > 0
+
+    def finish(self, job_id: str, worker: str, status: str = "completed", error: str | None = None) -> bool:
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, error, time.time(), job_id, worker),
+            )
+            return cur.rowcount > 0
+
+    def depth(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def get(self, job_id: str, with_paths: bool = False) -> dict | None:
+        with closing(self._connect()) as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = conn.execute(
+                "SELECT * FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+
+        results = []
+        for f in files:
+            entry = json.loads(f["result"]) if f["result"] else {"filename": f["filename"]}
+            entry["status"] = f["status"]
+            if with_paths:
+                entry.update(position=f["position"], path=f["path"], profile=f["profile"])
+            results.append(entry)
+        info = {
+            "job_id": job["id"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "attempts": job["attempts"],
+            "error": job["error"],
+            "webhook": job["webhook"],
+            "results": results,
+        }
+        if with_paths:
+            info["worker"] = job["worker"]
+        return info
+
+
+async def notify_webhook(url: str, payload: dict, retries: int = WEBHOOK_RETRIES) -> bool:
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+        for attempt in range(retries):
+            try:
+                resp = await client.post(url, json=payload)
+                if resp.status_code < 500:
+                    return resp.status_code < 400
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(2 ** attempt)
+    logger.warning("Job webhook failed", extra={"trace_id": payload["job_id"], "file": url, "phase": "jobs"})
+    return False
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker claimed it: this worker must drop it."""
+
+
+async def _renew_lease(queue: JobQueue, job_id: str, worker: str, lost: asyncio.Event):
+    # renovar mientras el handler trabaja: un solo fichero (un PDF largo) puede durar más que el lease
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker):
+            lost.set()
+            return
+
+
+async def process_job(queue: JobQueue, job: dict, handler) -> dict:
+    """Run ``handler(path, filename, profile) -> result | error entry`` on the pending files.
+
+    Raises ``LeaseLost`` when the job was taken over by another worker; its
+    results are then left to the new owner.
+    """
+    job_id, worker = job["job_id"], job["worker"]
+    lost = asyncio.Event()
+    renewer = asyncio.create_task(_renew_lease(queue, job_id, worker, lost))
+    try:
+        for f in job["results"]:
+            if f["status"] in ("done", "failed"):
+                continue
+            if lost.is_set():
+                raise LeaseLost(job_id)
+            result = await handler(f["path"], f["filename"], f["profile"])
+            if not await asyncio.to_thread(queue.save_file_result, job_id, f["position"], result, worker):
+                raise LeaseLost(job_id)
+
+        if not await asyncio.to_thread(queue.finish, job_id, worker):
+            raise LeaseLost(job_id)
+    finally:
+        renewer.cancel()
+    return await deliver(queue, job_id)
+
+
+async def deliver(queue: JobQueue, job_id: str) -> dict:
+    """Remove the files of a completed or failed job and send its final state to the webhook."""
+    shutil.rmtree(Path(JOBS_DIR) / job_id, ignore_errors=True)
+    final = await asyncio.to_thread(queue.get, job_id)
+    if final.get("webhook"):
+        webhook = final.pop("webhook")
+        await notify_webhook(webhook, final)
+    return final
+
+
+async def run_worker(queue: JobQueue, handler, concurrency: int = 1,
+                     poll_interval: float = JOBS_POLL_INTERVAL, stop: asyncio.Event | None = None):
+    """Drain the queue until ``stop`` is set, with up to ``concurrency`` jobs at once."""
+    stop = stop or asyncio.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    async def loop():
+        while not stop.is_set():
+            for job_id in await asyncio.to_thread(queue.fail_exhausted):
+                logger.warning("Job failed: too many attempts",
+                               extra={"trace_id": job_id, "file": "", "phase": "jobs"})
+                await deliver(queue, job_id)
+            job = await asyncio.to_thread(queue.claim, worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await process_job(queue, job, handler)
+            except LeaseLost:
+                logger.warning("Job lease lost to another worker",
+                               extra={"trace_id": job["job_id"], "file": "", "phase": "jobs"})
+            except Exception as e:
+                logger.error("Job failed", extra={"trace_id": job["job_id"], "file": "", "phase": "jobs",
+                                                  "error": str(e)}, exc_info=True)
+                if await asyncio.to_thread(queue.finish, job["job_id"], worker_id, "failed", str(e)):
+                    await deliver(queue, job["job_id"])
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+
+
+job_queue = JobQueue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the /jobs queue with process_file.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOBS_WORKER_CONCURRENCY", "2")),
+                        help="jobs processed at the same time by this worker process")
+    args = parser.parse_args()
+
+    # import diferido: main importa este módulo para exponer los endpoints
+    from main import process_stored_file
+    asyncio.run(run_worker(job_queue, process_stored_file, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,93 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import aclosing, asynccontextmanager, nullcontext, suppress
 from typing import List
 import aiofiles
+import asyncio
 import os
+import secrets
+import shutil
 import uuid
 from pathlib import Path
-from ocr import ocr_image, ocr_pdf
-from classifier import classify_document
-from extractor import extract_entities_with_ollama
+from urllib.parse import urlsplit
+from ocr import OCR_SETTINGS, iter_pdf_pages, ocr_image, ocr_pdf_pages, shutdown_page_pool
+from preprocessing import PROFILES, DEFAULT_PROFILE
+from cache import result_cache, content_hash as hash_bytes, file_hash
+from ollama_client import client as ollama_client
+import hashlib
+from classifier import CLASSIFY_SETTINGS, classify_document
+from extractor import (StreamingExtraction, build_prompt, estimate_tokens, extract_entities_with_ollama,
+                       MODEL_CASCADE, PROMPT_VERSION)
+from rules import OUTPUT_TOKENS_PER_FIELD, RULES_ENABLED, RULES_MIN_CONFIDENCE, RULES_VERSION, combine, extract_fields
+from registry import REGISTRY_WATCH_SECONDS, registry
 import time
 import json
 from logging_setup import logger
+from pipeline import executor
+from jobs import JOBS_DIR, job_queue, run_worker
+from models import MODEL_WARMUP, models
+from metrics import (CACHE_LOOKUPS, LLM_CALLS, LLM_TOKENS_SAVED, QUEUE_DEPTH, RULE_FIELDS, collect_timings,
+                     listen_stages, live_gauge,
+                     render as render_metrics, stage_timer)
 import uuid
 
 ALLOWED_EXTENSIONS = {"pdf", "png", "jpg", "jpeg"}
 UPLOAD_DIR = "uploads"
+MAX_FILES_IN_FLIGHT = int(os.getenv("MAX_FILES_IN_FLIGHT", "4"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "250")) * 1024 * 1024
+# images up to this size are decoded straight from memory, never written to disk
+IN_MEMORY_IMAGE_BYTES = int(os.getenv("IN_MEMORY_IMAGE_MB", "32")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# workers draining the /jobs queue inside the API process (0 => only `python jobs.py` workers)
+JOBS_INPROCESS_WORKERS = int(os.getenv("JOBS_INPROCESS_WORKERS", "0"))
+# PDFs: classify and extract while the later pages are still being OCR'd
+PIPELINE_STREAMING = os.getenv("PIPELINE_STREAMING", "1") == "1"
+# pages with text the classifier waits for (the first pages usually decide the type)
+CLASSIFY_PAGES = int(os.getenv("CLASSIFY_PAGES", "2"))
+# /extract_entities/stream: media type per format, stages reported with progress=true
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+PROGRESS_STAGES = ("total", "ocr", "classify", "llm")
+# shared secret for /admin/* (unset => admin endpoints answer 403)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-app = FastAPI(title="Entity Extraction API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop = asyncio.Event()
+    job_workers = None
+    if JOBS_INPROCESS_WORKERS:
+        job_workers = asyncio.create_task(
+            run_worker(job_queue, process_stored_file, JOBS_INPROCESS_WORKERS, stop=stop)
+        )
+    watcher = None
+    if REGISTRY_WATCH_SECONDS > 0:
+        watcher = asyncio.create_task(registry.watch(REGISTRY_WATCH_SECONDS, stop=stop))
+    if MODEL_WARMUP and not models.ready:
+        # en segundo plano: /healthz responde ya, /readyz da 503 hasta terminar
+        asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    stop.set()
+    if job_workers is not None:
+        await job_workers
+    if watcher is not None:
+        await watcher
+    await ollama_client.aclose()
+    executor.shutdown()
+    shutdown_page_pool()
+
+
+def warm_up():
+    """Load the models and run one inference each (no-op for those already warm)."""
+    t0 = time.perf_counter()
+    try:
+        models.warm_up()
+    except Exception as e:
+        logger_log("Model warm-up failed", "error", None, "", "models", e)
+        return
+    logger.info("Models warm", extra={"phase": "models", "seconds": time.perf_counter() - t0})
+
+
+app = FastAPI(title="Entity Extraction API", lifespan=lifespan)
+live_gauge(QUEUE_DEPTH, job_queue.depth, pool="jobs")
 
 def allowed_file(filename: str) -> bool:
     return filename.split(".")[-1].lower() in ALLOWED_EXTENSIONS
@@ -36,73 +107,177 @@ def logger_log(message, type, trace_id, file, phase, error=""):
         logger.info(message, extra=log_data)
 
 
-async def process_file(file_path: str) -> dict:
+async def _cached(stage: str, *parts):
+    value = await result_cache.aget(stage, *parts)
+    CACHE_LOOKUPS.labels(stage, "miss" if value is None else "hit").inc()
+    return value
+
+
+async def process_file(file_path: str, content: bytes | None = None,
+                       filename: str | None = None, profile: str | None = None,
+                       content_hash: str | None = None, debug: bool = False) -> dict:
+    """Run OCR, classification and extraction on one document.
+
+    ``content`` holds the encoded image bytes when the upload was kept in
+    memory; ``file_path`` is then only used for its extension and for logging.
+    ``profile`` selects the image preprocessing profile (see ``preprocessing.PROFILES``).
+    Stage outputs are cached by ``content_hash`` (sha256 of the file bytes),
+    computed here when the caller did not already have it.
+    With ``debug`` the result carries the seconds spent in each stage.
+    """
+    with collect_timings() as timings:
+        with stage_timer("total"):
+            result = await _process_file(file_path, content, filename, profile, content_hash)
+    if debug:
+        result["timings"] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    return result
+
+
+async def _process_file(file_path: str, content: bytes | None, filename: str | None,
+                        profile: str | None, content_hash: str | None) -> dict:
     trace_id = str(uuid.uuid4())
     t0 = time.perf_counter()
     ext = Path(file_path).suffix.lower()
-
-    # ---------- OCR ----------
-    try:
-        if ext == ".pdf":
-            logger_log("Processing PDF file", "info", trace_id, file_path, "ocr")
-            text = ocr_pdf(Path(file_path))
-        else:
-            logger_log("Processing image file", "info", trace_id, file_path, "ocr")
-            text = ocr_image(Path(file_path))
-    except Exception as e:
-        logger_log("OCR failed", "error", trace_id, file_path, "ocr", e)
-        raise HTTPException(status_code=500, detail={
-            "error": "OCRFailure",
-            "message": "OCR processing failed",
-            "trace_id": trace_id
+    # index + schema version for the whole request, even if a reload happens meanwhile
+    if not registry.loaded:
+        # cargar el índice (leer FAISS, hashear ficheros) no se hace en el event loop
+        registry.load_in_background()
+        raise HTTPException(status_code=503, detail={
+            "error": "IndexUnavailable",
+            "message": "The classifier index is not loaded yet",
+            "trace_id": trace_id,
         })
+    snapshot = registry.current
 
-    if not text.strip():
-        logger_log("No text found in document", "warning", trace_id, file_path, "ocr")
-        raise HTTPException(status_code=415, detail={
-            "error": "NoTextFound",
-            "message": "No legible text found in document",
-            "trace_id": trace_id
-        })
+    if content_hash is None:
+        with stage_timer("hash"):
+            # sha256 suelta el GIL: hashear unos MB en un hilo no bloquea el event loop
+            content_hash = await (asyncio.to_thread(hash_bytes, content) if content is not None
+                                  else asyncio.to_thread(file_hash, file_path))
+    doc_key = (content_hash, profile or DEFAULT_PROFILE, OCR_SETTINGS)
 
-    # ---------- Classification ----------
-    try:
-        logger_log("Classifying document", "info", trace_id, file_path, "classification")
-        doc_type, confidence, hits = classify_document(text)
-    except Exception as e:
-        logger_log("Classification failed", "error", trace_id, file_path, "classification", e)
-        raise HTTPException(status_code=500, detail={
-            "error": "ClassificationError",
-            "message": "Document classification failed",
-            "trace_id": trace_id
-        })
+    # ---------- OCR ----------
+    # PDFs en streaming: la clasificación y la extracción pueden arrancar durante el OCR
+    classify_task = extraction = None
+    # la clasificación usa text[:classify_chars] (en streaming, sólo las primeras páginas)
+    classify_key = (*doc_key, snapshot.index_version, CLASSIFY_SETTINGS)
+    cached = await _cached("ocr", *doc_key)
+    if cached is not None:
+        text, pages = cached["text"], cached["pages"]
+        classify_chars = cached.get("classify_chars", len(text))
+    else:
+        try:
+            if ext == ".pdf" and PIPELINE_STREAMING:
+                logger_log("Processing PDF file", "info", trace_id, file_path, "ocr")
+                with stage_timer("ocr"):
+                    text, pages, classify_task, extraction, classify_chars = await _stream_pdf(
+                        file_path, profile, snapshot, doc_key, classify_key, trace_id)
+            elif ext == ".pdf":
+                logger_log("Processing PDF file", "info", trace_id, file_path, "ocr")
+                with stage_timer("ocr"):
+                    pages = await executor.run("ocr", ocr_pdf_pages, Path(file_path), profile=profile)
+                text = "\n".join(p["text"] for p in pages).strip()
+                classify_chars = len(text)
+            else:
+                logger_log("Processing image file", "info", trace_id, file_path, "ocr")
+                source = content if content is not None else Path(file_path)
+                with stage_timer("ocr"):
+                    text = await executor.run("ocr", ocr_image, source, profile=profile)
+                pages = [{"page": 1, "source": "ocr"}]
+                classify_chars = len(text)
+        except Exception as e:
+            logger_log("OCR failed", "error", trace_id, file_path, "ocr", e)
+            raise HTTPException(status_code=500, detail={
+                "error": "OCRFailure",
+                "message": "OCR processing failed",
+                "trace_id": trace_id
+            })
+        # which path each page took: "text" (native PDF text layer) or "ocr"
+        pages = [{"page": p["page"], "source": p["source"]} for p in pages]
+        # el mismo documento repetido se clasifica con el mismo texto y la misma clave
+        await result_cache.aset("ocr", {"text": text, "pages": pages, "classify_chars": classify_chars}, *doc_key)
 
-    # ---------- LLM Extraction ----------
     try:
-        logger_log("Extracting entities using LLM", "info", trace_id, file_path, "llm")
-        entities, model_response = extract_entities_with_ollama(doc_type, text)
-        logger.info("LLM response",
-        extra={
-            "trace_id": trace_id,
-            "file": str(file_path),
-            "phase": "llm",
-            "raw_response": model_response[:1000]   # ajusta len si quieres
-        })
-    except json.JSONDecodeError as e:
-        logger_log("LLM returned malformed JSON", "warning", trace_id, file_path, "llm", e)
-        raise HTTPException(status_code=502, detail={
-            "error": "LLMResponseInvalid",
-            "message": "The LLM returned malformed JSON",
-            "hint": "Retry with lower temperature or validate model behavior",
-            "trace_id": trace_id
-        })
-    except Exception as e:
-        logger_log("LLM extraction failed", "error", trace_id, file_path, "llm", e)
-        raise HTTPException(status_code=500, detail={
-            "error": "LLMError",
-            "message": "Entity extraction failed",
-            "trace_id": trace_id
-        })
+        if not text.strip():
+            logger_log("No text found in document", "warning", trace_id, file_path, "ocr")
+            raise HTTPException(status_code=415, detail={
+                "error": "NoTextFound",
+                "message": "No legible text found in document",
+                "trace_id": trace_id
+            })
+
+        # ---------- Classification ----------
+        if classify_task is None:
+            classify_task = _classify(text[:classify_chars], snapshot, classify_key, trace_id, file_path)
+        try:
+            doc_type, confidence, hits = await classify_task
+        except Exception as e:
+            logger_log("Classification failed", "error", trace_id, file_path, "classification", e)
+            raise HTTPException(status_code=500, detail={
+                "error": "ClassificationError",
+                "message": "Document classification failed",
+                "trace_id": trace_id
+            })
+
+        # ---------- LLM Extraction ----------
+        extract_key = _extract_key(doc_key, doc_type, snapshot)
+        cached = await _cached("extract", *extract_key)
+        try:
+            if cached is not None:
+                entities, model_response = cached
+            else:
+                field_list = snapshot.schema.get(doc_type) or []
+                with stage_timer("rules"):
+                    ruled = extract_fields(doc_type, field_list, text) if RULES_ENABLED else {}
+                missing = [f for f in field_list
+                           if ruled.get(f, {}).get("confidence", 0.0) < RULES_MIN_CONFIDENCE]
+                if field_list and not missing:
+                    # todo resuelto por las reglas: ni prompt ni chunks en vuelo
+                    logger_log("All fields extracted by rules, skipping LLM", "info", trace_id, file_path, "rules")
+                    entities, model_response = {}, ""
+                elif extraction is not None and extraction.started:
+                    # los primeros chunks ya están en el LLM; cada llamada toma su propio hueco "llm"
+                    logger_log("Extracting entities using LLM", "info", trace_id, file_path, "llm")
+                    with stage_timer("llm"):
+                        entities, model_response = await extraction.finish()
+                else:
+                    logger_log("Extracting entities using LLM", "info", trace_id, file_path, "llm")
+                    # solo lo que las reglas no resolvieron con confianza suficiente
+                    subset = {"fields": missing} if len(missing) < len(field_list) else {}
+                    async with executor.limit("llm"):
+                        with stage_timer("llm"):
+                            entities, model_response = await extract_entities_with_ollama(doc_type, text,
+                                                                                          snapshot=snapshot,
+                                                                                          **subset)
+                entities = combine(entities, ruled)
+                _count_llm_usage(doc_type, field_list, missing, text,
+                                 asked_subset=extraction is None or not extraction.started)
+                await result_cache.aset("extract", [entities, model_response], *extract_key)
+            logger.info("LLM response",
+            extra={
+                "trace_id": trace_id,
+                "file": str(file_path),
+                "phase": "llm",
+                "raw_response": model_response[:1000]   # ajusta len si quieres
+            })
+        except json.JSONDecodeError as e:
+            logger_log("LLM returned malformed JSON", "warning", trace_id, file_path, "llm", e)
+            raise HTTPException(status_code=502, detail={
+                "error": "LLMResponseInvalid",
+                "message": "The LLM returned malformed JSON",
+                "hint": "Retry with lower temperature or validate model behavior",
+                "trace_id": trace_id
+            })
+        except Exception as e:
+            logger_log("LLM extraction failed", "error", trace_id, file_path, "llm", e)
+            raise HTTPException(status_code=500, detail={
+                "error": "LLMError",
+                "message": "Entity extraction failed",
+                "trace_id": trace_id
+            })
+    finally:
+        if extraction is not None:
+            extraction.cancel()   # error o cancelación: no dejar chunks en vuelo
 
     processing_time = time.perf_counter() - t0
 
@@ -113,39 +288,416 @@ async def process_file(file_path: str) -> dict:
     })
 
     return {
-        "filename": Path(file_path).name,
+        "filename": filename or Path(file_path).name,
         "document_type": doc_type,
         "confidence": round(confidence, 2),
         "entities": entities,
+        "pages": pages,
+        "index_version": snapshot.index_version,
+        "schema_version": snapshot.schema_version,
         "processing_time": processing_time,
     }
 
-@app.post("/extract_entities/")
-async def extract_entities(files: List[UploadFile] = File(...)):
-    responses = []
+async def _classify(text: str, snapshot, key: tuple, trace_id: str, file_path: str) -> tuple:
+    cached = await _cached("classify", *key)
+    if cached is not None:
+        return tuple(cached)
+    logger_log("Classifying document", "info", trace_id, file_path, "classification")
+    with stage_timer("classify"):
+        result = await executor.run("classify", classify_document, text, snapshot=snapshot)
+    await result_cache.aset("classify", list(result), *key)
+    return result
 
-    for file in files:
-        if not allowed_file(file.filename):
-            raise HTTPException(status_code=400, detail=f"Not allowed format: {file.filename}")
 
-        # Create the Upload directory if it is necessary
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
+def _extract_key(doc_key: tuple, doc_type: str, snapshot) -> tuple:
+    return (*doc_key, doc_type, MODEL_CASCADE, PROMPT_VERSION, snapshot.schema_version,
+            RULES_VERSION if RULES_ENABLED else None)
+
+
+def _count_llm_usage(doc_type: str, field_list: list[str], missing: list[str], text: str,
+                     asked_subset: bool):
+    RULE_FIELDS.labels(doc_type).inc(len(field_list) - len(missing))
+    if not field_list:
+        return
+    if not missing:
+        LLM_CALLS.labels(doc_type, "skipped").inc()
+    elif len(missing) < len(field_list) and asked_subset:
+        LLM_CALLS.labels(doc_type, "partial").inc()
+    else:
+        LLM_CALLS.labels(doc_type, "full").inc()
+        return
+    # estimación: prompt completo vs. el que se envió (o ninguno) + la respuesta de cada campo ahorrado
+    full = estimate_tokens(build_prompt(doc_type, field_list, text))
+    sent = estimate_tokens(build_prompt(doc_type, missing, text)) if missing else 0
+    LLM_TOKENS_SAVED.labels(doc_type).inc(
+        full - sent + OUTPUT_TOKENS_PER_FIELD * (len(field_list) - len(missing)))
+
+
+async def _start_extraction(classify_task: asyncio.Task, doc_key: tuple, snapshot) -> StreamingExtraction | None:
+    if classify_task.cancelled() or classify_task.exception() is not None:
+        return None
+    doc_type = classify_task.result()[0]
+    if await result_cache.aget("extract", *_extract_key(doc_key, doc_type, snapshot)) is not None:
+        return None
+    try:
+        return StreamingExtraction(doc_type, snapshot, limit=lambda: executor.limit("llm"))
+    except ValueError:
+        return None   # tipo sin schema: el error se da en la extracción normal
+
+
+async def _stream_pdf(file_path: str, profile: str | None, snapshot, doc_key: tuple, classify_key: tuple,
+                      trace_id: str):
+    """OCR a PDF page by page, starting classification and extraction on the first pages.
+
+    Classification runs on the first ``CLASSIFY_PAGES`` pages with text as soon
+    as they are ready; once it is known, the text is fed to a
+    ``StreamingExtraction`` that sends every full chunk to the LLM while the
+    remaining pages are still being OCR'd.
+    Returns ``(text, pages, classify_task, extraction, classify_chars)``, the
+    classifier input being ``text[:classify_chars]``.
+    """
+    texts, pages = [], []
+    classify_task = extraction = None
+    extraction_checked = False
+    classify_chars = None
+    try:
+        async with aclosing(executor.stream("ocr", iter_pdf_pages, Path(file_path), profile=profile)) as stream:
+            async for page in stream:
+                pages.append({"page": page["page"], "source": page["source"]})
+                texts.append(page["text"])
+                if classify_task is None and sum(1 for t in texts if t.strip()) >= CLASSIFY_PAGES:
+                    head = "\n".join(texts).strip()   # prefijo del texto final
+                    classify_chars = len(head)
+                    classify_task = asyncio.create_task(
+                        _classify(head, snapshot, classify_key, trace_id, file_path))
+                if extraction is not None:
+                    extraction.feed(page["text"])
+                elif not extraction_checked and classify_task is not None and classify_task.done():
+                    extraction_checked = True
+                    extraction = await _start_extraction(classify_task, doc_key, snapshot)
+                    for t in texts if extraction is not None else ():
+                        extraction.feed(t)
+    except BaseException:
+        if classify_task is not None:
+            classify_task.cancel()
+        if extraction is not None:
+            extraction.cancel()
+        raise
+    text = "\n".join(texts).strip()
+    if classify_task is None and text:
+        # menos páginas con texto que CLASSIFY_PAGES: el documento entero
+        classify_task = asyncio.create_task(_classify(text, snapshot, classify_key, trace_id, file_path))
+    return text, pages, classify_task, extraction, len(text) if classify_chars is None else classify_chars
+
+
+def _too_large(filename: str) -> HTTPException:
+    return HTTPException(status_code=413, detail={
+        "error": "FileTooLarge",
+        "message": f"{filename} exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit",
+    })
 
-        # temporarily save the file
-        temp_filename = f"temp_{uuid.uuid4().hex}_{file.filename}"
-        temp_path = os.path.join(UPLOAD_DIR, temp_filename)
 
-        async with aiofiles.open(temp_path, "wb") as out_file:
-            content = await file.read()
-            await out_file.write(content)
+async def _read_upload(file: UploadFile, limit: int) -> bytes | None:
+    """Read the upload in chunks; None when it is bigger than ``limit``."""
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > limit:
+            await file.seek(0)
+            return None
+    return bytes(buffer)
+
+
+async def _save_upload(file: UploadFile, path: str) -> str:
+    """Stream the upload to ``path``; returns the sha256 of its content."""
+    written = 0
+    hasher = hashlib.sha256()
+    try:
+        async with aiofiles.open(path, "wb") as out_file:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > MAX_UPLOAD_BYTES:
+                    raise _too_large(file.filename)
+                hasher.update(chunk)
+                await out_file.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return hasher.hexdigest()
+
+
+async def _spool_upload(file: UploadFile) -> tuple[str, str]:
+    """Copy the upload to ``UPLOAD_DIR``; returns ``(path, sha256)``."""
+    # Create the Upload directory if it is necessary
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_DIR, f"temp_{uuid.uuid4().hex}_{file.filename}")
+    return temp_path, await _save_upload(file, temp_path)
+
+
+async def _process_upload(file: UploadFile, semaphore: asyncio.Semaphore,
+                          profile: str | None = None, debug: bool = False) -> dict:
+    async with semaphore:
+        if not file.filename.lower().endswith(".pdf"):
+            content = await _read_upload(file, min(IN_MEMORY_IMAGE_BYTES, MAX_UPLOAD_BYTES))
+            if content is not None:
+                return await process_file(file.filename, content=content,
+                                          filename=file.filename, profile=profile, debug=debug)
+
+        # stream the file to disk, pdfplumber needs a real file
+        temp_path, digest = await _spool_upload(file)
 
         # Procesing of the file
         try:
-            result = await process_file(temp_path)
-            responses.append(result)
+            return await process_file(temp_path, filename=file.filename, profile=profile,
+                                      content_hash=digest, debug=debug)
         finally:
             # Delete the file after
             os.remove(temp_path)
 
+
+def _error_entry(filename: str, exc: Exception) -> dict:
+    if isinstance(exc, HTTPException) and isinstance(exc.detail, dict):
+        return {"filename": filename, "status_code": exc.status_code, **exc.detail}
+    logger_log("Unexpected error processing file", "error", None, filename, "request", exc)
+    return {
+        "filename": filename,
+        "status_code": 500,
+        "error": "InternalError",
+        "message": "Unexpected error processing the file",
+    }
+
+
+def _validate_request(files: List[UploadFile], profile: str | None) -> None:
+    if profile is not None and profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown preprocessing profile: {profile}")
+
+    for file in files:
+        if not allowed_file(file.filename):
+            raise HTTPException(status_code=400, detail=f"Not allowed format: {file.filename}")
+
+
+@app.post("/extract_entities/")
+async def extract_entities(files: List[UploadFile] = File(...),
+                           profile: str | None = Form(None),
+                           debug: bool = False):
+    _validate_request(files, profile)
+
+    # fan out the files of the request, bounded so one batch can't take every pool slot
+    semaphore = asyncio.Semaphore(MAX_FILES_IN_FLIGHT)
+    outcomes = await asyncio.gather(
+        *(_process_upload(file, semaphore, profile, debug) for file in files),
+        return_exceptions=True,
+    )
+
+    # a single-file request keeps the plain HTTP error contract
+    if len(files) == 1 and isinstance(outcomes[0], Exception):
+        raise outcomes[0]
+
+    responses = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome
+            responses.append(_error_entry(file.filename, outcome))
+        else:
+            responses.append(outcome)
+
     return JSONResponse(content={"results": responses})
 
+
+@app.post("/extract_entities/stream")
+async def extract_entities_stream(files: List[UploadFile] = File(...),
+                                  profile: str | None = Form(None),
+                                  format: str = "ndjson",
+                                  progress: bool = False,
+                                  debug: bool = False):
+    """Like ``/extract_entities/`` but every file's result (or error) is sent as soon as it is ready."""
+    _validate_request(files, profile)
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown stream format: {format}")
+
+    # FastAPI cierra los UploadFile al devolver la respuesta, antes de enviar el cuerpo:
+    # se vuelcan a disco ahora y el resto del proceso lee de ahí
+    spooled = []
+    try:
+        for file in files:
+            try:
+                spooled.append((file.filename, *await _spool_upload(file), None))
+            except HTTPException as e:
+                spooled.append((file.filename, None, None, e))
+    except BaseException:
+        _remove_spooled(spooled)
+        raise
+    return StreamingResponse(
+        _stream_results(spooled, profile, progress, debug, format),
+        media_type=STREAM_FORMATS[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _remove_spooled(spooled: list[tuple]) -> None:
+    for _, path, _, _ in spooled:
+        if path is not None:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def _encode_event(event: dict, fmt: str) -> bytes:
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    if fmt == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n".encode()
+    return (data + "\n").encode()
+
+
+async def _stream_results(spooled: list[tuple], profile: str | None, progress: bool, debug: bool, fmt: str):
+    """Events ``result`` / ``error`` per file in completion order, ``progress`` per stage, then ``done``."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    semaphore = asyncio.Semaphore(MAX_FILES_IN_FLIGHT)
+
+    def emit(event: dict):
+        # las etapas en hilos del pool avisan desde esos hilos: todo pasa por el loop, en orden
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    async def run(index: int, filename: str, path: str, digest: str):
+        def on_stage(stage: str, seconds: float | None):
+            if stage in PROGRESS_STAGES:
+                event = {"event": "progress", "index": index, "filename": filename, "stage": stage,
+                         "status": "started" if seconds is None else "finished"}
+                if seconds is not None:
+                    event["seconds"] = round(seconds, 4)
+                emit(event)
+
+        try:
+            async with semaphore:
+                with listen_stages(on_stage) if progress else nullcontext():
+                    result = await process_file(path, filename=filename, profile=profile,
+                                                content_hash=digest, debug=debug)
+            emit({"event": "result", "index": index, **result})
+        except Exception as e:
+            emit({"event": "error", "index": index, **_error_entry(filename, e)})
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+    tasks = []
+    for index, (filename, path, digest, error) in enumerate(spooled):
+        if error is not None:
+            emit({"event": "error", "index": index, **_error_entry(filename, error)})
+        else:
+            tasks.append(asyncio.create_task(run(index, filename, path, digest)))
+
+    remaining, errors = len(spooled), 0
+    try:
+        while remaining:
+            event = await events.get()
+            if event["event"] != "progress":
+                remaining -= 1
+                errors += event["event"] == "error"
+            yield _encode_event(event, fmt)
+        yield _encode_event({"event": "done", "files": len(spooled), "errors": errors}, fmt)
+    finally:
+        # cliente desconectado: no seguir con OCR/LLM de nadie
+        for task in tasks:
+            task.cancel()
+        _remove_spooled(spooled)
+
+
+async def process_stored_file(path: str, filename: str, profile: str | None = None) -> dict:
+    """process_file for a file already on disk (job queue); errors become a per-file entry."""
+    try:
+        return await process_file(path, filename=filename, profile=profile)
+    except Exception as e:
+        return _error_entry(filename, e)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(files: List[UploadFile] = File(...),
+                     profile: str | None = Form(None),
+                     webhook: str | None = Form(None)):
+    _validate_request(files, profile)
+    # the workers POST to the webhook: only plain http(s) URLs
+    if webhook is not None:
+        url = urlsplit(webhook)
+        if url.scheme not in ("http", "https") or not url.netloc:
+            raise HTTPException(status_code=400, detail=f"Invalid webhook URL: {webhook}")
+
+    # the files stay on disk until a worker has processed them
+    job_id = uuid.uuid4().hex
+    job_dir = Path(JOBS_DIR) / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    stored = []
+    try:
+        for i, file in enumerate(files):
+            path = job_dir / f"{i}_{Path(file.filename).name}"
+            await _save_upload(file, str(path))
+            stored.append({"filename": file.filename, "path": str(path), "profile": profile})
+        await asyncio.to_thread(job_queue.enqueue, stored, webhook, job_id)
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={
+            "error": "JobNotFound",
+            "message": f"Unknown job id: {job_id}",
+        })
+    job.pop("webhook", None)
+    return job
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/healthz")
+async def healthz():
+    # liveness: el proceso y su event loop responden, aunque los modelos sigan cargando
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # readiness: sin warm-up los modelos se cargan con la primera petición
+    ready = registry.loaded and (models.ready or not MODEL_WARMUP)
+    body = {
+        "status": "ready" if ready else ("warming_up" if models.warming else "not_ready"),
+        "models": models.status(),
+        "index_version": registry.current.index_version if registry.loaded else None,
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+@app.post("/admin/reload")
+async def admin_reload(force: bool = False, x_admin_token: str | None = Header(None)):
+    # sin ADMIN_TOKEN los endpoints de administración quedan cerrados
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail={
+            "error": "Forbidden",
+            "message": "Invalid admin token" if ADMIN_TOKEN else "Set ADMIN_TOKEN to enable /admin endpoints",
+        })
+    previous = registry.current.version if registry.loaded else None
+    try:
+        reloaded, snapshot = await asyncio.to_thread(registry.reload, force)
+    except Exception as e:
+        logger_log("Index reload failed", "error", None, "", "registry", e)
+        raise HTTPException(status_code=409, detail={
+            "error": "ReloadFailed",
+            "message": f"Kept version {previous}: {e}",
+        })
+    return {
+        "reloaded": reloaded,
+        "previous_version": previous,
+        "index_version": snapshot.index_version,
+        "schema_version": snapshot.schema_version,
+        "vectors": snapshot.index.ntotal,
+        "loaded_at": snapshot.loaded_at,
+    }
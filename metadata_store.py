@@ -0,0 +1,138 @@
+"""Columnar, memory-mapped metadata of the FAISS reference corpus.
+
+Layout of a store directory (row ``i`` describes vector ``i`` of the index)::
+
+    labels.json         label table: ["email", "invoice", ...]
+    label_ids.npy       int32[n], index into the label table
+    paths.npy           uint8 blob with every path (utf-8, concatenated)
+    paths_offsets.npy   int64[n + 1], row i is blob[offsets[i]:offsets[i + 1]]
+    texts.npy           same for the OCR text of every row (optional)
+    texts_offsets.npy
+
+Arrays are opened with ``mmap_mode="r"``: nothing is copied into the Python
+heap at startup, and the pages are shared through the OS page cache by every
+worker process that maps the same files. Texts are only read when asked for.
+
+    python metadata_store.py metadata.pkl metadata_store   # migrate a pickle
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+LABELS_FILE = "labels.json"
+
+
+def _write_blob(directory: Path, name: str, values: list[str]) -> None:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    np.save(directory / f"{name}.npy", blob)
+    np.save(directory / f"{name}_offsets.npy", offsets)
+
+
+def write_store(directory: str | Path, records: Iterable[dict], with_texts: bool = True) -> Path:
+    """Write ``records`` (``{"label", "path", "text"}`` dicts) as a store.
+
+    The store is written next to ``directory`` and moved into place at the
+    end, so readers never see a half written store.
+    """
+    directory = Path(directory)
+    records = list(records)
+    labels = sorted({r["label"] for r in records})
+    label_to_id = {label: i for i, label in enumerate(labels)}
+
+    tmp = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    (tmp / LABELS_FILE).write_text(json.dumps(labels, ensure_ascii=False))
+    np.save(tmp / "label_ids.npy", np.array([label_to_id[r["label"]] for r in records], dtype=np.int32))
+    _write_blob(tmp, "paths", [str(r["path"]) for r in records])
+    if with_texts:
+        _write_blob(tmp, "texts", [r.get("text") or "" for r in records])
+
+    old = directory.with_name(directory.name + ".old")
+    if directory.exists():
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    return directory
+
+
+class MetadataStore:
+    """Read-only view over a store directory.
+
+    ``store[i]`` returns ``{"label", "path"}`` like the old pickled list did;
+    the OCR text of a row is read on demand with ``store.text(i)``.
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.labels: list[str] = json.loads((self.directory / LABELS_FILE).read_text())
+        self.label_ids = np.load(self.directory / "label_ids.npy", mmap_mode="r")
+        self._paths = self._open_blob("paths")
+        self._texts = self._open_blob("texts") if (self.directory / "texts.npy").exists() else None
+
+    def _open_blob(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        return (np.load(self.directory / f"{name}.npy", mmap_mode="r"),
+                np.load(self.directory / f"{name}_offsets.npy", mmap_mode="r"))
+
+    @staticmethod
+    def _decode(blob: tuple[np.ndarray, np.ndarray], idx: int) -> str:
+        data, offsets = blob
+        return data[offsets[idx]:offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.label_ids)
+
+    def __getitem__(self, idx: int) -> dict:
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return {"label": self.label(idx), "path": self.path(idx)}
+
+    def label(self, idx: int) -> str:
+        return self.labels[self.label_ids[idx]]
+
+    def path(self, idx: int) -> str:
+        return self._decode(self._paths, idx)
+
+    def text(self, idx: int) -> str | None:
+        return None if self._texts is None else self._decode(self._texts, idx)
+
+
+def load_metadata(store_dir: str | Path, pickle_path: str | Path):
+    """The store when ``store_dir`` exists, otherwise the legacy pickled list."""
+    if (Path(store_dir) / LABELS_FILE).exists():
+        return MetadataStore(store_dir)
+    with open(pickle_path, "rb") as f:
+        return pickle.load(f)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Convert a pickled metadata list into a metadata store.")
+    parser.add_argument("pickle_path", type=Path, nargs="?", default=Path("metadata.pkl"))
+    parser.add_argument("store_dir", type=Path, nargs="?", default=Path("metadata_store"))
+    parser.add_argument("--no-texts", action="store_true",
+                        help="drop the OCR texts (only labels and paths are needed to classify)")
+    args = parser.parse_args(argv)
+
+    with open(args.pickle_path, "rb") as f:
+        records = pickle.load(f)
+    write_store(args.store_dir, records, with_texts=not args.no_texts)
+    print(f"{len(records)} rows, {len({r['label'] for r in records})} labels -> {args.store_dir}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.samples import Sample
+
+# con varios workers (gunicorn) cada proceso escribe sus métricas en este directorio y /metrics
+# las agrega todas; tiene que existir, vacío, antes de arrancar (gunicorn.conf.py lo limpia)
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# stage: ocr, classify, llm and their inner steps (text_layer, rasterize, preprocess,
+# readtext, page, embedding, faiss_search, ...)
+STAGE_SECONDS = Histogram("idu_stage_seconds", "Latency of each pipeline stage", ["stage"],
+                          buckets=LATENCY_BUCKETS)
+# livesum: suma de los workers vivos (multiproceso); sin efecto en un solo proceso
+INFLIGHT = Gauge("idu_inflight", "Calls currently running per pool", ["pool"], multiprocess_mode="livesum")
+QUEUE_DEPTH = Gauge("idu_queue_depth", "Work waiting for a slot per pool", ["pool"], multiprocess_mode="livesum")
+
+CLASSIFY_BATCH_SIZE = Histogram("idu_classify_batch_size", "Documents per classifier batch",
+                                buckets=(1, 2, 4, 8, 16, 32, 64))
+CLASSIFY_BATCH_FILL = Histogram("idu_classify_batch_fill", "Batch size / max batch size",
+                                buckets=(0.1, 0.25, 0.5, 0.75, 1.0))
+CLASSIFY_QUEUE_DELAY = Histogram("idu_classify_queue_delay_seconds",
+                                 "Time a document waits for its classifier batch",
+                                 buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+
+CACHE_LOOKUPS = Counter("idu_cache_lookups_total", "Result cache lookups", ["stage", "result"])
+LLM_TTFT = Histogram("idu_llm_ttft_seconds", "Ollama time to first token", buckets=LATENCY_BUCKETS)
+LLM_TIER_SECONDS = Histogram("idu_llm_tier_seconds", "Extraction latency per model of the cascade", ["model"],
+                             buckets=LATENCY_BUCKETS)
+LLM_TIER_CALLS = Counter("idu_llm_tier_calls_total", "Extractions run per model of the cascade",
+                         ["doc_type", "model"])
+LLM_ESCALATIONS = Counter("idu_llm_escalations_total", "Answers passed on to the next model of the cascade",
+                          ["doc_type", "model", "reason"])
+# llm: full (every field asked) | partial (only what the rules missed) | skipped (rules covered all)
+LLM_CALLS = Counter("idu_llm_calls_total", "Extractions by how much of the schema went to the LLM",
+                    ["doc_type", "llm"])
+RULE_FIELDS = Counter("idu_rule_fields_total", "Fields filled by the deterministic extractors", ["doc_type"])
+LLM_TOKENS_SAVED = Counter("idu_llm_tokens_saved_total",
+                           "Estimated prompt + completion tokens not sent to the LLM thanks to the rules",
+                           ["doc_type"])
+
+# tiempos por etapa de la petición en curso (para la respuesta con debug=true)
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+# callback(stage, seconds) de la petición en curso: seconds es None al empezar la etapa
+_stage_listener: ContextVar = ContextVar("stage_listener", default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stage timings recorded by this task (and the threads it runs on)."""
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def listen_stages(callback):
+    """Call ``callback(stage, None)`` when a stage of this task starts, ``callback(stage, seconds)`` when it ends.
+
+    Stages that run in pool threads call it from those threads.
+    """
+    token = _stage_listener.set(callback)
+    try:
+        yield
+    finally:
+        _stage_listener.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    listener = _stage_listener.get()
+    if listener is not None:
+        listener(stage, None)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+        if listener is not None:
+            listener(stage, elapsed)
+
+
+@contextmanager
+def track_pool(pool: str):
+    """In-flight gauge of a pool for the duration of the block."""
+    INFLIGHT.labels(pool).inc()
+    try:
+        yield
+    finally:
+        INFLIGHT.labels(pool).dec()
+
+
+def observe_batch(size: int, fill: float, delays: list[float]) -> None:
+    CLASSIFY_BATCH_SIZE.observe(size)
+    CLASSIFY_BATCH_FILL.observe(fill)
+    for delay in delays:
+        CLASSIFY_QUEUE_DELAY.observe(delay)
+
+
+# (gauge, labels, fn) evaluated at scrape time in multiprocess mode
+_live_gauges: list[tuple[Gauge, dict, object]] = []
+
+
+def live_gauge(gauge: Gauge, fn, **labels) -> None:
+    """Gauge computed by ``fn()`` at scrape time.
+
+    Only for host-wide values that any worker can compute (e.g. the SQLite
+    job queue): in multiprocess mode the scraped worker reports it once,
+    instead of summing every worker's copy. Per-process values use inc/dec.
+    """
+    if MULTIPROCESS:
+        _live_gauges.append((gauge, labels, fn))
+    else:
+        gauge.labels(**labels).set_function(fn)
+
+
+class _HostCollector:
+    """Every worker's metrics from PROMETHEUS_MULTIPROC_DIR plus the live gauges."""
+
+    def collect(self):
+        from prometheus_client import multiprocess
+
+        live = {}
+        for gauge, labels, fn in _live_gauges:
+            live.setdefault(gauge.describe()[0].name, []).append((labels, float(fn())))
+        for family in multiprocess.MultiProcessCollector(None).collect():
+            if family.name in live:
+                replaced = [labels for labels, _ in live[family.name]]
+                family.samples = [s for s in family.samples if s.labels not in replaced] + [
+                    Sample(family.name, labels, value) for labels, value in live[family.name]]
+            yield family
+
+
+def render() -> tuple[bytes, str]:
+    if not MULTIPROCESS:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    registry.register(_HostCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,100 @@
+"""Lazily constructed, process-wide ML models (EasyOCR reader, embedding model).
+
+Importing the API no longer builds any model: each one is created on first
+use, or up front by ``models.warm_up()`` (FastAPI lifespan, or the gunicorn
+master with ``preload_app`` so forked workers share the weights
+copy-on-write). ``/readyz`` reports ``models.ready``.
+"""
+import os
+import threading
+import time
+
+from logging_setup import logger
+
+# al arrancar: cargar los modelos y hacer una inferencia de prueba antes de declararse listo
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+
+class LazyModel:
+    """Proxy that builds the model with ``factory()`` the first time it is used."""
+
+    def __init__(self, name: str, factory, warmup=None):
+        self.__dict__.update(
+            _name=name, _factory=factory, _warmup=warmup, _model=None,
+            _lock=threading.Lock(), load_seconds=None, warm=False, error=None,
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    t0 = time.perf_counter()
+                    try:
+                        model = self._factory()
+                    except Exception as e:
+                        self.__dict__["error"] = str(e)
+                        raise
+                    self.__dict__.update(_model=model, error=None,
+                                         load_seconds=time.perf_counter() - t0)
+                    logger.info("Model loaded", extra={"phase": "models", "model": self._name,
+                                                       "load_seconds": self.load_seconds})
+        return self._model
+
+    def warm_up(self) -> None:
+        """Load the model and run one tiny inference (allocates buffers, initializes kernels)."""
+        model = self.get()
+        if self._warmup is not None and not self.warm:
+            self._warmup(model)
+        self.__dict__["warm"] = True
+
+    def __getattr__(self, attr):
+        # sólo se llama para lo que no está en el proxy: se delega al modelo real. Lo privado
+        # no: mock/copy/pickle lo consultan (hasattr(obj, "__func__"), "_is_coroutine") y
+        # cargarían el modelo
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"<LazyModel {self._name} loaded={self.loaded}>"
+
+
+class ModelManager:
+    def __init__(self):
+        self._models: dict[str, LazyModel] = {}
+        self.warming = False
+
+    def register(self, name: str, factory, warmup=None) -> LazyModel:
+        model = LazyModel(name, factory, warmup)
+        self._models[name] = model
+        return model
+
+    def load_all(self) -> None:
+        """Construct every model without running inference (safe before forking workers)."""
+        for model in self._models.values():
+            model.get()
+
+    def warm_up(self) -> None:
+        self.warming = True
+        try:
+            for model in self._models.values():
+                model.warm_up()
+        finally:
+            self.warming = False
+
+    @property
+    def ready(self) -> bool:
+        return all(model.warm for model in self._models.values())
+
+    def status(self) -> dict:
+        return {
+            name: {"loaded": m.loaded, "warm": m.warm, "load_seconds": m.load_seconds, "error": m.error}
+            for name, m in self._models.items()
+        }
+
+
+models = ModelManager()
@@ -2,60 +2,217 @@ from pathlib import Path
 import numpy as np
 from PIL import Image
 import cv2 
-import easyocr
 import pdfplumber
-from typing import Union
-from tempfile import TemporaryDirectory
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+from preprocessing import (OCR_MAX_PIXELS, OCR_TARGET_TEXT_PX, ImageSource, estimate_text_height, load_gray,
+                           preprocess_image)
+from metrics import INFLIGHT, stage_timer
+from models import models
 
-#load the model
-reader = easyocr.Reader(['es', 'en'], gpu=False)
 
-def ocr_image(path: Path) -> str:
-    pre = preprocess_image(path)          # <─ nuevo paso 🔹
-    results = reader.readtext(pre, detail=0, paragraph=True)
+def _load_reader():
+    # import diferido: easyocr importa torch; el Reader carga sus pesos al construirse
+    import easyocr
+    return easyocr.Reader(['es', 'en'], gpu=False)
+
+
+#load the model: lazily, on first readtext or at warm-up
+reader = models.register("ocr_reader", _load_reader,
+                         warmup=lambda r: r.readtext(np.full((32, 64), 255, np.uint8), detail=0))
+
+# resolución de las páginas escaneadas: la mínima que deja el texto a OCR_TARGET_TEXT_PX,
+# entre PDF_MIN_DPI y PDF_DPI, estimada sobre un render barato a PDF_PROBE_DPI
+PDF_DPI = int(os.getenv("PDF_DPI", "300"))
+PDF_MIN_DPI = int(os.getenv("PDF_MIN_DPI", "150"))
+PDF_PROBE_DPI = 72
+# EasyOCR: lado máximo de la imagen de detección, ampliación previa y líneas reconocidas por lote
+READTEXT_OPTIONS = {
+    "canvas_size": int(os.getenv("OCR_CANVAS_SIZE", "2560")),
+    "mag_ratio": float(os.getenv("OCR_MAG_RATIO", "1.0")),
+    "batch_size": int(os.getenv("OCR_BATCH_SIZE", "1")),
+}
+# born-digital pages skip OCR when their text layer has enough words
+TEXT_LAYER_ENABLED = os.getenv("PDF_TEXT_LAYER", "1") == "1"
+MIN_TEXT_LAYER_WORDS = int(os.getenv("PDF_TEXT_LAYER_MIN_WORDS", "10"))
+# una página cubierta por una imagen (escaneo) sólo se salta el OCR si las palabras de la capa
+# de texto ocupan al menos esta fracción de la imagen: una cabecera, un pie o un sello digital
+# sobre un escaneo no son el documento
+SCAN_IMAGE_MIN_COVER = 0.5
+MIN_TEXT_LAYER_COVERAGE = float(os.getenv("PDF_TEXT_LAYER_MIN_COVERAGE", "0.05"))
+# forma parte de la clave de caché del texto OCR: otra resolución u otra decisión capa de texto/OCR,
+# otro texto
+OCR_SETTINGS = (f"text{OCR_TARGET_TEXT_PX:g}/max{OCR_MAX_PIXELS}/dpi{PDF_MIN_DPI}-{PDF_DPI}/"
+                + "/".join(f"{k}{v}" for k, v in READTEXT_OPTIONS.items())
+                + (f"/layer{MIN_TEXT_LAYER_WORDS}-{MIN_TEXT_LAYER_COVERAGE:g}" if TEXT_LAYER_ENABLED else "/layer0"))
+# OCR de páginas en paralelo: cada proceso del pool tiene su propio Reader (0/1 = serie)
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", "0"))
+OCR_MAX_PAGES_IN_FLIGHT = int(os.getenv("OCR_MAX_PAGES_IN_FLIGHT", "0"))  # 0 => 2 × workers
+
+_page_pool = None
+_page_pool_workers = 0
+_page_pool_lock = threading.Lock()
+
+
+def ocr_image(source: ImageSource, profile: str | None = None) -> str:
+    with stage_timer("preprocess"):
+        pre = preprocess_image(source, profile)          # <─ nuevo paso 🔹
+    with stage_timer("readtext"):
+        results = reader.readtext(pre, detail=0, paragraph=True, **READTEXT_OPTIONS)
     return "\n".join(results)
 
-def ocr_pdf(path: Path) -> str:
-    with TemporaryDirectory() as tmpdir:
-        pages_text = []
+
+def _area(box: dict) -> float:
+    return max(0.0, box["x1"] - box["x0"]) * max(0.0, box["bottom"] - box["top"])
+
+
+def text_layer_coverage(page, words: list[dict]) -> float | None:
+    """Area of the text-layer words over the area of the page's images.
+
+    ``None`` when images cover less than ``SCAN_IMAGE_MIN_COVER`` of the page
+    (not a scan: the text layer is all there is).
+    """
+    page_area = (getattr(page, "width", 0) or 0) * (getattr(page, "height", 0) or 0)
+    image_area = min(sum(_area(im) for im in getattr(page, "images", None) or []), page_area)
+    if not page_area or image_area < SCAN_IMAGE_MIN_COVER * page_area:
+        return None
+    return sum(_area(w) for w in words) / image_area
+
+
+def page_text_layer(page, min_words: int = MIN_TEXT_LAYER_WORDS,
+                    min_coverage: float = MIN_TEXT_LAYER_COVERAGE) -> str:
+    """Native text of a born-digital page, or "" when the page needs OCR."""
+    words = page.extract_words()
+    if len(words) < min_words:
+        return ""
+    coverage = text_layer_coverage(page, words)
+    if coverage is not None and coverage < min_coverage:
+        return ""
+    text = (page.extract_text() or "").strip()
+    # capas de texto basura (fuentes sin mapa unicode, OCR previo roto) => mejor OCR
+    chars = [ch for ch in text if not ch.isspace()]
+    if not chars or sum(ch.isalnum() for ch in chars) < 0.5 * len(chars):
+        return ""
+    return text
+
+
+def rasterize_page(page, resolution: int | None = None) -> np.ndarray:
+    # rasterizar la página directo a numpy en gris; por defecto a la resolución de pick_dpi
+    img = page.to_image(resolution=resolution or pick_dpi(page)).original
+    return np.asarray(img.convert("L"))
+
+
+def pick_dpi(page) -> int:
+    """Lowest DPI that renders the page text at ``OCR_TARGET_TEXT_PX``, capped by page size."""
+    dpi = PDF_DPI
+    width, height = getattr(page, "width", None), getattr(page, "height", None)
+    if OCR_MAX_PIXELS and width and height:
+        # tamaño de página en puntos (1/72 in)
+        dpi = min(dpi, int((OCR_MAX_PIXELS / (width / 72 * height / 72)) ** 0.5))
+    if OCR_TARGET_TEXT_PX:
+        text_px = estimate_text_height(rasterize_page(page, PDF_PROBE_DPI))
+        if text_px is not None:
+            dpi = min(dpi, max(PDF_MIN_DPI, int(PDF_PROBE_DPI * OCR_TARGET_TEXT_PX / text_px)))
+    return dpi
+
+
+def _init_page_worker():
+    # cada proceso hijo carga su propio Reader al arrancar, no con la primera página;
+    # un hilo por worker para no sobre-suscribir la CPU entre procesos
+    import torch
+    cv2.setNumThreads(1)
+    torch.set_num_threads(1)
+    reader.get()
+
+
+def get_page_pool(workers: int) -> ProcessPoolExecutor:
+    global _page_pool, _page_pool_workers
+    with _page_pool_lock:
+        if _page_pool is not None and _page_pool_workers != workers:
+            # otro tamaño: pool nuevo; el viejo termina las páginas que ya tiene y se cierra
+            _page_pool.shutdown(wait=False)
+            _page_pool = None
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_page_worker,
+            )
+            _page_pool_workers = workers
+        return _page_pool
+
+
+def shutdown_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=True, cancel_futures=True)
+            _page_pool = None
+
+
+def iter_pdf_pages(path: Path, use_text_layer: bool = TEXT_LAYER_ENABLED,
+                   workers: int = OCR_PAGE_WORKERS,
+                   max_in_flight: int = OCR_MAX_PAGES_IN_FLIGHT,
+                   profile: str | None = None):
+    """Yield ``{"page", "source", "text"}`` per page, in page order.
+
+    ``source`` is "text" when the native text layer was used and "ocr" when
+    the page had to be rasterized and read with EasyOCR. With ``workers > 1``
+    the OCR of up to ``max_in_flight`` pages runs in the page process pool.
+    """
+    pool = get_page_pool(workers) if workers > 1 else None
+    limit = (max_in_flight or 2 * workers) if pool else 0
+    pending = deque()   # (page, source, text | Future), in page order
+    try:
         with pdfplumber.open(str(path)) as pdf:
             for i, page in enumerate(pdf.pages, 1):
-                # rasterizar cada página a 300 dpi (~ buena para OCR)
-                img = page.to_image(resolution=300).original
-                img_path = Path(tmpdir) / f"page_{i}.png"
-                img.save(img_path)
-                pages_text.append(ocr_image(img_path))
-        return "\n".join(pages_text).strip()
-
-
-def preprocess_image(path: Union[str, Path]) -> np.ndarray:
-    # --- 1. Leer y a gris ---
-    img_gray = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
-
-    # --- 2. Suavizado / eliminación de ruido ---
-    denoised = cv2.fastNlMeansDenoising(img_gray, h=15, templateWindowSize=7,
-                                        searchWindowSize=21)
-
-    # --- 3. Binarización adaptativa ---
-    bin_img = cv2.adaptiveThreshold(
-        denoised, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
-        blockSize=31,   # cuanto más grande, más contexto usa
-        C=10            # constante que ajusta el umbral
-    )
-
-    # --- 4. Deskew ---
-    coords = np.column_stack(np.where(bin_img == 0))
-    angle = cv2.minAreaRect(coords)[-1]
-    # cv2 devuelve ángulos en (-90, 0]; convertimos a [-45, 45]
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
-
-    h, w = bin_img.shape
-    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-    deskewed = cv2.warpAffine(bin_img, M, (w, h),
-                              flags=cv2.INTER_CUBIC,
-                              borderMode=cv2.BORDER_REPLICATE)
-    return deskewed
+                with stage_timer("text_layer"):
+                    text = page_text_layer(page) if use_text_layer else ""
+                if text:
+                    pending.append((i, "text", text))
+                else:
+                    with stage_timer("rasterize"):
+                        img = rasterize_page(page)
+                    if pool:
+                        pending.append((i, "ocr", _submit_page(pool, img, profile)))
+                    else:
+                        with stage_timer("ocr_page"):
+                            pending.append((i, "ocr", ocr_image(img, profile)))
+                # libera los objetos ya parseados antes de pasar a la siguiente página
+                if hasattr(page, "close"):
+                    page.close()
+                while len(pending) > limit:
+                    yield _page_result(*pending.popleft())
+        while pending:
+            yield _page_result(*pending.popleft())
+    finally:
+        for _, _, item in pending:
+            if isinstance(item, Future):
+                item.cancel()
+
+
+def _submit_page(pool: ProcessPoolExecutor, img: np.ndarray, profile: str | None) -> Future:
+    # los timers del proceso hijo no llegan aquí: el gauge cuenta las páginas en el pool
+    INFLIGHT.labels("ocr_pages").inc()
+    future = pool.submit(ocr_image, img, profile)
+    future.add_done_callback(lambda _: INFLIGHT.labels("ocr_pages").dec())
+    return future
+
+
+def _page_result(page: int, source: str, item) -> dict:
+    text = item.result() if isinstance(item, Future) else item
+    return {"page": page, "source": source, "text": text}
+
+
+def ocr_pdf_pages(path: Path, use_text_layer: bool = TEXT_LAYER_ENABLED,
+                  workers: int = OCR_PAGE_WORKERS, profile: str | None = None) -> list[dict]:
+    return list(iter_pdf_pages(path, use_text_layer, workers, profile=profile))
+
+
+def ocr_pdf(path: Path, use_text_layer: bool = TEXT_LAYER_ENABLED,
+            workers: int = OCR_PAGE_WORKERS, profile: str | None = None) -> str:
+    pages = ocr_pdf_pages(path, use_text_layer, workers, profile)
+    return "\n".join(p["text"] for p in pages).strip()
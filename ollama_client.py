@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import random
+import time
+import weakref
+from dataclasses import dataclass
+
+import httpx
+
+from metrics import LLM_TTFT, QUEUE_DEPTH, track_pool
+
+OLLAMA_API = os.getenv("OLLAMA_API", "http://localhost:11434/api/chat")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))   # max silence between chunks
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "0.5"))             # seconds, doubles per retry
+# debe coincidir con OLLAMA_NUM_PARALLEL del servidor: más peticiones sólo hacen cola allí
+OLLAMA_PARALLEL = int(os.getenv("OLLAMA_PARALLEL", "4"))
+OLLAMA_MAX_GENERATION_SECONDS = float(os.getenv("OLLAMA_MAX_GENERATION_SECONDS", "0"))  # 0 = no limit
+
+
+class OllamaError(Exception):
+    pass
+
+
+@dataclass
+class ChatResult:
+    content: str
+    ttft: float | None         # time to first token (streaming only)
+    total: float               # wall time of the successful attempt
+    attempts: int
+    truncated: bool = False    # generation cut off by max_generation_seconds
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+class OllamaClient:
+    """Keep-alive async client for Ollama's ``/api/chat``.
+
+    Connections are pooled, every call is bounded by connect/read timeouts,
+    transport errors and 5xx answers are retried with exponential backoff,
+    and at most ``parallel`` requests are sent at once.
+    """
+
+    def __init__(self, url: str = OLLAMA_API, parallel: int = OLLAMA_PARALLEL,
+                 retries: int = OLLAMA_RETRIES, backoff: float = OLLAMA_BACKOFF,
+                 connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout: float = OLLAMA_READ_TIMEOUT,
+                 max_generation_seconds: float = OLLAMA_MAX_GENERATION_SECONDS,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        self.url = url
+        self.parallel = parallel
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_generation_seconds = max_generation_seconds
+        self.transport = transport
+        # httpx pools and asyncio semaphores belong to one event loop
+        self._per_loop = weakref.WeakKeyDictionary()
+
+    def _state(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._per_loop:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.parallel,
+                                    max_keepalive_connections=self.parallel),
+                transport=self.transport,
+            )
+            self._per_loop[loop] = (client, asyncio.Semaphore(self.parallel))
+        return self._per_loop[loop]
+
+    async def chat(self, payload: dict) -> ChatResult:
+        client, semaphore = self._state()
+        QUEUE_DEPTH.labels("ollama").inc()
+        try:
+            await semaphore.acquire()
+        finally:
+            QUEUE_DEPTH.labels("ollama").dec()
+        try:
+            with track_pool("ollama"):
+                return await self._chat(client, payload)
+        finally:
+            semaphore.release()
+
+    async def _chat(self, client: httpx.AsyncClient, payload: dict) -> ChatResult:
+        for attempt in range(1, self.retries + 2):
+            try:
+                if payload.get("stream"):
+                    result = await self._stream(client, payload)
+                else:
+                    result = await self._once(client, payload)
+                result.attempts = attempt
+                if result.ttft is not None:
+                    LLM_TTFT.observe(result.ttft)
+                return result
+            except (httpx.TransportError, _RetryableStatus) as e:
+                if attempt > self.retries:
+                    raise OllamaError(f"Ollama unavailable after {attempt} attempts: {e}") from e
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 10))
+
+    @staticmethod
+    def _check_status(resp: httpx.Response):
+        if resp.status_code >= 500:
+            raise _RetryableStatus(f"HTTP {resp.status_code}")
+        if resp.status_code >= 400:
+            raise OllamaError(f"Ollama rejected the request: HTTP {resp.status_code}")
+
+    async def _once(self, client: httpx.AsyncClient, payload: dict) -> ChatResult:
+        t0 = time.perf_counter()
+        resp = await client.post(self.url, json=payload)
+        self._check_status(resp)
+        data = resp.json()
+        return ChatResult(
+            content=data["message"]["content"],
+            ttft=None,
+            total=time.perf_counter() - t0,
+            attempts=1,
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+        )
+
+    async def _stream(self, client: httpx.AsyncClient, payload: dict) -> ChatResult:
+        t0 = time.perf_counter()
+        parts, ttft, truncated, last = [], None, False, {}
+        async with client.stream("POST", self.url, json=payload) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+            self._check_status(resp)
+            async for line in resp.aiter_lines():
+                if not line.strip():
+                    continue
+                last = json.loads(line)
+                if "error" in last:
+                    raise OllamaError(last["error"])
+                piece = last.get("message", {}).get("content", "")
+                if piece:
+                    ttft = ttft if ttft is not None else time.perf_counter() - t0
+                    parts.append(piece)
+                if last.get("done"):
+                    break
+                # cerrar el stream aborta la generación en el servidor
+                if self.max_generation_seconds and time.perf_counter() - t0 > self.max_generation_seconds:
+                    truncated = True
+                    break
+        return ChatResult(
+            content="".join(parts),
+            ttft=ttft,
+            total=time.perf_counter() - t0,
+            attempts=1,
+            truncated=truncated,
+            prompt_tokens=last.get("prompt_eval_count"),
+            completion_tokens=last.get("eval_count"),
+        )
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        state = self._per_loop.pop(loop, None)
+        if state is not None:
+            await state[0].aclose()
+
+
+client = OllamaClient()
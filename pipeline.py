@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from metrics import QUEUE_DEPTH, track_pool
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+# Per-stage pool configuration.
+#   kind        -> "thread", "process" or None (no pool: the stage is async I/O)
+#   workers     -> size of the pool
+#   concurrency -> max calls of that stage in flight at the same time
+STAGES = {
+    "ocr": {
+        "kind": os.getenv("OCR_EXECUTOR", "thread"),
+        "workers": _env_int("OCR_WORKERS", os.cpu_count() or 1),
+    },
+    "classify": {
+        "kind": os.getenv("CLASSIFY_EXECUTOR", "thread"),
+        # threads mostly wait on the classifier micro-batcher, size it like a batch
+        "workers": _env_int("CLASSIFY_WORKERS", 16),
+    },
+    "llm": {
+        "kind": None,   # async HTTP, only the concurrency limit applies
+        "workers": _env_int("LLM_CONCURRENCY", 4),
+    },
+}
+for _name, _cfg in STAGES.items():
+    _cfg["concurrency"] = _env_int(f"{_name.upper()}_CONCURRENCY", _cfg["workers"])
+
+
+class PipelineExecutor:
+    """Runs the blocking stages of the pipeline off the event loop.
+
+    Every stage gets its own pool and its own concurrency limit, so a burst of
+    OCR work can not starve classification or the LLM calls.
+    """
+
+    def __init__(self, stages: dict):
+        self.stages = stages
+        self._executors: dict[str, Executor] = {}
+        # asyncio primitives are bound to a loop, keep one set per running loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _executor(self, stage: str) -> Executor:
+        if stage not in self._executors:
+            cfg = self.stages[stage]
+            if cfg["kind"] == "process":
+                # spawn: forking a process that already holds torch threads can deadlock
+                self._executors[stage] = ProcessPoolExecutor(
+                    max_workers=cfg["workers"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executors[stage] = ThreadPoolExecutor(
+                    max_workers=cfg["workers"], thread_name_prefix=f"{stage}-stage"
+                )
+        return self._executors[stage]
+
+    def _semaphore(self, stage: str) -> asyncio.Semaphore:
+        per_loop = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if stage not in per_loop:
+            per_loop[stage] = asyncio.Semaphore(self.stages[stage]["concurrency"])
+        return per_loop[stage]
+
+    @asynccontextmanager
+    async def limit(self, stage: str):
+        semaphore = self._semaphore(stage)
+        QUEUE_DEPTH.labels(stage).inc()
+        try:
+            await semaphore.acquire()
+        finally:
+            QUEUE_DEPTH.labels(stage).dec()
+        try:
+            with track_pool(stage):
+                yield
+        finally:
+            semaphore.release()
+
+    async def run(self, stage: str, fn, *args, **kwargs):
+        async with self.limit(stage):
+            loop = asyncio.get_running_loop()
+            call = partial(fn, *args, **kwargs)
+            if not isinstance(self._executor(stage), ProcessPoolExecutor):
+                # threads see the request context, so their stage timers land in the response
+                call = partial(contextvars.copy_context().run, call)
+            return await loop.run_in_executor(self._executor(stage), call)
+
+    async def stream(self, stage: str, fn, *args, **kwargs):
+        """Async-iterate the blocking generator ``fn(*args, **kwargs)`` run in the stage pool.
+
+        Items arrive as the generator yields them, so the caller can start on
+        the first ones while the pool thread keeps producing. Use it under
+        ``contextlib.aclosing`` so an early exit stops the generator.
+        """
+        if isinstance(self._executor(stage), ProcessPoolExecutor):
+            # un generador no cruza procesos: llega la lista entera al final
+            for item in await self.run(stage, _collect, fn, *args, **kwargs):
+                yield item
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def produce():
+            gen = fn(*args, **kwargs)
+            try:
+                for item in gen:
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+                    if stop.is_set():
+                        break
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (end, e))
+            else:
+                loop.call_soon_threadsafe(queue.put_nowait, (end, None))
+            finally:
+                gen.close()
+
+        async with self.limit(stage):
+            loop.run_in_executor(self._executor(stage), contextvars.copy_context().run, produce)
+            try:
+                while True:
+                    item, error = await queue.get()
+                    if item is end:
+                        if error is not None:
+                            raise error
+                        break
+                    yield item
+            finally:
+                # el hilo termina la página en curso y cierra el generador
+                stop.set()
+
+    def shutdown(self, wait: bool = True):
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+        self._executors.clear()
+
+
+def _collect(fn, *args, **kwargs) -> list:
+    return list(fn(*args, **kwargs))
+
+
+executor = PipelineExecutor(STAGES)
@@ -0,0 +1,156 @@
+from pathlib import Path
+from typing import Union
+import os
+
+import cv2
+import numpy as np
+
+ImageSource = Union[str, Path, bytes, np.ndarray]
+
+# Perfiles de preprocesado, del más barato al más fiel.
+#   denoise        -> kwargs de cv2.fastNlMeansDenoising, "median" o None
+#   skew_max_side  -> la inclinación se estima sobre una copia reducida a este lado (None = original)
+#   min_skew       -> por debajo de este ángulo (grados) no se rota la imagen
+PROFILES = {
+    "fast": {
+        "denoise": "median",
+        "skew_max_side": 800,
+        "min_skew": 0.5,
+    },
+    "balanced": {
+        "denoise": {"h": 15, "templateWindowSize": 7, "searchWindowSize": 11},
+        "skew_max_side": 1600,
+        "min_skew": 0.1,
+    },
+    "quality": {
+        "denoise": {"h": 15, "templateWindowSize": 7, "searchWindowSize": 21},
+        "skew_max_side": None,
+        "min_skew": 0.0,
+    },
+}
+DEFAULT_PROFILE = os.getenv("PREPROCESS_PROFILE", "quality")
+
+# Política de resolución: el coste de denoise y EasyOCR crece con los píxeles.
+# Se reduce la imagen hasta que el texto mide ~OCR_TARGET_TEXT_PX (mediana de la altura de
+# los caracteres, 0 = no estimar) y nunca pasa de OCR_MAX_PIXELS (0 = sin tope). Nunca se amplía.
+# Desactivado por defecto: la precisión de EasyOCR con cada altura no está medida todavía
+# (benchmarks/bench_resolution.py con los modelos reales antes de activarlo).
+OCR_TARGET_TEXT_PX = float(os.getenv("OCR_TARGET_TEXT_PX", "0"))
+OCR_MAX_PIXELS = int(float(os.getenv("OCR_MAX_PIXELS", "1e7")))
+# la altura del texto se estima sobre una copia reducida a este lado
+TEXT_HEIGHT_MAX_SIDE = 2000
+MIN_TEXT_COMPONENTS = 20
+
+
+def load_gray(source: ImageSource) -> np.ndarray:
+    """Grayscale uint8 array from a path, encoded image bytes or a decoded array."""
+    if isinstance(source, np.ndarray):
+        img = source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_RGB2GRAY)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    else:
+        img = cv2.imread(str(source), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def estimate_text_height(img_gray: np.ndarray) -> float | None:
+    """Median height in pixels of the character-like blobs, None if there are too few."""
+    h, w = img_gray.shape
+    scale = min(1.0, TEXT_HEIGHT_MAX_SIDE / max(h, w))
+    if scale < 1.0:
+        img_gray = cv2.resize(img_gray, (max(1, int(w * scale)), max(1, int(h * scale))),
+                              interpolation=cv2.INTER_AREA)
+    _, bin_inv = cv2.threshold(img_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(bin_inv, connectivity=8)
+    widths, heights, areas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    # ni motas ni líneas, tablas o fotos: bloques con proporciones de letra
+    glyphs = heights[(heights >= 4) & (heights <= img_gray.shape[0] / 10) & (widths <= 3 * heights)
+                     & (areas >= 8)]
+    if len(glyphs) < MIN_TEXT_COMPONENTS:
+        return None
+    return float(np.median(glyphs)) / scale
+
+
+def resolution_scale(img_gray: np.ndarray, target_text_px: float | None = None,
+                     max_pixels: int | None = None) -> float:
+    """Downscale factor (<= 1) of the resolution policy (None => the OCR_* settings)."""
+    target_text_px = OCR_TARGET_TEXT_PX if target_text_px is None else target_text_px
+    max_pixels = OCR_MAX_PIXELS if max_pixels is None else max_pixels
+    h, w = img_gray.shape
+    scale = 1.0
+    if max_pixels and h * w > max_pixels:
+        scale = (max_pixels / (h * w)) ** 0.5
+    if target_text_px:
+        text_px = estimate_text_height(img_gray)
+        if text_px is not None and text_px * scale > target_text_px:
+            scale = target_text_px / text_px
+    return scale
+
+
+def fit_resolution(img_gray: np.ndarray, target_text_px: float | None = None,
+                   max_pixels: int | None = None) -> np.ndarray:
+    scale = resolution_scale(img_gray, target_text_px, max_pixels)
+    if scale >= 0.95:   # no compensa reescalar por un 5%
+        return img_gray
+    h, w = img_gray.shape
+    return cv2.resize(img_gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def estimate_skew(bin_img: np.ndarray, max_side: int | None = None) -> float:
+    """Rotation (degrees) that deskews a binarized page with black text."""
+    h, w = bin_img.shape
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        bin_img = cv2.resize(bin_img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                             interpolation=cv2.INTER_NEAREST)
+
+    # píxeles de texto como (fila, columna), sin construir np.where + column_stack
+    points = cv2.findNonZero(cv2.bitwise_not(bin_img))
+    if points is None or len(points) < 5:
+        return 0.0
+    angle = cv2.minAreaRect(points[:, 0, ::-1].copy())[-1]
+    # cv2 < 4.5 devuelve ángulos en (-90, 0] y cv2 >= 4.5 en (0, 90]; convertimos a [-45, 45]
+    if angle < -45:
+        angle += 90
+    elif angle > 45:
+        angle -= 90
+    return -angle
+
+
+def preprocess_image(source: ImageSource, profile: str | None = None) -> np.ndarray:
+    settings = PROFILES[profile or DEFAULT_PROFILE]
+
+    # --- 1. Leer y a gris, a la resolución mínima que conserva el texto ---
+    img_gray = fit_resolution(load_gray(source))
+
+    # --- 2. Suavizado / eliminación de ruido ---
+    denoise = settings["denoise"]
+    if denoise == "median":
+        denoised = cv2.medianBlur(img_gray, 3)
+    elif denoise:
+        denoised = cv2.fastNlMeansDenoising(img_gray, **denoise)
+    else:
+        denoised = img_gray
+
+    # --- 3. Binarización adaptativa ---
+    bin_img = cv2.adaptiveThreshold(
+        denoised, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+        blockSize=31,   # cuanto más grande, más contexto usa
+        C=10            # constante que ajusta el umbral
+    )
+
+    # --- 4. Deskew ---
+    angle = estimate_skew(bin_img, settings["skew_max_side"])
+    if abs(angle) < settings["min_skew"]:
+        return bin_img
+
+    h, w = bin_img.shape
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    deskewed = cv2.warpAffine(bin_img, M, (w, h),
+                              flags=cv2.INTER_CUBIC,
+                              borderMode=cv2.BORDER_REPLICATE)
+    return deskewed
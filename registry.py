@@ -0,0 +1,253 @@
+"""Versioned snapshots of the classifier index and the extraction schema.
+
+A ``Snapshot`` bundles everything loaded from disk that a rebuild can
+change: FAISS index, metadata, label centroids and ``document_schema.json``.
+``registry.current`` is swapped atomically when the files change (polling
+watcher) or on ``POST /admin/reload``; a request keeps the snapshot it
+started with, so in-flight work finishes on the old version.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from dataclasses import dataclass, field
+
+import faiss
+
+from ann_index import CENTROIDS_PATH, configure_search, load_centroids
+from logging_setup import logger
+from metadata_store import LABELS_FILE, load_metadata
+
+#paths
+INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "vector_index.faiss")
+META_PATH = os.getenv("FAISS_META_PATH", "metadata.pkl")
+# columnar, memory-mapped metadata (python metadata_store.py); metadata.pkl is the fallback
+META_STORE_DIR = os.getenv("META_STORE_DIR", "metadata_store")
+SCHEMA_PATH = pathlib.Path(__file__).with_name("document_schema.json")
+# segundos entre comprobaciones de los ficheros (0 = sólo POST /admin/reload)
+REGISTRY_WATCH_SECONDS = float(os.getenv("REGISTRY_WATCH_SECONDS", "10"))
+# sin snapshot cargado: reintentos en segundo plano, con espera doble tras cada fallo
+REGISTRY_RETRY_SECONDS = 1.0
+REGISTRY_RETRY_MAX_SECONDS = 60.0
+
+
+@dataclass
+class Snapshot:
+    index: faiss.Index
+    metadata: object                       # MetadataStore or the pickled list
+    centroids: tuple | None                # (labels, matrix) or None
+    schema: dict[str, list[str]]
+    index_version: str
+    schema_version: str
+    fingerprint: tuple = field(repr=False)
+    loaded_at: float = field(default_factory=time.time)
+    # per document type LLM routing ({"models", "required", "min_confidence", ...}), see split_schema
+    routing: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def version(self) -> str:
+        return f"{self.index_version}.{self.schema_version}"
+
+
+def _files(index_path, meta_path, store_dir, centroids_path, schema_path) -> list[pathlib.Path]:
+    store = pathlib.Path(store_dir)
+    meta = ([store / LABELS_FILE, store / "label_ids.npy", store / "paths.npy"]
+            if (store / LABELS_FILE).exists() else [pathlib.Path(meta_path)])
+    return [pathlib.Path(index_path), *meta, pathlib.Path(centroids_path), pathlib.Path(schema_path)]
+
+
+def fingerprint(paths: list[pathlib.Path]) -> tuple:
+    """Cheap change detector: (name, size, mtime) of every file."""
+    out = []
+    for path in paths:
+        try:
+            st = path.stat()
+            out.append((str(path), st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            out.append((str(path), None, None))
+    return tuple(out)
+
+
+def _digest(paths: list[pathlib.Path]) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        if path.exists():
+            with path.open("rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def split_schema(raw: dict) -> tuple[dict[str, list[str]], dict[str, dict]]:
+    """Fields and routing per document type.
+
+    An entry is either the list of fields or ``{"fields": [...], "routing": {...}}``.
+    """
+    schema, routing = {}, {}
+    for doc_type, entry in raw.items():
+        if isinstance(entry, dict):
+            schema[doc_type] = entry["fields"]
+            if entry.get("routing"):
+                routing[doc_type] = entry["routing"]
+        else:
+            schema[doc_type] = entry
+    return schema, routing
+
+
+def load_snapshot(index_path=INDEX_PATH, meta_path=META_PATH, store_dir=META_STORE_DIR,
+                  centroids_path=CENTROIDS_PATH, schema_path=SCHEMA_PATH) -> Snapshot:
+    paths = _files(index_path, meta_path, store_dir, centroids_path, schema_path)
+    before = fingerprint(paths)
+    index = configure_search(faiss.read_index(str(index_path)))
+    metadata = load_metadata(store_dir, meta_path)
+    if len(metadata) != index.ntotal:
+        raise ValueError(f"Index has {index.ntotal} vectors but metadata has {len(metadata)} rows")
+    with open(schema_path, encoding="utf-8") as f:
+        schema, routing = split_schema(json.load(f))
+    snapshot = Snapshot(
+        index=index,
+        metadata=metadata,
+        centroids=load_centroids(centroids_path),
+        schema=schema,
+        routing=routing,
+        index_version=_digest(paths[:-1]),
+        # cambia con cualquier edición del schema => invalida las extracciones cacheadas
+        schema_version=hashlib.sha256(pathlib.Path(schema_path).read_bytes()).hexdigest()[:12],
+        fingerprint=before,
+    )
+    if fingerprint(paths) != before:
+        raise ValueError("Index files changed while loading")
+    return snapshot
+
+
+class Registry:
+    """Holds the active ``Snapshot`` and swaps it when the files on disk change."""
+
+    def __init__(self, loader=load_snapshot, paths=None):
+        self.loader = loader
+        self.paths = paths or (lambda: _files(INDEX_PATH, META_PATH, META_STORE_DIR,
+                                              CENTROIDS_PATH, SCHEMA_PATH))
+        # callbacks(snapshot) run after every swap (module aliases, caches, ...)
+        self.subscribers = []
+        self._lock = threading.Lock()
+        self._current: Snapshot | None = None
+        # background loads while nothing is loaded (see load_in_background)
+        self._retry_lock = threading.Lock()
+        self._loading = False
+        self._retry_at = 0.0
+        self._retry_delay = REGISTRY_RETRY_SECONDS
+
+    @property
+    def current(self) -> Snapshot:
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._swap(self.loader())
+        return self._current
+
+    def try_load(self) -> Snapshot | None:
+        """``current``, or None when the files cannot be loaded (yet).
+
+        Used at import time: a half-written or mismatched index must not crash
+        the process. ``/readyz`` reports not ready and the watcher (or
+        ``POST /admin/reload``) retries.
+        """
+        try:
+            return self.current
+        except Exception as e:
+            logger.warning("Index registry load failed", extra={"phase": "registry", "error": str(e)})
+            self._backoff()
+            return None
+
+    def _backoff(self) -> None:
+        with self._retry_lock:
+            self._retry_at = time.monotonic() + self._retry_delay
+            self._retry_delay = min(2 * self._retry_delay, REGISTRY_RETRY_MAX_SECONDS)
+
+    def load_in_background(self) -> bool:
+        """Start loading the snapshot in a thread; never blocks the caller.
+
+        At most one load runs at a time, and after a failure the next one
+        waits (1 s, doubling up to a minute). True when a load was started.
+        """
+        with self._retry_lock:
+            if self.loaded or self._loading or time.monotonic() < self._retry_at:
+                return False
+            self._loading = True
+        threading.Thread(target=self._load_once, name="registry-load", daemon=True).start()
+        return True
+
+    def _load_once(self) -> None:
+        try:
+            self.reload()
+        except Exception as e:
+            logger.warning("Index registry load failed", extra={"phase": "registry", "error": str(e)})
+            self._backoff()
+        else:
+            self._retry_delay = REGISTRY_RETRY_SECONDS
+        finally:
+            self._loading = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._current is not None
+
+    def _swap(self, snapshot: Snapshot) -> None:
+        self._current = snapshot
+        for callback in self.subscribers:
+            callback(snapshot)
+
+    def changed(self) -> bool:
+        return self._current is None or fingerprint(self.paths()) != self._current.fingerprint
+
+    def reload(self, force: bool = False) -> tuple[bool, Snapshot]:
+        """Load and swap in a new snapshot when the files changed (or ``force``).
+
+        A failed load keeps serving the current snapshot and re-raises.
+        """
+        with self._lock:
+            if not force and not self.changed():
+                return False, self._current
+            old = self._current
+            snapshot = self.loader()
+            if old is not None and not force and snapshot.version == old.version:
+                # mismo contenido (p.ej. sólo cambió el mtime): no hace falta cambiar nada
+                old.fingerprint = snapshot.fingerprint
+                return False, old
+            self._swap(snapshot)
+        logger.info("Index registry reloaded", extra={
+            "phase": "registry",
+            "previous_version": old.version if old else None,
+            "version": snapshot.version,
+        })
+        return True, snapshot
+
+    async def watch(self, interval: float = REGISTRY_WATCH_SECONDS, stop: asyncio.Event | None = None):
+        """Poll the files every ``interval`` seconds and reload once they stop changing."""
+        stop = stop or asyncio.Event()
+        pending = None
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            if not self.changed():
+                pending = None
+                continue
+            # el builder escribe varios ficheros: esperar a que dejen de cambiar
+            current = fingerprint(self.paths())
+            if current != pending:
+                pending = current
+                continue
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logger.warning("Index registry reload failed", extra={"phase": "registry", "error": str(e)})
+            pending = None
+
+
+registry = Registry()
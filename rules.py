@@ -0,0 +1,188 @@
+"""Deterministic (regex + layout) extractors for pattern-shaped fields.
+
+Runs before the LLM: a value next to its label on the same line
+(``Invoice No: F-2024-17``) or on the line below it (label/value columns
+of a form or table) gets a high confidence, an unlabelled value that is
+the only one of its kind in the text a lower one. Fields reaching
+``RULES_MIN_CONFIDENCE`` are not asked to the LLM; when every field of the
+document type is covered the LLM call is skipped.
+"""
+import os
+import re
+from dataclasses import dataclass
+
+RULES_ENABLED = os.getenv("RULES_ENABLED", "1") == "1"
+# por debajo de este umbral el campo se pide igualmente al LLM (y gana el más seguro)
+RULES_MIN_CONFIDENCE = float(os.getenv("RULES_MIN_CONFIDENCE", "0.8"))
+# part of the extraction cache key: bump it when the rules change
+RULES_VERSION = "3"
+# completion tokens the LLM spends per field ({"field": {"value": ..., "confidence": ...}})
+OUTPUT_TOKENS_PER_FIELD = 20
+
+SAME_LINE = 0.95
+NEXT_LINE = 0.85
+
+MONTHS = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+          r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|enero|febrero|marzo|abril|"
+          r"mayo|junio|julio|agosto|sep?tiembre|octubre|noviembre|diciembre")
+DATE = (rf"(?<!\d)(?:\d{{4}}-\d{{1,2}}-\d{{1,2}}|\d{{1,2}}[/.-]\d{{1,2}}[/.-]\d{{2,4}}"
+        rf"|\d{{1,2}}(?:st|nd|rd|th)?\s+(?:de\s+)?(?:{MONTHS})\.?,?\s+(?:de\s+)?\d{{4}}"
+        rf"|(?:{MONTHS})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}})(?!\d)")
+CURRENCY_CODES = r"USD|EUR|GBP|MXN|CAD|AUD|CHF|JPY"
+CURRENCY_SYMBOLS = {"€": "EUR", "£": "GBP", "$": "USD"}
+AMOUNT = (rf"(?:(?:[$€£]|{CURRENCY_CODES})\s?)?-?\d{{1,3}}(?:[,.\s]\d{{3}})*(?:[.,]\d{{1,2}})?"
+          rf"(?:\s?(?:[$€£]|{CURRENCY_CODES})(?![A-Za-z]))?")
+EMAIL = r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"
+PHONE = r"\+?\(?\d[\d\s().-]{5,}\d"
+IDENTIFIER = r"[A-Z0-9][A-Z0-9/.-]*\d[A-Z0-9/-]*"
+VERSION = r"v?\d+(?:\.\d+)*[a-z]?"
+
+# entre la etiqueta y el valor: "Invoice No.: ", "Factura nº ", "Total: ", "Ref # "
+SEPARATOR = r"\s*(?:no\.?|n[º°o]\.?|num(?:ber)?\.?|#)?\s*[:#-]?\s*"
+
+
+@dataclass
+class Rule:
+    labels: list[str]                # regex of the labels, in priority order
+    value: str                       # regex of the value
+    unlabeled: float = 0.0           # confidence of a single unlabelled match (0 = never), < RULES_MIN_CONFIDENCE
+    last: bool = False               # several labelled matches: keep the last one (totals)
+    colon: bool = False              # the label needs a ':' ("From:", "To:")
+    check: object = None             # value -> bool, rejects lookalikes
+
+    def find(self, lines: list[str]) -> tuple[str, float] | None:
+        sep = r"\s*:\s*" if self.colon else SEPARATOR
+        for label in self.labels:
+            anchor = r"^\s*" if self.colon else r"(?<![\w])"
+            same_line = re.compile(rf"{anchor}(?:{label})\b{sep}(?P<value>{self.value})", re.I)
+            label_only = re.compile(rf"{anchor}(?:{label})\b{sep}$", re.I)
+            next_value = re.compile(rf"^\s*(?P<value>{self.value})", re.I)
+            found = []
+            for i, line in enumerate(lines):
+                m = same_line.search(line)
+                if m and self._ok(m["value"]):
+                    found.append((m["value"], SAME_LINE))
+                elif label_only.search(line) and i + 1 < len(lines):
+                    m = next_value.search(lines[i + 1])
+                    if m and self._ok(m["value"]):
+                        found.append((m["value"], NEXT_LINE))
+            if found:
+                value, confidence = found[-1] if self.last else found[0]
+                return value.strip(), confidence
+        if self.unlabeled:
+            values = {m.group().strip() for line in lines for m in re.finditer(self.value, line, re.I)
+                      if self._ok(m.group())}
+            if len(values) == 1:
+                return values.pop(), self.unlabeled
+        return None
+
+    def _ok(self, value: str) -> bool:
+        return self.check is None or self.check(value.strip())
+
+
+def _is_amount(value: str) -> bool:
+    # "Total 3 items" no es un importe: hace falta moneda o decimales
+    return bool(re.search(rf"[$€£]|{CURRENCY_CODES}", value) or re.search(r"[.,]\d{2}$", value))
+
+
+def _is_phone(value: str) -> bool:
+    # "2015 - 2019" (fechas de un CV) o "12/05/2024" no son teléfonos
+    if re.search(DATE, value) or re.fullmatch(r"(?:19|20)\d{2}\s*[-–/]\s*(?:19|20)\d{2}", value):
+        return False
+    return 7 <= sum(ch.isdigit() for ch in value) <= 15
+
+
+def _date_rule(field: str) -> Rule:
+    words = [w for w in field.split("_") if w != "date"]
+    if words:
+        # "due_date" => "due date" / "due", "date_sent" => "date sent" / "sent"; un "Date:" a secas
+        # o "Invoice Date:" no dice qué fecha es, eso queda para el LLM
+        qualifier = " ".join(words)
+        return Rule([rf"{qualifier}\s+date", rf"date\s+{qualifier}", qualifier], DATE)
+    # "date" no debe pisar "due date"
+    return Rule([r"invoice\s+date", r"(?<!due\s)(?<!due)date", r"fecha(?!\s+de\s+vencimiento)", r"dated"],
+                DATE, unlabeled=0.7)
+
+
+def _is_identifier(value: str) -> bool:
+    # "Invoice 12/05/2024" o "Budget 2024" llevan una fecha o un año, no un identificador
+    return not re.fullmatch(DATE, value) and not re.fullmatch(r"(?:19|20)\d{2}", value)
+
+
+def _identifier_rule(prefix: str) -> Rule:
+    # el prefijo a secas sólo con ":" o "#" detrás: "Report 17 of the committee" no es un report_id
+    return Rule([rf"(?:{prefix})\s*(?:id|number|no|n[º°o]|#)", rf"(?:{prefix})(?=\s*[:#])",
+                 r"ref(?:erence)?\s*(?:number|no|n[º°o]|#)", r"ref(?:erence)?(?=\s*[:#])"], IDENTIFIER,
+                check=_is_identifier)
+
+
+RULES: dict[str, Rule] = {
+    "invoice_number": Rule([r"invoice\s*(?:number|no|n[º°o]|#)", r"invoice", r"n[º°o]\.?\s*(?:de\s+)?factura",
+                            r"factura"], IDENTIFIER, check=_is_identifier),
+    "budget_id": _identifier_rule("budget"),
+    "form_id": _identifier_rule("form"),
+    "report_id": _identifier_rule("report"),
+    "spec_id": _identifier_rule(r"spec(?:ification)?"),
+    "total_amount": Rule([r"grand\s+total", r"total\s+(?:amount|due)", r"amount\s+due", r"balance\s+due",
+                          r"importe\s+total", r"(?<!sub)(?<!sub-)(?<!sub\s)total"], AMOUNT,
+                         last=True, check=_is_amount),
+    "price": Rule([r"price", r"precio"], AMOUNT, unlabeled=0.75, check=_is_amount),
+    # sin etiqueta por debajo de RULES_MIN_CONFIDENCE: el LLM decide si es el email del documento
+    "email": Rule([r"e-?mail", r"correo(?:\s+electr[oó]nico)?"], EMAIL, unlabeled=0.75),
+    # sin etiqueta no: en un CV cualquier serie de cifras parece un teléfono
+    "phone": Rule([r"phone", r"tel(?:ephone|[eé]fono)?\.?", r"mobile", r"m[oó]vil", r"cell"], PHONE,
+                  check=_is_phone),
+    "version": Rule([r"version", r"versi[oó]n", r"rev(?:ision)?\.?"], VERSION),
+    "subject": Rule([r"subject", r"asunto", r"re"], r".+", colon=True),
+    "sender": Rule([r"from", r"de", r"remitente"], r".+", colon=True),
+    "recipient": Rule([r"to", r"para", r"destinatario"], r".+", colon=True),
+}
+# en memos el autor es el "From:"
+AUTHOR_FROM_TYPES = {"memo"}
+
+
+def _currency(lines: list[str], total: tuple[str, float] | None) -> tuple[str, float] | None:
+    def codes(text):
+        out = [m.upper() for m in re.findall(rf"\b(?:{CURRENCY_CODES})\b", text)]
+        return out + [CURRENCY_SYMBOLS[s] for s in re.findall(r"[$€£]", text)]
+
+    if total is not None and (found := codes(total[0])):
+        return found[0], total[1]
+    everywhere = set(codes("\n".join(lines)))
+    if len(everywhere) == 1:
+        return everywhere.pop(), NEXT_LINE
+    return None
+
+
+def extract_fields(document_type: str, field_list: list[str], text: str) -> dict[str, dict]:
+    """``{field: {"value", "confidence", "source": "rules"}}`` for the fields a rule found."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    found = {}
+    for field in field_list:
+        rule = RULES.get(field)
+        if field == "author" and document_type in AUTHOR_FROM_TYPES:
+            rule = RULES["sender"]
+        elif rule is None and "date" in field.split("_"):
+            rule = _date_rule(field)
+        if rule is not None and (hit := rule.find(lines)):
+            found[field] = hit
+    if "currency" in field_list and (hit := _currency(lines, found.get("total_amount") or found.get("price"))):
+        found["currency"] = hit
+    return {f: {"value": v, "confidence": c, "source": "rules"} for f, (v, c) in found.items()}
+
+
+def _found(entity) -> bool:
+    if isinstance(entity, dict):
+        return entity.get("value") not in (None, "", "not found")
+    return entity is not None
+
+
+def combine(llm_entities: dict, ruled: dict) -> dict:
+    """LLM answer + rule values: per field the found value with the highest confidence."""
+    result = dict(llm_entities)
+    for field, candidate in ruled.items():
+        current = result.get(field)
+        if (not _found(current)
+                or isinstance(current, dict) and candidate["confidence"] > (current.get("confidence") or 0.0)):
+            result[field] = candidate
+    return result
@@ -0,0 +1,11 @@
+import pytest
+
+from cache import MemoryBackend, ResultCache
+
+
+@pytest.fixture(autouse=True)
+def result_cache(mocker):
+    # cada test con su caché vacía: un resultado cacheado por otro test no oculta llamadas al OCR/LLM
+    cache = ResultCache(MemoryBackend())
+    mocker.patch("main.result_cache", cache)
+    return cache
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from ann_index import (build_index, choose_index_type, compute_centroids, configure_search,
+                       index_type, load_centroids, save_centroids)
+
+
+def clustered(n=3000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    x = centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def recall_at(index, x, exact, k=10):
+    _, found = index.search(x, k)
+    return np.mean([len(set(a) & set(b)) / k for a, b in zip(found, exact)])
+
+
+def test_index_type_is_chosen_by_corpus_size():
+    assert choose_index_type(5_000) == "flat"
+    assert choose_index_type(200_000) == "ivf"
+    assert choose_index_type(5_000_000) == "ivfpq"
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivf"])
+def test_ann_indexes_keep_recall_against_flat(kind):
+    x = clustered()
+    queries = x[:200]
+    _, exact = build_index(x, "flat").search(queries, 10)
+
+    index = configure_search(build_index(x, kind), nprobe=8, ef_search=64)
+
+    assert index_type(index) == kind
+    assert index.ntotal == len(x)
+    assert recall_at(index, queries, exact) > 0.9
+
+
+def test_configure_search_sets_nprobe_and_ef_search():
+    x = clustered(n=2000)
+    ivf = configure_search(build_index(x, "ivf", nlist=16), nprobe=64)
+    hnsw = configure_search(build_index(x, "hnsw"), ef_search=99)
+
+    assert ivf.nprobe == 16   # acotado a nlist
+    assert hnsw.hnsw.efSearch == 99
+
+
+def test_unknown_index_type_is_rejected():
+    with pytest.raises(ValueError):
+        build_index(clustered(n=10), "lsh")
+
+
+def test_centroids_are_normalized_label_means(tmp_path):
+    x = np.array([[1, 0], [0.8, 0.6], [0, 1]], dtype="float32")
+    labels, matrix = compute_centroids(x, ["a", "a", "b"])
+
+    assert labels == ["a", "b"]
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1, rtol=1e-6)
+    np.testing.assert_allclose(matrix[1], [0, 1])
+
+    save_centroids(tmp_path / "c.npz", labels, matrix)
+    loaded_labels, loaded = load_centroids(tmp_path / "c.npz")
+    assert loaded_labels == labels
+    np.testing.assert_allclose(loaded, matrix)
+    assert load_centroids(tmp_path / "missing.npz") is None
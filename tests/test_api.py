@@ -1,7 +1,8 @@
 from fastapi.testclient import TestClient
 from main import app, allowed_file
 import io
-from unittest.mock import patch
+import pytest
+from unittest.mock import ANY, patch
 
 client = TestClient(app)
 
@@ -70,3 +71,293 @@ def test_multiple_files(mock_ollama, mock_classify, mock_ocr):
     assert len(results) == 2
     assert results[0]["document_type"] == "memo"
     assert results[1]["entities"]["asunto"] == "reunión"
+
+
+@patch("main.ocr_image", side_effect=["texto 1", "   ", "texto 3"])
+@patch("main.classify_document", return_value=("memo", 0.87, None))
+@patch("main.extract_entities_with_ollama",
+       return_value=({"asunto": "reunión"}, '{"asunto": "reunión"}'))
+def test_batch_failure_returns_per_file_error(mock_ollama, mock_classify, mock_ocr):
+    files = [
+        ("files", (f"memo{i}.jpg", io.BytesIO(f"contenido {i}".encode()), "image/jpeg"))
+        for i in range(1, 4)
+    ]
+
+    with patch("main.MAX_FILES_IN_FLIGHT", 1):   # serial => side_effect order is deterministic
+        response = client.post("/extract_entities/", files=files)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 3
+    assert results[0]["document_type"] == "memo"
+    assert results[1]["filename"] == "memo2.jpg"
+    assert results[1]["status_code"] == 415
+    assert results[1]["error"] == "NoTextFound"
+    assert results[2]["entities"]["asunto"] == "reunión"
+
+
+@patch("main.ocr_image", return_value="texto")
+@patch("main.classify_document", return_value=("invoice", 0.9, None))
+@patch("main.extract_entities_with_ollama", return_value=({}, "{}"))
+def test_image_is_processed_from_memory(mock_ollama, mock_classify, mock_ocr):
+    response = client.post(
+        "/extract_entities/",
+        files={"files": ("foto.png", io.BytesIO(b"bytes de imagen"), "image/png")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["results"][0]["filename"] == "foto.png"
+    mock_ocr.assert_called_once_with(b"bytes de imagen", profile=None)
+
+
+@patch("main.ocr_image", return_value="texto")
+@patch("main.classify_document", return_value=("invoice", 0.9, None))
+@patch("main.extract_entities_with_ollama", return_value=({}, "{}"))
+def test_in_memory_upload_is_hashed_off_the_event_loop(mock_ollama, mock_classify, mock_ocr):
+    import asyncio
+    from cache import content_hash
+
+    def hash_in_a_thread(content):
+        with pytest.raises(RuntimeError):   # sin event loop en este hilo
+            asyncio.get_running_loop()
+        return content_hash(content)
+
+    with patch("main.hash_bytes", side_effect=hash_in_a_thread) as hashed:
+        response = client.post(
+            "/extract_entities/",
+            files={"files": ("foto.png", io.BytesIO(b"bytes de imagen"), "image/png")}
+        )
+
+    assert response.status_code == 200
+    hashed.assert_called_once_with(b"bytes de imagen")
+
+
+@patch("main.MAX_UPLOAD_BYTES", 8)
+@patch("main.ocr_pdf_pages", return_value=[])
+def test_upload_over_the_limit_is_rejected(mock_ocr_pdf):
+    response = client.post(
+        "/extract_entities/",
+        files={"files": ("grande.pdf", io.BytesIO(b"%PDF-1.4 demasiado grande"), "application/pdf")}
+    )
+
+    assert response.status_code == 413
+    assert response.json()["detail"]["error"] == "FileTooLarge"
+    mock_ocr_pdf.assert_not_called()
+
+
+@patch("main.iter_pdf_pages", return_value=iter([
+    {"page": 1, "source": "text", "text": "Invoice 42"},
+    {"page": 2, "source": "ocr", "text": "Total 10 EUR"},
+]))
+@patch("main.classify_document", return_value=("invoice", 0.9, None))
+@patch("main.extract_entities_with_ollama", return_value=({}, "{}"))
+def test_pdf_response_reports_page_sources(mock_ollama, mock_classify, mock_pages):
+    response = client.post(
+        "/extract_entities/",
+        files={"files": ("factura.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["results"][0]["pages"] == [
+        {"page": 1, "source": "text"},
+        {"page": 2, "source": "ocr"},
+    ]
+    assert mock_classify.call_args[0][0] == "Invoice 42\nTotal 10 EUR"
+
+
+@patch("main.ocr_image", return_value="texto")
+@patch("main.classify_document", return_value=("invoice", 0.9, None))
+@patch("main.extract_entities_with_ollama", return_value=({}, "{}"))
+def test_preprocessing_profile_is_selected_per_request(mock_ollama, mock_classify, mock_ocr):
+    response = client.post(
+        "/extract_entities/",
+        files={"files": ("foto.png", io.BytesIO(b"imagen"), "image/png")},
+        data={"profile": "fast"},
+    )
+
+    assert response.status_code == 200
+    assert mock_ocr.call_args.kwargs["profile"] == "fast"
+
+
+def test_unknown_profile_is_rejected():
+    response = client.post(
+        "/extract_entities/",
+        files={"files": ("foto.png", io.BytesIO(b"imagen"), "image/png")},
+        data={"profile": "turbo"},
+    )
+
+    assert response.status_code == 400
+
+
+@patch("main.ocr_image", return_value="texto repetido")
+@patch("main.classify_document", return_value=("invoice", 0.9, []))
+@patch("main.extract_entities_with_ollama", return_value=({"total": "1"}, '{"total": "1"}'))
+def test_repeated_upload_is_served_from_cache(mock_ollama, mock_classify, mock_ocr):
+    for _ in range(2):
+        response = client.post(
+            "/extract_entities/",
+            files={"files": ("scan.png", io.BytesIO(b"misma imagen"), "image/png")}
+        )
+        assert response.status_code == 200
+        assert response.json()["results"][0]["entities"] == {"total": "1"}
+
+    mock_ocr.assert_called_once()
+    mock_classify.assert_called_once()
+    mock_ollama.assert_called_once()
+
+
+@patch("main.ocr_image", return_value="texto")
+@patch("main.classify_document", return_value=("invoice", 0.9, []))
+@patch("main.extract_entities_with_ollama", return_value=({"total": "1"}, "{}"))
+def test_cache_keys_follow_the_classifier_and_prompt_settings(mock_ollama, mock_classify, mock_ocr):
+    def upload():
+        response = client.post("/extract_entities/",
+                               files={"files": ("scan.png", io.BytesIO(b"ajustes"), "image/png")})
+        assert response.status_code == 200
+
+    upload()
+    with patch("main.CLASSIFY_SETTINGS", "otro-encoder@onnx/hybrid/k5/m0.05"):
+        upload()
+    with patch("main.PROMPT_VERSION", "2"):
+        upload()
+
+    mock_ocr.assert_called_once()                  # el texto OCR no depende de esos ajustes
+    assert mock_classify.call_count == 2
+    # mismo tipo de documento con otro clasificador: la extracción sigue en caché
+    assert mock_ollama.call_count == 2
+
+
+def test_pdf_is_classified_while_later_pages_are_still_in_ocr():
+    import threading
+
+    classified = threading.Event()
+    waited = []
+
+    def pages(path, profile=None):
+        yield {"page": 1, "source": "text", "text": "Invoice 42"}
+        yield {"page": 2, "source": "ocr", "text": "Customer ACME"}
+        waited.append(classified.wait(5))   # la página 3 sigue en OCR
+        yield {"page": 3, "source": "ocr", "text": "Total 10 EUR"}
+
+    def classify(text, snapshot=None):
+        classified.set()
+        return ("invoice", 0.9, None)
+
+    with patch("main.iter_pdf_pages", side_effect=pages), \
+            patch("main.classify_document", side_effect=classify) as mock_classify, \
+            patch("main.extract_entities_with_ollama", return_value=({}, "{}")) as mock_ollama:
+        response = client.post(
+            "/extract_entities/",
+            files={"files": ("larga.pdf", io.BytesIO(b"%PDF-1.4 streaming"), "application/pdf")}
+        )
+
+    assert response.status_code == 200
+    assert waited == [True]
+    # clasificado con las dos primeras páginas; la extracción recibe el texto completo
+    assert mock_classify.call_args[0][0] == "Invoice 42\nCustomer ACME"
+    assert mock_ollama.call_args[0][1] == "Invoice 42\nCustomer ACME\nTotal 10 EUR"
+
+
+def test_repeated_pdf_reuses_the_streamed_classification():
+    def pages(path, profile=None):
+        yield {"page": 1, "source": "text", "text": "Invoice 43"}
+        yield {"page": 2, "source": "ocr", "text": "Customer ACME"}
+        yield {"page": 3, "source": "ocr", "text": "Total 10 EUR"}
+
+    with patch("main.iter_pdf_pages", side_effect=pages) as mock_pages, \
+            patch("main.classify_document", return_value=("invoice", 0.9, None)) as mock_classify, \
+            patch("main.extract_entities_with_ollama", return_value=({}, "{}")):
+        for _ in range(2):
+            response = client.post(
+                "/extract_entities/",
+                files={"files": ("repetida.pdf", io.BytesIO(b"%PDF-1.4 repetida"), "application/pdf")}
+            )
+            assert response.status_code == 200
+
+    # la segunda subida sale entera de la caché: ni OCR ni clasificación con otro texto
+    mock_pages.assert_called_once()
+    mock_classify.assert_called_once_with("Invoice 43\nCustomer ACME", snapshot=ANY)
+
+
+def test_stream_endpoint_emits_each_file_as_it_completes():
+    import json
+    import threading
+
+    rapido_done = threading.Event()
+
+    def classify(text, snapshot=None):
+        # el primer fichero no termina hasta que el segundo ya tiene resultado
+        if "lento" in text:
+            assert rapido_done.wait(5)
+        return ("invoice", 0.9, None)
+
+    def extract(doc_type, text, snapshot=None):
+        if "rapido" in text:
+            rapido_done.set()
+        return {}, "{}"
+
+    with patch("main.ocr_image", side_effect=lambda source, profile=None: source.read_text()), \
+            patch("main.classify_document", side_effect=classify), \
+            patch("main.extract_entities_with_ollama", side_effect=extract), \
+            patch("main.MAX_UPLOAD_BYTES", 64):
+        response = client.post(
+            "/extract_entities/stream?progress=true",
+            files=[
+                ("files", ("lento.png", io.BytesIO(b"imagen lento"), "image/png")),
+                ("files", ("rapido.png", io.BytesIO(b"imagen rapido"), "image/png")),
+                ("files", ("enorme.png", io.BytesIO(b"x" * 100), "image/png")),
+            ],
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    finished = [(e["event"], e["filename"]) for e in events if e["event"] in ("result", "error")]
+    assert finished == [("error", "enorme.png"), ("result", "rapido.png"), ("result", "lento.png")]
+    assert events[0]["status_code"] == 413
+    stages = [(e["stage"], e["status"]) for e in events
+              if e["event"] == "progress" and e["filename"] == "lento.png"]
+    assert stages[0] == ("total", "started") and ("ocr", "finished") in stages
+    assert events[-1] == {"event": "done", "files": 3, "errors": 1}
+
+
+def test_stream_endpoint_speaks_sse():
+    with patch("main.ocr_image", return_value="texto"), \
+            patch("main.classify_document", return_value=("invoice", 0.9, None)), \
+            patch("main.extract_entities_with_ollama", return_value=({}, "{}")):
+        response = client.post(
+            "/extract_entities/stream?format=sse",
+            files={"files": ("foto.png", io.BytesIO(b"sse"), "image/png")},
+        )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = response.text.strip().split("\n\n")
+    assert [b.splitlines()[0] for b in blocks] == ["event: result", "event: done"]
+    assert client.post("/extract_entities/stream?format=xml",
+                       files={"files": ("foto.png", io.BytesIO(b"sse"), "image/png")}).status_code == 400
+
+
+@patch("main.ocr_image", return_value="Invoice No: F-2024-17\nTotal: 100.00 EUR")
+@patch("main.classify_document", return_value=("invoice", 0.9, None))
+@patch("main.extract_entities_with_ollama", return_value=({"vendor_name": {"value": "ACME", "confidence": 0.9}}, "{}"))
+def test_rules_fill_fields_and_llm_gets_the_rest(mock_ollama, mock_classify, mock_ocr):
+    response = client.post("/extract_entities/", files={"files": ("f.png", io.BytesIO(b"x"), "image/png")})
+
+    entities = response.json()["results"][0]["entities"]
+    assert entities["vendor_name"]["value"] == "ACME"
+    assert entities["invoice_number"] == {"value": "F-2024-17", "confidence": 0.95, "source": "rules"}
+    assert entities["currency"]["value"] == "EUR"
+    assert mock_ollama.call_args.kwargs["fields"] == ["vendor_name", "date", "due_date"]
+
+
+@patch("main.ocr_image", return_value="Invoice F-1")
+@patch("main.classify_document", return_value=("invoice", 0.9, None))
+@patch("main.extract_entities_with_ollama")
+def test_llm_skipped_when_rules_cover_the_schema(mock_ollama, mock_classify, mock_ocr):
+    ruled = {f: {"value": "x", "confidence": 0.95, "source": "rules"}
+             for f in ["invoice_number", "vendor_name", "date", "total_amount", "due_date", "currency"]}
+    with patch("main.extract_fields", return_value=ruled):
+        response = client.post("/extract_entities/", files={"files": ("f.png", io.BytesIO(b"x"), "image/png")})
+
+    assert response.json()["results"][0]["entities"] == ruled
+    mock_ollama.assert_not_called()
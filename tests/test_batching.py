@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def run_concurrently(batcher, items):
+    results = [None] * len(items)
+    errors = []
+    barrier = threading.Barrier(len(items))
+
+    def call(i, item):
+        barrier.wait()
+        try:
+            results[i] = batcher.submit(item)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(i, item)) for i, item in enumerate(items)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_calls_share_a_batch_and_keep_their_result():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [x * 2 for x in items]
+
+    batcher = MicroBatcher(double, max_batch=8, max_wait=0.2)
+    results, errors = run_concurrently(batcher, list(range(8)))
+
+    assert not errors
+    assert results == [x * 2 for x in range(8)]
+    assert len(calls) < 8
+    assert batcher.snapshot()["items"] == 8
+    assert batcher.snapshot()["avg_batch_size"] > 1
+
+
+def test_batch_never_exceeds_max_batch():
+    sizes = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items, max_batch=3, max_wait=0.2)
+
+    run_concurrently(batcher, list(range(7)))
+
+    assert max(sizes) <= 3
+    assert sum(sizes) == 7
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    def boom(items):
+        raise RuntimeError("encode failed")
+
+    batcher = MicroBatcher(boom, max_batch=4, max_wait=0.01)
+
+    with pytest.raises(RuntimeError, match="encode failed"):
+        batcher.submit("x")
+
+
+def test_observers_receive_fill_and_queue_delay():
+    seen = []
+    batcher = MicroBatcher(lambda items: items, max_batch=4, max_wait=0.0)
+    batcher.observers.append(lambda size, fill, delays: seen.append((size, fill, delays)))
+
+    assert batcher.submit("x") == "x"
+    assert seen[0][0] == 1
+    assert seen[0][1] == 0.25
+    assert seen[0][2][0] >= 0
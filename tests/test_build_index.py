@@ -0,0 +1,201 @@
+import pickle
+
+import faiss
+import numpy as np
+import pytest
+
+import build_index as bi
+from metadata_store import MetadataStore
+
+DIM = 8
+
+
+def fake_encode(texts):
+    # embedding determinista por texto
+    out = np.stack([np.random.default_rng(abs(hash(t)) % 2**32).normal(size=DIM) for t in texts])
+    return (out / np.linalg.norm(out, axis=1, keepdims=True)).astype("float32")
+
+
+class FakeOCR:
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+
+    def __call__(self, paths, workers, gpu):
+        for path in paths:
+            self.calls.append(path)
+            if path in self.fail:
+                yield path, None, "boom"
+            else:
+                yield path, open(path).read(), None
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    docs = tmp_path / "docs"
+    for label, names in {"invoice": ["a", "b"], "memo": ["c"]}.items():
+        (docs / label).mkdir(parents=True)
+        for name in names:
+            (docs / label / f"{name}.png").write_text(f"{label} {name}")
+    (docs / "memo" / "notes.txt").write_text("ignored")
+    return docs
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    return {
+        "index_path": tmp_path / "index.faiss",
+        "metadata_path": tmp_path / "metadata.pkl",
+        "store_dir": tmp_path / "store",
+        "centroids_path": tmp_path / "centroids.npz",
+    }
+
+
+def published(outputs):
+    index = faiss.read_index(str(outputs["index_path"]))
+    store = MetadataStore(outputs["store_dir"])
+    return index, [store[i]["path"].split("/")[-1] for i in range(len(store))]
+
+
+def test_add_and_publish_writes_aligned_index_and_metadata(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    stats = bi.add_files(state, corpus, fake_encode, ocr=FakeOCR(), batch_size=2)
+    result = bi.publish(state, kind="flat", **outputs)
+
+    assert stats["new"] == 3
+    assert result["mode"] == "build" and result["vectors"] == 3
+    index, names = published(outputs)
+    assert names == ["a.png", "b.png", "c.png"]
+    # la fila i del índice es el embedding de metadata[i]
+    _, found = index.search(fake_encode(["memo c"]), 1)
+    assert names[found[0][0]] == "c.png"
+    assert len(pickle.loads(outputs["metadata_path"].read_bytes())) == 3
+
+
+def test_rerun_skips_known_files_and_appends_new_ones(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    bi.publish(state, kind="flat", **outputs)
+
+    (corpus / "memo" / "d.png").write_text("memo d")
+    ocr = FakeOCR()
+    stats = bi.add_files(state, corpus, fake_encode, ocr=ocr)
+    result = bi.publish(state, kind="flat", **outputs)
+
+    assert ocr.calls == [str(corpus / "memo" / "d.png")]
+    assert stats["unchanged"] == 3
+    assert result["mode"] == "append"
+    assert published(outputs)[1] == ["a.png", "b.png", "c.png", "d.png"]
+
+
+def test_failed_files_are_retried_on_the_next_run(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bad = str(corpus / "invoice" / "b.png")
+    stats = bi.add_files(state, corpus, fake_encode, ocr=FakeOCR(fail=[bad]))
+    assert stats["errors"] == 1
+
+    ocr = FakeOCR()
+    bi.add_files(state, corpus, fake_encode, ocr=ocr)
+    assert ocr.calls == [bad]
+
+
+def test_remove_and_revive_without_ocr(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    bi.publish(state, kind="ivf", **outputs)
+
+    assert state.remove(paths=[str(corpus / "invoice")]) == 2
+    result = bi.publish(state, kind="ivf", **outputs)
+    assert result["mode"] == "readd"
+    index, names = published(outputs)
+    assert index.ntotal == 1 and names == ["c.png"]
+    assert result["labels"] == {"memo": 1}
+
+    ocr = FakeOCR()
+    stats = bi.add_files(state, corpus, fake_encode, ocr=ocr)
+    bi.publish(state, kind="ivf", **outputs)
+    assert ocr.calls == [] and stats["revived"] == 2
+    assert published(outputs)[1] == ["c.png", "a.png", "b.png"]
+
+
+def test_changed_and_deleted_files(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    bi.publish(state, kind="flat", **outputs)
+
+    (corpus / "invoice" / "a.png").write_text("invoice a v2")
+    (corpus / "memo" / "c.png").unlink()
+    stats = bi.add_files(state, corpus, fake_encode, ocr=FakeOCR(), prune=True)
+    bi.publish(state, kind="flat", **outputs)
+
+    assert stats["changed"] == 1 and stats["pruned"] == 1
+    assert published(outputs)[1] == ["b.png", "a.png"]
+
+
+def test_moved_sample_keeps_its_vector_under_the_new_label(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    bi.publish(state, kind="flat", **outputs)
+
+    (corpus / "invoice" / "a.png").rename(corpus / "memo" / "a.png")
+    ocr = FakeOCR()
+    stats = bi.add_files(state, corpus, fake_encode, ocr=ocr, prune=True)
+    result = bi.publish(state, kind="flat", **outputs)
+
+    assert ocr.calls == []
+    assert stats["moved"] == 1 and stats["pruned"] == 0
+    assert result["vectors"] == 3
+    assert result["labels"] == {"invoice": 1, "memo": 2}
+    store = MetadataStore(outputs["store_dir"])
+    assert {store[i]["path"]: store[i]["label"] for i in range(len(store))}[str(corpus / "memo" / "a.png")] == "memo"
+
+
+def test_copied_sample_is_a_duplicate_not_a_move(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    bi.publish(state, kind="flat", **outputs)
+
+    (corpus / "memo" / "a.png").write_text("invoice a")
+    stats = bi.add_files(state, corpus, fake_encode, ocr=FakeOCR(), prune=True)
+    result = bi.publish(state, kind="flat", **outputs)
+
+    assert stats["duplicates"] == 1 and stats["moved"] == 0
+    assert result["labels"] == {"invoice": 2, "memo": 1}
+
+
+def test_index_out_of_sync_is_rebuilt(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    bi.publish(state, kind="flat", **outputs)
+    outputs["index_path"].unlink()
+
+    assert bi.publish(state, kind="flat", **outputs)["mode"] == "build"
+    assert bi.publish(state, kind="hnsw", **outputs)["type"] == "hnsw"
+
+
+def test_reencode_replaces_every_stored_embedding(tmp_path, corpus, outputs):
+    state = bi.BuildState(tmp_path / "state.db")
+    bi.add_files(state, corpus, fake_encode, ocr=FakeOCR())
+    state.remove(paths=[str(corpus / "memo")])
+
+    def other_encode(texts):
+        return fake_encode([t.upper() for t in texts])
+
+    # también las lápidas: un archivo que vuelve no puede traer el embedding viejo
+    assert bi.reencode(state, other_encode, batch_size=2) == 3
+    result = bi.publish(state, kind="flat", rebuild=True, **outputs)
+    index, names = published(outputs)
+    assert result["vectors"] == 2
+    scores, found = index.search(other_encode(["invoice b"]), 1)
+    assert names[found[0][0]] == "b.png" and scores[0][0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_add_refuses_a_different_encoder(tmp_path, corpus, mocker):
+    state = bi.BuildState(tmp_path / "state.db")
+    state.set_setting("encoder", "all-MiniLM-L6-v2@torch")
+    mocker.patch.object(bi, "load_encoder")
+
+    with pytest.raises(SystemExit):
+        bi.main(["add", "--docs", str(corpus), "--state", str(tmp_path / "state.db"),
+                 "--backend", "onnx-int8"])
+    bi.load_encoder.assert_not_called()
@@ -0,0 +1,84 @@
+import pytest
+
+from cache import MemoryBackend, ResultCache, SQLiteBackend, content_hash, file_hash, make_cache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_factory(request, tmp_path):
+    def make(max_items=3, max_bytes=1024):
+        if request.param == "memory":
+            return MemoryBackend(max_items=max_items, max_bytes=max_bytes)
+        return SQLiteBackend(tmp_path / "cache.sqlite3", max_items=max_items, max_bytes=max_bytes)
+    return make
+
+
+def test_lru_evicts_least_recently_used(backend_factory):
+    backend = backend_factory(max_items=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    assert backend.get("a") == b"1"      # "a" pasa a ser el más reciente
+    backend.set("c", b"3")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+    assert backend.get("c") == b"3"
+
+
+def test_size_bound_evicts_until_it_fits(backend_factory):
+    backend = backend_factory(max_items=100, max_bytes=10)
+    backend.set("a", b"x" * 6)
+    backend.set("b", b"y" * 6)
+
+    assert backend.get("a") is None
+    assert backend.get("b") == b"y" * 6
+
+
+def test_result_cache_roundtrip_per_stage():
+    cache = ResultCache(MemoryBackend())
+    cache.set("ocr", {"text": "hola", "pages": []}, "abc", "quality")
+
+    assert cache.get("ocr", "abc", "quality") == {"text": "hola", "pages": []}
+    assert cache.get("ocr", "abc", "fast") is None
+    assert cache.get("classify", "abc", "quality") is None
+
+
+def test_disabled_cache_never_hits():
+    cache = make_cache("none")
+    cache.set("ocr", "x", "abc")
+    assert cache.get("ocr", "abc") is None
+
+
+def test_file_hash_matches_content_hash(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-1.4 contenido")
+    assert file_hash(path, chunk_size=4) == content_hash(b"%PDF-1.4 contenido")
+
+
+def test_sqlite_connects_lazily_once_per_process(tmp_path, monkeypatch):
+    backend = SQLiteBackend(tmp_path / "cache.sqlite3")
+    assert not (tmp_path / "cache.sqlite3").exists()     # importar el módulo no abre nada
+
+    backend.set("a", b"1")
+    parent = backend._conn
+    assert backend.get("a") == b"1" and backend._conn is parent
+
+    # un worker forkeado (otro pid) abre su propia conexión sobre el mismo fichero
+    monkeypatch.setattr("cache.os.getpid", lambda: -1)
+    assert backend.get("a") == b"1"
+    assert backend._conn is not parent
+
+
+def test_blocking_backends_run_off_the_event_loop(tmp_path, mocker):
+    import asyncio
+
+    to_thread = mocker.spy(asyncio, "to_thread")
+    memory, sqlite = ResultCache(MemoryBackend()), ResultCache(SQLiteBackend(tmp_path / "cache.sqlite3"))
+
+    async def roundtrip(cache):
+        await cache.aset("ocr", {"text": "hola"}, "abc")
+        return await cache.aget("ocr", "abc")
+
+    assert asyncio.run(roundtrip(memory)) == {"text": "hola"}
+    assert to_thread.call_count == 0          # el LRU en memoria se consulta en línea
+    assert asyncio.run(roundtrip(sqlite)) == {"text": "hola"}
+    assert to_thread.call_count == 2
@@ -1,14 +1,13 @@
 import numpy as np
-import pytest
 import classifier as clf
 from pytest import approx
 
 def test_classify_document_returns_label_confidence_hits(mocker):
     test_text = "Sample document text"
 
-    # Mock del modelo de embeddings
+    # Mock del modelo de embeddings: se sustituye el proxy entero, sin cargar el modelo real
     dummy_embedding = np.array([[0.1, 0.2, 0.3]])  # ya es array
-    mocker.patch.object(clf.embedding_model, "encode", return_value=dummy_embedding)
+    mocker.patch.object(clf, "embedding_model").encode.return_value = dummy_embedding
 
     # Mock del índice FAISS
     dummy_scores = np.array([[0.95]], dtype="float32")
@@ -16,10 +15,10 @@ def test_classify_document_returns_label_confidence_hits(mocker):
     mock_index = mocker.patch.object(clf.index, "search", return_value=(dummy_scores, dummy_indices))
 
     # Mock del metadata
-    clf.metadata[0] = {
+    mocker.patch.object(clf, "metadata", [{
         "label": "invoice",
         "path": "docs/invoice-123.jpg"
-    }
+    }])
 
     label, confidence, hits = clf.classify_document(test_text)
 
@@ -31,3 +30,60 @@ def test_classify_document_returns_label_confidence_hits(mocker):
     assert hits[0]["label"] == "invoice"
     assert hits[0]["path"] == "docs/invoice-123.jpg"
     assert hits[0]["score"] == approx(0.95, rel=1e-6)
+
+
+def test_classify_documents_encodes_and_searches_once_for_the_batch(mocker):
+    texts = ["factura 1", "memo 2"]
+    mocker.patch.object(clf, "embedding_model").encode.return_value = np.array([[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]])
+    mock_search = mocker.patch.object(
+        clf.index, "search",
+        return_value=(np.array([[0.9, 0.5], [0.8, 0.0]], dtype="float32"),
+                      np.array([[0, 1], [1, -1]]))
+    )
+    mocker.patch.object(clf, "metadata", [
+        {"label": "invoice", "path": "a.jpg"},
+        {"label": "memo", "path": "b.jpg"},
+    ])
+
+    results = clf.classify_documents(texts, top_k=2)
+
+    clf.embedding_model.encode.assert_called_once_with(texts, normalize_embeddings=True)
+    mock_search.assert_called_once()
+    assert [r[0] for r in results] == ["invoice", "memo"]
+    assert len(results[1][2]) == 1   # el -1 de faiss se descarta
+
+
+def test_neighbours_vote_weighted_by_similarity(mocker):
+    mocker.patch.object(clf, "embedding_model").encode.return_value = np.array([[0.1, 0.2, 0.3]])
+    mocker.patch.object(clf.index, "search", return_value=(
+        np.array([[0.90, 0.85, 0.80, 0.40]], dtype="float32"),
+        np.array([[0, 1, 2, 3]]),
+    ))
+    mocker.patch.object(clf, "metadata", [
+        {"label": "memo", "path": "m.jpg"},
+        {"label": "invoice", "path": "a.jpg"},
+        {"label": "invoice", "path": "b.jpg"},
+        {"label": "memo", "path": "n.jpg"},
+    ])
+
+    label, confidence, hits = clf.classify_documents(["texto"], top_k=1)[0]
+
+    assert label == "invoice"            # 0.85 + 0.80 > 0.90 + 0.40
+    assert confidence == approx(0.85)
+    assert [h["path"] for h in hits] == ["m.jpg"]
+
+
+def test_hybrid_mode_uses_centroids_and_falls_back_to_knn(mocker):
+    mocker.patch.object(clf, "CLASSIFY_MODE", "hybrid")
+    mocker.patch.object(clf, "centroids", (["invoice", "memo"], np.array([[1, 0], [0, 1]], dtype="float32")))
+    mocker.patch.object(clf, "embedding_model").encode.return_value = np.array([[0.9, 0.1], [0.7, 0.69]])
+    mocker.patch.object(clf, "metadata", [{"label": "memo", "path": "m.jpg"}])
+    mock_search = mocker.patch.object(clf.index, "search", return_value=(
+        np.array([[0.99]], dtype="float32"), np.array([[0]])))
+
+    clear, unsure = clf.classify_documents(["factura", "dudoso"])
+
+    assert clear[0] == "invoice" and clear[1] == approx(0.9)
+    assert unsure[0] == "memo"
+    searched = mock_search.call_args[0][0]
+    assert searched.shape[0] == 1       # sólo el documento dudoso va a FAISS
@@ -0,0 +1,27 @@
+import pytest
+import torch
+
+import embeddings
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        embeddings.load_model("tensorrt")
+
+
+def test_torch_int8_quantizes_linear_layers(mocker):
+    model = torch.nn.Sequential(torch.nn.Linear(8, 4))
+    mocker.patch("sentence_transformers.SentenceTransformer", return_value=model)
+
+    quantized = embeddings.load_model("torch-int8", "tiny")
+    assert isinstance(quantized[0], torch.ao.nn.quantized.dynamic.Linear)
+
+
+def test_onnx_backends_select_the_export(mocker):
+    st = mocker.patch("sentence_transformers.SentenceTransformer")
+
+    embeddings.load_model("onnx", "tiny")
+    embeddings.load_model("onnx-int8", "tiny")
+    assert st.call_args_list[0].kwargs == {"backend": "onnx", "model_kwargs": None}
+    assert st.call_args_list[1].kwargs["model_kwargs"] == {"file_name": embeddings.EMBEDDING_ONNX_INT8_FILE}
+    assert embeddings.encoder_id("onnx-int8", "tiny") == "tiny@onnx-int8"
@@ -0,0 +1,168 @@
+import asyncio
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import jobs
+import main
+from jobs import JobQueue, LeaseLost, process_job
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(main, "JOBS_DIR", str(tmp_path / "jobs"))
+    return JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=60)
+
+
+def test_claim_takes_oldest_job_only_once(queue):
+    first = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}])
+    queue.enqueue([{"filename": "b.jpg", "path": "b.jpg"}])
+
+    job = queue.claim("w1")
+
+    assert job["job_id"] == first
+    assert job["status"] == "running"
+    assert queue.claim("w2")["job_id"] != first
+    assert queue.claim("w3") is None
+
+
+def test_expired_lease_is_claimed_again_and_keeps_done_files(queue):
+    queue.lease_seconds = -1      # el worker "muere" sin renovar el lease
+    job_id = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}, {"filename": "b.jpg", "path": "b.jpg"}])
+    job = queue.claim("w1")
+    queue.save_file_result(job_id, 0, {"filename": "a.jpg", "document_type": "memo"}, "w1")
+
+    again = queue.claim("w2")
+
+    assert again["job_id"] == job_id
+    assert again["attempts"] == 2
+    assert [f["status"] for f in again["results"]] == ["done", "queued"]
+
+
+def test_job_fails_after_max_attempts(queue):
+    queue.lease_seconds = -1
+    queue.max_attempts = 1
+    job_id = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}])
+    queue.claim("w1")
+
+    assert queue.claim("w2") is None
+    assert queue.fail_exhausted() == [job_id]
+    assert queue.get(job_id)["status"] == "failed"
+    assert queue.fail_exhausted() == []
+
+
+def test_exhausted_job_notifies_its_webhook_and_removes_its_files(queue, mocker):
+    queue.lease_seconds = -1
+    queue.max_attempts = 1
+    job_id = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}], webhook="http://client.test/hook")
+    files = jobs.Path(jobs.JOBS_DIR) / job_id
+    files.mkdir(parents=True)
+    queue.claim("w1")          # el worker muere con el lease caducado
+    notify = mocker.patch("jobs.notify_webhook", return_value=True)
+
+    async def handler(path, filename, profile):
+        raise AssertionError("an exhausted job is not run again")
+
+    async def go():
+        stop = asyncio.Event()
+        worker = asyncio.create_task(jobs.run_worker(queue, handler, poll_interval=0.01, stop=stop))
+        while not notify.await_count:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await worker
+
+    asyncio.run(go())
+
+    payload = notify.call_args[0][1]
+    assert payload["status"] == "failed" and payload["error"] == "Too many attempts"
+    assert not files.exists()
+
+
+def test_process_job_runs_pending_files_and_calls_webhook(queue, mocker):
+    job_id = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}, {"filename": "b.jpg", "path": "b.jpg"}],
+                           webhook="http://client.test/hook")
+    job = queue.claim("w1")
+    notify = mocker.patch("jobs.notify_webhook", return_value=True)
+
+    async def handler(path, filename, profile):
+        if filename == "b.jpg":
+            return {"filename": filename, "error": "NoTextFound", "status_code": 415}
+        return {"filename": filename, "document_type": "memo"}
+
+    final = asyncio.run(process_job(queue, job, handler))
+
+    assert final["status"] == "completed"
+    assert [f["status"] for f in final["results"]] == ["done", "failed"]
+    assert final["results"][0]["document_type"] == "memo"
+    notify.assert_awaited_once()
+    assert notify.call_args[0][0] == "http://client.test/hook"
+    assert queue.depth() == 0
+
+
+def test_lease_is_renewed_while_a_long_file_is_processed(queue):
+    queue.lease_seconds = 0.3
+    job_id = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}])
+    job = queue.claim("w1")
+
+    async def handler(path, filename, profile):
+        await asyncio.sleep(1)      # más que el lease: sin renovación otro worker lo reclamaría
+        assert queue.claim("w2") is None
+        return {"filename": filename, "document_type": "memo"}
+
+    final = asyncio.run(process_job(queue, job, handler))
+
+    assert final["status"] == "completed"
+    assert queue.get(job_id)["attempts"] == 1
+
+
+def test_worker_that_lost_the_lease_cannot_write_results(queue):
+    queue.lease_seconds = -1
+    job_id = queue.enqueue([{"filename": "a.jpg", "path": "a.jpg"}])
+    stale = queue.claim("w1")
+    queue.lease_seconds = 60
+    queue.claim("w2")
+
+    async def handler(path, filename, profile):
+        return {"filename": filename, "document_type": "memo"}
+
+    with pytest.raises(LeaseLost):
+        asyncio.run(process_job(queue, stale, handler))
+
+    assert not queue.heartbeat(job_id, "w1")
+    assert not queue.finish(job_id, "w1", "failed", "boom")
+    job = queue.get(job_id)
+    assert job["status"] == "running"
+    assert [f["status"] for f in job["results"]] == ["queued"]
+
+
+def test_jobs_endpoints_enqueue_and_report_status(queue, mocker):
+    mocker.patch("main.job_queue", queue)
+    client = TestClient(main.app)
+
+    response = client.post("/jobs", files=[
+        ("files", ("scan.jpg", io.BytesIO(b"imagen"), "image/jpeg")),
+        ("files", ("doc.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")),
+    ])
+
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    status = client.get(f"/jobs/{job_id}").json()
+    assert status["status"] == "queued"
+    assert [f["filename"] for f in status["results"]] == ["scan.jpg", "doc.pdf"]
+    assert queue.depth() == 1
+
+    assert client.get("/jobs/desconocido").status_code == 404
+
+
+def test_jobs_endpoint_rejects_bad_webhooks_and_formats(queue, mocker):
+    mocker.patch("main.job_queue", queue)
+    client = TestClient(main.app)
+    scan = [("files", ("scan.jpg", io.BytesIO(b"imagen"), "image/jpeg"))]
+
+    for webhook in ("file:///etc/passwd", "gopher://client.test/hook", "client.test/hook", ""):
+        assert client.post("/jobs", files=scan, data={"webhook": webhook}).status_code == 400
+    assert client.post("/jobs", files=[("files", ("a.exe", io.BytesIO(b"x"), "application/x"))]).status_code == 400
+    assert client.post("/jobs", files=scan, data={"webhook": "https://client.test/hook"}).status_code == 202
+    assert queue.depth() == 1
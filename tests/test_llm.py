@@ -1,4 +1,7 @@
 import extractor as llm  # importa tu archivo real (ajusta el nombre si no es `llm.py`)
+import json
+
+import pytest
 
 def test_build_prompt_includes_fields_and_text():
     document_type = "invoice"
@@ -25,3 +28,243 @@ def test_build_payload_structure():
     assert "messages" in payload
     assert "stream" in payload
     assert payload["messages"][0]["content"] == prompt
+
+def test_extract_entities_fills_missing_fields(mocker):
+    import asyncio
+    from ollama_client import ChatResult
+
+    chat = mocker.patch.object(llm.ollama_client, "chat", return_value=ChatResult(
+        content='{"date": {"value": "2024-05-01", "confidence": 0.9}}',
+        ttft=0.1, total=0.5, attempts=1,
+    ))
+
+    entities, raw = asyncio.run(llm.extract_entities_with_ollama("invoice", "texto"))
+
+    chat.assert_awaited_once()
+    assert entities["date"]["value"] == "2024-05-01"
+    assert entities["total_amount"] == {"value": "not found", "confidence": 0.0}
+    assert raw.startswith('{"date"')
+
+def test_split_into_chunks_respects_budget_and_overlaps():
+    text = "\n".join(f"line {i:03d} " + "x" * 30 for i in range(100))
+
+    chunks = llm.split_into_chunks(text, max_tokens=100, overlap_tokens=10)
+
+    assert len(chunks) > 1
+    assert all(len(c) <= 100 * llm.CHARS_PER_TOKEN for c in chunks)
+    assert "line 000" in chunks[0] and "line 099" in chunks[-1]
+    # la última línea de un chunk se repite al inicio del siguiente
+    assert chunks[0].splitlines()[-1] == chunks[1].splitlines()[0]
+
+
+def test_split_into_chunks_drops_the_overlap_before_a_long_line():
+    max_chars = 1000 * llm.CHARS_PER_TOKEN
+    # cabecera corta y luego una tabla OCR sin saltos de línea, de un chunk entero
+    text = "\n".join([f"header {i} " + "h" * 30 for i in range(5)] + ["x" * max_chars, "y" * (max_chars - 5)])
+
+    chunks = llm.split_into_chunks(text, max_tokens=1000, overlap_tokens=64)
+
+    assert all(len(c) <= max_chars for c in chunks)
+    assert chunks[1] == "x" * max_chars
+
+
+def test_select_chunks_keeps_first_and_most_relevant_in_order():
+    chunks = ["header", "nothing here", "total amount 10", "nothing", "amount due total"]
+
+    selected = llm.select_chunks(chunks, ["total_amount"], max_chunks=3)
+
+    assert selected == ["header", "total amount 10", "amount due total"]
+
+
+def test_merge_results_prefers_found_and_confident_values():
+    results = [
+        {"date": {"value": "2024-01-01", "confidence": 0.6}, "total": {"value": "not found", "confidence": 0.0}},
+        {"date": {"value": "2024-01-02", "confidence": 0.9}},
+    ]
+
+    merged = llm.merge_results(["date", "total"], results)
+
+    assert merged["date"]["value"] == "2024-01-02"
+    assert merged["total"] == {"value": "not found", "confidence": 0.0}
+
+
+def test_long_document_is_extracted_by_chunks(mocker):
+    import asyncio
+    from ollama_client import ChatResult
+
+    mocker.patch.object(llm, "OLLAMA_NUM_CTX", 1500)
+    mocker.patch.object(llm, "OLLAMA_OUTPUT_TOKENS", 200)
+    answers = iter([
+        '{"invoice_number": {"value": "F-1", "confidence": 0.9}}',
+        '{"total_amount": {"value": "100", "confidence": 0.8}}',
+        '{"total_amount": {"value": "99", "confidence": 0.4}}',
+        '{}', '{}',
+    ])
+    chat = mocker.patch.object(llm.ollama_client, "chat",
+                               side_effect=lambda payload: ChatResult(next(answers), None, 0.1, 1))
+    text = "\n".join(f"total amount line {i} " + "x" * 60 for i in range(200))
+
+    entities, _ = asyncio.run(llm.extract_entities_with_ollama("invoice", text))
+
+    assert 1 < chat.await_count <= llm.OLLAMA_MAX_CHUNKS
+    assert entities["invoice_number"]["value"] == "F-1"
+    assert entities["total_amount"]["value"] == "100"
+    assert entities["due_date"]["value"] == "not found"
+
+def test_messages_share_a_static_prefix_across_documents():
+    a = llm.build_messages("invoice", ["date", "total"], "texto A")
+    b = llm.build_messages("memo", ["author"], "texto B mucho más largo")
+
+    assert a[0] == b[0] == {"role": "system", "content": llm.SYSTEM_PROMPT}
+    # mismo tipo => mismo prefijo hasta el texto del documento
+    c = llm.build_messages("invoice", ["date", "total"], "otro texto")
+    assert a[1]["content"].split("texto A")[0] == c[1]["content"].split("otro texto")[0]
+    assert a[1]["content"].endswith("texto A")
+
+
+def test_json_schema_requires_every_field():
+    schema = llm.build_json_schema(["date", "total"])
+
+    assert schema["required"] == ["date", "total"]
+    assert schema["properties"]["date"]["required"] == ["value", "confidence"]
+    assert set(llm.JSON_SCHEMAS) == set(llm.DOCUMENT_SCHEMA)
+
+
+def test_payload_uses_schema_as_structured_output(mocker):
+    import asyncio
+    from ollama_client import ChatResult
+
+    chat = mocker.patch.object(llm.ollama_client, "chat",
+                               return_value=ChatResult("{}", None, 0.1, 1))
+
+    asyncio.run(llm.extract_entities_with_ollama("invoice", "texto"))
+
+    payload = chat.call_args[0][0]
+    assert payload["format"] == llm.JSON_SCHEMAS["invoice"]
+    assert payload["messages"][0]["role"] == "system"
+
+
+def test_malformed_json_keeps_decode_error_type(mocker):
+    import asyncio
+    import json
+    import pytest
+    from ollama_client import ChatResult
+
+    mocker.patch.object(llm.ollama_client, "chat",
+                        return_value=ChatResult('{"date": ', None, 0.1, 1))
+
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(llm.extract_entities_with_ollama("invoice", "texto"))
+
+def test_streaming_extraction_sends_full_chunks_before_the_text_is_complete(mocker):
+    import asyncio
+    from ollama_client import ChatResult
+
+    mocker.patch.object(llm, "OLLAMA_NUM_CTX", 1500)
+    mocker.patch.object(llm, "OLLAMA_OUTPUT_TOKENS", 200)
+    sent = []
+
+    async def chat(payload):
+        sent.append(payload["messages"][-1]["content"])
+        return ChatResult('{"total_amount": {"value": "%d", "confidence": 0.5}}' % len(sent), None, 0.1, 1)
+
+    mocker.patch.object(llm.ollama_client, "chat", side_effect=chat)
+    page = "\n".join(f"total amount line {i} " + "x" * 60 for i in range(40))
+
+    async def go():
+        short = llm.StreamingExtraction("invoice")
+        short.feed("Invoice F-1")
+        assert not short.started            # cabe en un prompt: extracción normal
+
+        extraction = llm.StreamingExtraction("invoice")
+        extraction.feed(page)
+        extraction.feed(page)
+        await asyncio.sleep(0)
+        assert extraction.started and sent   # el primer chunk ya salió, faltan páginas
+        for _ in range(6):
+            extraction.feed(page)
+        return await extraction.finish()
+
+    entities, _ = asyncio.run(go())
+    assert len(sent) == llm.OLLAMA_MAX_CHUNKS
+    assert entities["total_amount"]["value"] in {"1", "2", "3", "4"}
+    assert entities["due_date"]["value"] == "not found"
+
+
+def stub_ollama(mocker, answers):
+    """Local stub of Ollama's /api/chat: ``answers[model]`` is the content each model returns."""
+    import httpx
+    from ollama_client import OllamaClient
+
+    calls = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        calls.append(payload["model"])
+        lines = [{"message": {"content": answers[payload["model"]]}, "done": False},
+                 {"message": {"content": ""}, "done": True}]
+        return httpx.Response(200, content="\n".join(json.dumps(line) for line in lines).encode())
+
+    mocker.patch.object(llm, "ollama_client", OllamaClient(url="http://ollama.test/api/chat", backoff=0,
+                                                           transport=httpx.MockTransport(handler)))
+    return calls
+
+
+def entities_json(confidence, **values):
+    return json.dumps({f: {"value": v, "confidence": confidence} for f, v in values.items()})
+
+
+INVOICE = dict(invoice_number="F-1", vendor_name="ACME", date="2024-01-05", total_amount="10",
+               due_date="2024-02-05", currency="EUR")
+
+
+def test_cascade_stops_at_the_small_model_when_it_is_confident(mocker):
+    import asyncio
+
+    mocker.patch.object(llm, "OLLAMA_SMALL_MODEL", "small")
+    calls = stub_ollama(mocker, {"small": entities_json(0.9, **INVOICE), llm.MODEL_OLLAMA: "{}"})
+
+    entities, _ = asyncio.run(llm.extract_entities_with_ollama("invoice", "texto"))
+
+    assert calls == ["small"]
+    assert entities["vendor_name"]["value"] == "ACME"
+
+
+@pytest.mark.parametrize("small_answer, reason", [
+    (entities_json(0.3, **INVOICE), "low_confidence"),
+    (entities_json(0.9, invoice_number="F-1"), "low_coverage"),
+    ('{"invoice_number": ', "invalid_json"),
+    ('[{"invoice_number": {"value": "F-1", "confidence": 0.9}}]', "invalid_json"),
+    ('"F-1"', "invalid_json"),
+])
+def test_cascade_escalates_to_the_large_model(mocker, small_answer, reason):
+    import asyncio
+    from metrics import LLM_ESCALATIONS
+
+    mocker.patch.object(llm, "OLLAMA_SMALL_MODEL", "small")
+    calls = stub_ollama(mocker, {"small": small_answer, llm.MODEL_OLLAMA: entities_json(0.8, **INVOICE)})
+    escalations = LLM_ESCALATIONS.labels("invoice", "small", reason)
+    before = escalations._value.get()
+
+    entities, _ = asyncio.run(llm.extract_entities_with_ollama("invoice", "texto"))
+
+    assert calls == ["small", llm.MODEL_OLLAMA]
+    assert entities["total_amount"] == {"value": "10", "confidence": 0.8}
+    assert escalations._value.get() == before + 1
+
+
+def test_schema_routing_overrides_models_and_required_fields(mocker):
+    import asyncio
+    from types import SimpleNamespace
+
+    snapshot = SimpleNamespace(
+        schema={"invoice": list(INVOICE)},
+        routing={"invoice": {"models": ["tiny", "big"], "required": ["total_amount"], "min_coverage": 0}},
+    )
+    answer = entities_json(0.9, **{k: v for k, v in INVOICE.items() if k != "total_amount"})
+    calls = stub_ollama(mocker, {"tiny": answer, "big": entities_json(0.9, **INVOICE)})
+
+    entities, _ = asyncio.run(llm.extract_entities_with_ollama("invoice", "texto", snapshot=snapshot))
+
+    assert calls == ["tiny", "big"]   # falta un campo obligatorio
+    assert entities["total_amount"]["value"] == "10"
@@ -0,0 +1,50 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from metadata_store import MetadataStore, load_metadata, main, write_store
+
+RECORDS = [
+    {"label": "invoice", "path": "docs/a.jpg", "text": "Factura nº 1"},
+    {"label": "memo", "path": "docs/ñ/b.jpg", "text": ""},
+    {"label": "invoice", "path": "docs/c.jpg", "text": "Total 12,50 €"},
+]
+
+
+def test_store_round_trips_labels_paths_and_texts(tmp_path):
+    store = MetadataStore(write_store(tmp_path / "store", RECORDS))
+
+    assert len(store) == 3
+    assert store.labels == ["invoice", "memo"]
+    assert store[1] == {"label": "memo", "path": "docs/ñ/b.jpg"}
+    assert store[np.int64(2)]["label"] == "invoice"
+    assert store.text(2) == "Total 12,50 €"
+    assert isinstance(store.label_ids, np.memmap)
+    with pytest.raises(IndexError):
+        store[3]
+
+
+def test_store_without_texts(tmp_path):
+    store = MetadataStore(write_store(tmp_path / "store", RECORDS, with_texts=False))
+    assert store[0]["path"] == "docs/a.jpg"
+    assert store.text(0) is None
+
+
+def test_rewrite_replaces_the_previous_store(tmp_path):
+    write_store(tmp_path / "store", RECORDS)
+    write_store(tmp_path / "store", RECORDS[:1])
+    assert len(MetadataStore(tmp_path / "store")) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["store"]
+
+
+def test_migration_cli_and_pickle_fallback(tmp_path):
+    pkl = tmp_path / "metadata.pkl"
+    pkl.write_bytes(pickle.dumps(RECORDS))
+
+    assert load_metadata(tmp_path / "store", pkl) == RECORDS
+
+    main([str(pkl), str(tmp_path / "store")])
+    store = load_metadata(tmp_path / "store", pkl)
+    assert isinstance(store, MetadataStore)
+    assert [store[i] for i in range(3)] == [{"label": r["label"], "path": r["path"]} for r in RECORDS]
@@ -0,0 +1,103 @@
+import asyncio
+import io
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from main import app
+from metrics import collect_timings, stage_timer
+from pipeline import PipelineExecutor
+
+client = TestClient(app)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stage_timer_feeds_histogram_and_request_timings():
+    before = sample("idu_stage_seconds_count", stage="unit_test")
+    with collect_timings() as timings:
+        with stage_timer("unit_test"):
+            pass
+        with stage_timer("unit_test"):
+            pass
+
+    assert sample("idu_stage_seconds_count", stage="unit_test") == before + 2
+    assert set(timings) == {"unit_test"}
+
+
+def test_timers_inside_thread_stages_reach_the_request():
+    executor = PipelineExecutor({"ocr": {"kind": "thread", "workers": 2, "concurrency": 1}})
+
+    def work():
+        with stage_timer("inner_step"):
+            return sample("idu_inflight", pool="ocr")
+
+    async def go():
+        with collect_timings() as timings:
+            inflight = await executor.run("ocr", work)
+        return inflight, timings
+
+    inflight, timings = asyncio.run(go())
+    executor.shutdown()
+
+    assert inflight == 1
+    assert "inner_step" in timings
+    assert sample("idu_inflight", pool="ocr") == 0
+    assert sample("idu_queue_depth", pool="ocr") == 0
+
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "idu_stage_seconds" in response.text
+    assert 'idu_queue_depth{pool="jobs"}' in response.text
+
+
+@patch("main.ocr_image", return_value="texto con tiempos")
+@patch("main.classify_document", return_value=("invoice", 0.9, []))
+@patch("main.extract_entities_with_ollama", return_value=({}, "{}"))
+def test_debug_flag_adds_stage_timings(mock_ollama, mock_classify, mock_ocr):
+    plain = client.post("/extract_entities/",
+                        files={"files": ("a.png", io.BytesIO(b"debug-1"), "image/png")})
+    debug = client.post("/extract_entities/?debug=true",
+                        files={"files": ("b.png", io.BytesIO(b"debug-2"), "image/png")})
+
+    assert "timings" not in plain.json()["results"][0]
+    timings = debug.json()["results"][0]["timings"]
+    assert {"hash", "ocr", "classify", "llm", "total"} <= set(timings)
+    assert timings["total"] >= timings["ocr"]
+
+
+MULTIPROCESS_WORKER = """
+import sys
+from metrics import INFLIGHT, QUEUE_DEPTH, live_gauge, render
+
+INFLIGHT.labels("ocr").inc(int(sys.argv[1]))
+live_gauge(QUEUE_DEPTH, lambda: 7, pool="jobs")
+QUEUE_DEPTH.labels("jobs")      # cada worker crea la serie en su fichero
+if sys.argv[2] == "scrape":
+    sys.stdout.write(render()[0].decode())
+"""
+
+
+def test_multiprocess_metrics_add_up_workers_and_report_live_gauges_once(tmp_path):
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path),
+           "PYTHONPATH": os.pathsep.join([str(Path(__file__).parents[1]), os.environ.get("PYTHONPATH", "")])}
+    run = lambda *args: subprocess.run([sys.executable, "-c", MULTIPROCESS_WORKER, *args], env=env,
+                                       capture_output=True, text=True, check=True).stdout
+    run("2", "exit")           # otro worker (su fichero sigue ahí: no se marcó como muerto)
+    body = run("1", "scrape")
+
+    assert 'idu_inflight{pool="ocr"} 3.0' in body
+    assert body.count('idu_queue_depth{pool="jobs"}') == 1
+    assert 'idu_queue_depth{pool="jobs"} 7.0' in body
+    assert body.count("# TYPE idu_queue_depth gauge") == 1
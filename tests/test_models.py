@@ -0,0 +1,87 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from models import LazyModel, ModelManager
+
+
+def test_importing_the_api_does_not_build_models():
+    import main  # noqa: F401
+    import ocr
+    import classifier
+
+    assert isinstance(ocr.reader, LazyModel)
+    assert isinstance(classifier.embedding_model, LazyModel)
+    assert "ocr_reader" in main.models.status()
+
+
+def test_lazy_model_builds_once_and_proxies_attributes():
+    factory = MagicMock(return_value=MagicMock(encode=MagicMock(return_value="vec")))
+    model = LazyModel("enc", factory)
+    assert not model.loaded
+    factory.assert_not_called()
+
+    threads = [threading.Thread(target=model.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert model.encode(["x"]) == "vec"
+    factory.assert_called_once()
+    assert model.loaded and model.load_seconds is not None
+
+    # patch.object sobre el proxy sigue funcionando como con el modelo real
+    with patch.object(model, "encode", return_value="patched"):
+        assert model.encode(["x"]) == "patched"
+    assert model.encode(["x"]) == "vec"
+
+
+def test_patching_the_proxy_does_not_build_the_model():
+    import classifier
+
+    factory = MagicMock()
+    model = LazyModel("enc", factory)
+    with patch.object(classifier, "embedding_model", model), patch.object(classifier, "embedding_model"):
+        pass
+    factory.assert_not_called()
+    assert not model.loaded
+
+
+def test_manager_warm_up_and_status():
+    manager = ModelManager()
+    warmed = []
+    manager.register("a", lambda: "model-a", warmup=warmed.append)
+    broken = manager.register("b", MagicMock(side_effect=OSError("no weights")))
+
+    assert not manager.ready
+    with pytest.raises(OSError):
+        manager.warm_up()
+    assert warmed == ["model-a"]
+    assert not manager.ready and not manager.warming
+    assert manager.status()["b"] == {"loaded": False, "warm": False, "load_seconds": None,
+                                     "error": "no weights"}
+
+    broken.__dict__["_factory"] = lambda: "model-b"
+    manager.warm_up()
+    assert manager.ready
+    assert warmed == ["model-a"]   # los ya calientes no repiten la inferencia
+
+
+def test_healthz_and_readyz_follow_warm_up():
+    import main
+
+    manager = ModelManager()
+    manager.register("reader", lambda: "reader")
+    client = TestClient(main.app)
+    with patch("main.models", manager), patch("main.MODEL_WARMUP", True):
+        assert client.get("/healthz").json() == {"status": "ok"}
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["models"]["reader"]["loaded"] is False
+
+        manager.warm_up()
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
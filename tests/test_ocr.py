@@ -34,6 +34,74 @@ def test_preprocess_image_no_crash_on_blank(tmp_path):
     ocr_module.preprocess_image(img_path)
 
 
+def test_load_gray_decodes_bytes_in_memory():
+    import cv2
+    ok, encoded = cv2.imencode(".png", fake_image(w=30, h=20, value=0))
+    assert ok
+
+    img = ocr_module.load_gray(encoded.tobytes())
+
+    assert img.shape == (20, 30)
+    assert img.dtype == np.uint8
+
+def test_load_gray_rejects_garbage():
+    with pytest.raises(ValueError):
+        ocr_module.load_gray(b"not an image")
+
+
+def text_page(scale=1.0):
+    """Página blanca con líneas de texto; su altura escala con ``scale``."""
+    import cv2
+    img = np.full((int(1100 * scale), int(850 * scale)), 255, dtype=np.uint8)
+    for row in range(12):
+        cv2.putText(img, "Invoice total amount 1234", (int(40 * scale), int((80 + row * 80) * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9 * scale, 0, max(1, int(2 * scale)))
+    return img
+
+
+def test_resolution_policy_downscales_large_text_and_caps_pixels():
+    from preprocessing import estimate_text_height, fit_resolution
+
+    small, large = text_page(), text_page(scale=4)
+
+    assert estimate_text_height(large) == pytest.approx(4 * estimate_text_height(small), rel=0.2)
+    # texto grande => se reduce hasta ~24 px
+    assert estimate_text_height(fit_resolution(large, target_text_px=24, max_pixels=0)) == pytest.approx(24, rel=0.2)
+    # texto ya pequeño => sin cambios (nunca se amplía)
+    assert fit_resolution(small, target_text_px=24, max_pixels=0) is small
+    # tope de píxeles aunque no haya texto
+    blank = fake_image(w=4000, h=3000)
+    assert fit_resolution(blank, target_text_px=24, max_pixels=3_000_000).size <= 3_000_000
+
+
+def test_pick_dpi_renders_scans_at_the_lowest_sufficient_resolution(mocker):
+    import cv2
+    from PIL import Image
+
+    class ScannedPage(DummyPage):
+        width, height = 612, 792   # carta, en puntos
+
+        def to_image(self, resolution):
+            img = cv2.resize(text_page(), None, fx=resolution / 72, fy=resolution / 72)
+            return types.SimpleNamespace(original=Image.fromarray(img))
+
+    from preprocessing import estimate_text_height
+
+    mocker.patch.object(ocr_module, "OCR_TARGET_TEXT_PX", 24)
+    mocker.patch.object(ocr_module, "PDF_MIN_DPI", 50)
+    # altura del texto a 72 dpi => dpi que la lleva a 24 px
+    assert ocr_module.pick_dpi(ScannedPage(1)) == int(72 * 24 / estimate_text_height(text_page()))
+    assert ocr_module.pick_dpi(ScannedPage(1)) < 150
+
+    mocker.patch.object(ocr_module, "PDF_MIN_DPI", 150)
+    assert ocr_module.pick_dpi(ScannedPage(1)) == 150
+    mocker.patch.object(ocr_module, "OCR_TARGET_TEXT_PX", 0)
+    assert ocr_module.pick_dpi(ScannedPage(1)) == ocr_module.PDF_DPI
+    # 612x792 pt a 300 dpi son 8.4 MP
+    mocker.patch.object(ocr_module, "OCR_MAX_PIXELS", 2_000_000)
+    assert ocr_module.pick_dpi(ScannedPage(1)) == int((2_000_000 / (8.5 * 11)) ** 0.5)
+
+
 # ---------- tests ocr_image ----------
 def test_ocr_image_calls_reader_and_preprocess(mocker, tmp_path):
     img_path = tmp_path / "foo.png"
@@ -44,14 +112,14 @@ def test_ocr_image_calls_reader_and_preprocess(mocker, tmp_path):
     dummy_processed = fake_image()
     mocker.patch("ocr.preprocess_image", return_value=dummy_processed)
 
-    # 2) Mock reader.readtext ⇒ devuelve lista simulada
-    fake_reader = mocker.patch.object(
-        ocr_module.reader, "readtext", return_value=["Hola", "mundo"]
-    )
+    # 2) Mock del reader (el proxy entero: no se construye EasyOCR) ⇒ devuelve lista simulada
+    fake_reader = mocker.patch.object(ocr_module, "reader").readtext
+    fake_reader.return_value = ["Hola", "mundo"]
 
     text = ocr_module.ocr_image(img_path)
 
-    fake_reader.assert_called_once_with(dummy_processed, detail=0, paragraph=True)
+    fake_reader.assert_called_once_with(dummy_processed, detail=0, paragraph=True,
+                                        canvas_size=2560, mag_ratio=1.0, batch_size=1)
     assert text == "Hola\nmundo"
 
 
@@ -60,6 +128,12 @@ class DummyPage:
     def __init__(self, idx):
         self.idx = idx
 
+    def extract_words(self):
+        return []   # página escaneada: sin capa de texto
+
+    def extract_text(self):
+        return None
+
     def to_image(self, resolution):
         # Devuelve objeto con atributo .original como PIL.Image
         from PIL import Image
@@ -86,3 +160,109 @@ def test_ocr_pdf_iterates_pages_and_concatenates(mocker, tmp_path):
 
     # 5) Verificaciones
     assert result == "pag1\npag2"
+
+
+def test_ocr_pdf_passes_page_arrays_without_temp_files(mocker, tmp_path):
+    dummy_pdf_context = MagicMock()
+    dummy_pdf_context.__enter__.return_value.pages = [DummyPage(1)]
+    mocker.patch("ocr.pdfplumber.open", return_value=dummy_pdf_context)
+    fake_ocr = mocker.patch("ocr.ocr_image", return_value="pag1")
+
+    ocr_module.ocr_pdf(tmp_path / "doc.pdf")
+
+    page_img = fake_ocr.call_args[0][0]
+    assert isinstance(page_img, np.ndarray)
+    assert page_img.shape == (10, 10)
+    assert list(tmp_path.iterdir()) == []
+
+
+class BornDigitalPage(DummyPage):
+    def extract_words(self):
+        return [{"text": w} for w in self.extract_text().split()]
+
+    def extract_text(self):
+        return " ".join(f"word{n}" for n in range(40))
+
+
+def test_ocr_pdf_uses_text_layer_and_falls_back_to_ocr(mocker):
+    dummy_pdf_context = MagicMock()
+    dummy_pdf_context.__enter__.return_value.pages = [BornDigitalPage(1), DummyPage(2)]
+    mocker.patch("ocr.pdfplumber.open", return_value=dummy_pdf_context)
+    fake_ocr = mocker.patch("ocr.ocr_image", return_value="escaneada")
+
+    pages = ocr_module.ocr_pdf_pages(Path("doc.pdf"))
+
+    assert [p["source"] for p in pages] == ["text", "ocr"]
+    assert pages[0]["text"].startswith("word0 word1")
+    assert pages[1]["text"] == "escaneada"
+    fake_ocr.assert_called_once()
+
+
+def test_page_text_layer_rejects_garbage_text():
+    class GarbagePage(BornDigitalPage):
+        def extract_text(self):
+            return " ".join("\ufffd#%" for _ in range(40))
+
+    assert ocr_module.page_text_layer(GarbagePage(1)) == ""
+
+
+class ScanWithTextPage(DummyPage):
+    """Escaneo a página completa (612x792 pt) con palabras de texto digital en ``rows`` filas."""
+    width, height = 612, 792
+    images = [{"x0": 0, "x1": 612, "top": 0, "bottom": 792}]
+
+    def __init__(self, idx, rows):
+        super().__init__(idx)
+        self.rows = rows
+
+    def extract_words(self):
+        return [{"text": f"word{r}{c}", "x0": 40 + 50 * c, "x1": 85 + 50 * c, "top": 40 + 14 * r,
+                 "bottom": 50 + 14 * r} for r in range(self.rows) for c in range(10)]
+
+    def extract_text(self):
+        return " ".join(w["text"] for w in self.extract_words())
+
+
+def test_page_text_layer_ignores_a_header_over_a_scanned_page():
+    # una línea de cabecera digital (10 palabras) sobre un escaneo: el cuerpo sólo sale por OCR
+    assert ocr_module.page_text_layer(ScanWithTextPage(1, rows=1)) == ""
+    # escaneo con capa OCR completa (PDF "searchable"): se usa la capa de texto
+    assert ocr_module.page_text_layer(ScanWithTextPage(1, rows=50)).startswith("word00 word01")
+
+
+def test_parallel_pages_keep_page_order(mocker):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    pages = [DummyPage(1), BornDigitalPage(2), DummyPage(3), DummyPage(4)]
+    dummy_pdf_context = MagicMock()
+    dummy_pdf_context.__enter__.return_value.pages = pages
+    mocker.patch("ocr.pdfplumber.open", return_value=dummy_pdf_context)
+
+    delays = iter([0.05, 0.0, 0.02])   # la primera página escaneada es la más lenta
+    def slow_ocr(img, profile=None):
+        delay = next(delays)
+        time.sleep(delay)
+        return f"ocr {delay}"
+    mocker.patch("ocr.ocr_image", side_effect=slow_ocr)
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        mocker.patch("ocr.get_page_pool", return_value=pool)
+        result = ocr_module.ocr_pdf_pages(Path("doc.pdf"), workers=3)
+
+    assert [p["page"] for p in result] == [1, 2, 3, 4]
+    assert [p["source"] for p in result] == ["ocr", "text", "ocr", "ocr"]
+
+
+def test_page_pool_is_recreated_when_the_worker_count_changes(mocker):
+    mocker.patch.object(ocr_module, "_page_pool", None)
+    mocker.patch.object(ocr_module, "_page_pool_workers", 0)
+    executor = mocker.patch("ocr.ProcessPoolExecutor", side_effect=lambda **kw: MagicMock(**kw))
+
+    first = ocr_module.get_page_pool(2)
+    assert ocr_module.get_page_pool(2) is first
+
+    second = ocr_module.get_page_pool(4)
+    assert second is not first
+    assert [c.kwargs["max_workers"] for c in executor.call_args_list] == [2, 4]
+    first.shutdown.assert_called_once_with(wait=False)
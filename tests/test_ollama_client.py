@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from ollama_client import OllamaClient, OllamaError
+
+
+def ndjson(*chunks):
+    return "\n".join(json.dumps(c) for c in chunks).encode()
+
+
+def make_client(handler, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return OllamaClient(url="http://ollama.test/api/chat",
+                        transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_non_streaming_chat_returns_content():
+    def handler(request):
+        assert json.loads(request.content)["model"] == "llama3.2"
+        return httpx.Response(200, json={"message": {"content": '{"a": 1}'}, "eval_count": 7})
+
+    result = asyncio.run(make_client(handler).chat({"model": "llama3.2", "stream": False}))
+
+    assert result.content == '{"a": 1}'
+    assert result.completion_tokens == 7
+    assert result.attempts == 1
+
+
+def test_streaming_chat_joins_chunks_and_measures_ttft():
+    def handler(request):
+        return httpx.Response(200, content=ndjson(
+            {"message": {"content": '{"a"'}, "done": False},
+            {"message": {"content": ": 1}"}, "done": False},
+            {"message": {"content": ""}, "done": True, "prompt_eval_count": 50, "eval_count": 2},
+        ))
+
+    result = asyncio.run(make_client(handler).chat({"model": "m", "stream": True}))
+
+    assert result.content == '{"a": 1}'
+    assert result.ttft is not None and result.ttft <= result.total
+    assert result.prompt_tokens == 50
+    assert not result.truncated
+
+
+def test_retries_server_errors_with_backoff():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"message": {"content": "{}"}})
+
+    result = asyncio.run(make_client(handler, retries=2).chat({"stream": False}))
+
+    assert result.attempts == 3
+    assert len(calls) == 3
+
+
+def test_gives_up_after_bounded_retries():
+    def handler(request):
+        raise httpx.ConnectError("connection refused")
+
+    with pytest.raises(OllamaError):
+        asyncio.run(make_client(handler, retries=1).chat({"stream": False}))
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(404, json={"error": "model not found"})
+
+    with pytest.raises(OllamaError):
+        asyncio.run(make_client(handler, retries=3).chat({"stream": False}))
+    assert len(calls) == 1
+
+
+def test_long_generation_is_cut_off():
+    def handler(request):
+        chunks = [{"message": {"content": "x"}, "done": False} for _ in range(5)]
+        return httpx.Response(200, content=ndjson(*chunks))
+
+    client = make_client(handler, max_generation_seconds=1e-9)
+    result = asyncio.run(client.chat({"stream": True}))
+
+    assert result.truncated
+    assert result.content == "x"
+
+
+def test_parallel_requests_are_limited():
+    state = {"current": 0, "peak": 0}
+
+    async def handler(request):
+        state["current"] += 1
+        state["peak"] = max(state["peak"], state["current"])
+        await asyncio.sleep(0.01)
+        state["current"] -= 1
+        return httpx.Response(200, json={"message": {"content": "{}"}})
+
+    client = make_client(handler, parallel=2)
+
+    async def go():
+        await asyncio.gather(*(client.chat({"stream": False}) for _ in range(6)))
+
+    asyncio.run(go())
+    assert state["peak"] == 2
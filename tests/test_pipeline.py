@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pipeline import PipelineExecutor
+
+
+def make_executor(concurrency=2, workers=4):
+    return PipelineExecutor({
+        "ocr": {"kind": "thread", "workers": workers, "concurrency": concurrency},
+    })
+
+
+def test_run_returns_result_off_the_event_loop():
+    executor = make_executor()
+    loop_thread = []
+
+    async def go():
+        loop_thread.append(threading.get_ident())
+        return await executor.run("ocr", lambda x, y=0: (threading.get_ident(), x + y), 1, y=2)
+
+    worker_thread, value = asyncio.run(go())
+    executor.shutdown()
+
+    assert value == 3
+    assert worker_thread != loop_thread[0]
+
+
+def test_stage_concurrency_limit_is_respected():
+    executor = make_executor(concurrency=2, workers=8)
+    lock = threading.Lock()
+    state = {"current": 0, "peak": 0}
+
+    def slow():
+        with lock:
+            state["current"] += 1
+            state["peak"] = max(state["peak"], state["current"])
+        time.sleep(0.05)
+        with lock:
+            state["current"] -= 1
+
+    async def go():
+        await asyncio.gather(*(executor.run("ocr", slow) for _ in range(6)))
+
+    asyncio.run(go())
+    executor.shutdown()
+
+    assert state["peak"] == 2
+
+
+def test_stream_yields_items_while_the_generator_is_still_running():
+    executor = make_executor()
+    release = threading.Event()
+    closed = []
+
+    def pages():
+        try:
+            yield 1
+            assert release.wait(5)   # sólo sigue cuando el consumidor ya tiene el primero
+            yield 2
+            yield 3
+        finally:
+            closed.append(True)
+
+    async def go():
+        seen = []
+        async for item in executor.stream("ocr", pages):
+            seen.append(item)
+            release.set()
+            if item == 2:
+                break
+        return seen
+
+    assert asyncio.run(go()) == [1, 2]
+    time.sleep(0.05)
+    executor.shutdown()
+    assert closed == [True]
+
+
+def test_stream_propagates_generator_errors():
+    executor = make_executor()
+
+    def broken():
+        yield 1
+        raise RuntimeError("page 2")
+
+    async def go():
+        return [item async for item in executor.stream("ocr", broken)]
+
+    with pytest.raises(RuntimeError, match="page 2"):
+        asyncio.run(go())
+    executor.shutdown()
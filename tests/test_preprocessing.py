@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+import pytest
+
+import preprocessing
+
+
+def rotated_lines(angle):
+    """Página sintética: renglones negros sobre blanco, girada ``angle`` grados."""
+    img = np.full((600, 800), 255, dtype=np.uint8)
+    for y in range(100, 500, 40):
+        cv2.line(img, (100, y), (700, y), 0, 6)
+    M = cv2.getRotationMatrix2D((400, 300), angle, 1.0)
+    return cv2.warpAffine(img, M, (800, 600), borderValue=255)
+
+
+@pytest.mark.parametrize("profile", sorted(preprocessing.PROFILES))
+def test_every_profile_keeps_the_page_shape(profile):
+    processed = preprocessing.preprocess_image(rotated_lines(3), profile)
+
+    assert processed.shape == (600, 800)
+    assert processed.dtype == np.uint8
+
+
+@pytest.mark.parametrize("max_side", [None, 200])
+def test_estimate_skew_on_downscaled_copy(max_side):
+    assert preprocessing.estimate_skew(rotated_lines(7), max_side) == pytest.approx(-7, abs=0.5)
+
+
+def test_estimate_skew_never_turns_the_page_sideways():
+    # cv2 >= 4.5 devuelve 90 para un rectángulo recto
+    assert abs(preprocessing.estimate_skew(rotated_lines(0))) < 0.5
+
+
+def test_estimate_skew_blank_page():
+    assert preprocessing.estimate_skew(np.full((50, 100), 255, dtype=np.uint8)) == 0.0
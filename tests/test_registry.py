@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import pickle
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import classifier as clf
+from registry import Registry, load_snapshot
+
+
+def write_files(tmp_path, labels, schema=None):
+    vectors = np.eye(len(labels), 4, dtype="float32")
+    index = faiss.IndexFlatIP(4)
+    index.add(vectors)
+    faiss.write_index(index, str(tmp_path / "index.faiss"))
+    with open(tmp_path / "metadata.pkl", "wb") as f:
+        pickle.dump([{"label": label, "path": f"{i}.png"} for i, label in enumerate(labels)], f)
+    (tmp_path / "schema.json").write_text(json.dumps(schema or {"invoice": ["total"]}))
+
+
+def make_registry(tmp_path):
+    paths = dict(index_path=tmp_path / "index.faiss", meta_path=tmp_path / "metadata.pkl",
+                 store_dir=tmp_path / "store", centroids_path=tmp_path / "centroids.npz",
+                 schema_path=tmp_path / "schema.json")
+    files = lambda: [paths["index_path"], paths["meta_path"], paths["centroids_path"], paths["schema_path"]]
+    return Registry(loader=lambda: load_snapshot(**paths), paths=files)
+
+
+def touch_later(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def test_reload_swaps_only_when_files_change(tmp_path):
+    write_files(tmp_path, ["invoice", "memo"])
+    registry = make_registry(tmp_path)
+    seen = []
+    registry.subscribers.append(seen.append)
+
+    first = registry.current
+    assert first.index.ntotal == 2 and first.schema == {"invoice": ["total"]}
+    assert registry.reload() == (False, first)
+
+    write_files(tmp_path, ["invoice", "memo", "email"], schema={"invoice": ["total", "date"]})
+    reloaded, second = registry.reload()
+
+    assert reloaded and registry.current is second
+    assert second.index_version != first.index_version
+    assert second.schema_version != first.schema_version
+    assert seen == [first, second]
+    # las peticiones en curso conservan su snapshot intacto
+    assert first.index.ntotal == 2 and first.metadata[1]["label"] == "memo"
+
+
+def test_same_content_with_new_mtime_is_not_a_new_version(tmp_path):
+    write_files(tmp_path, ["invoice"])
+    registry = make_registry(tmp_path)
+    first = registry.current
+    touch_later(tmp_path / "schema.json")
+
+    assert registry.changed()
+    assert registry.reload() == (False, first)
+    assert not registry.changed()
+
+
+def test_inconsistent_files_keep_the_current_snapshot(tmp_path):
+    write_files(tmp_path, ["invoice", "memo"])
+    registry = make_registry(tmp_path)
+    first = registry.current
+    with open(tmp_path / "metadata.pkl", "wb") as f:
+        pickle.dump([{"label": "invoice", "path": "0.png"}], f)
+
+    with pytest.raises(ValueError):
+        registry.reload()
+    assert registry.current is first
+
+
+def test_watcher_reloads_after_files_settle(tmp_path):
+    write_files(tmp_path, ["invoice"])
+    registry = make_registry(tmp_path)
+    first = registry.current
+
+    async def go():
+        stop = asyncio.Event()
+        task = asyncio.create_task(registry.watch(0.01, stop=stop))
+        write_files(tmp_path, ["invoice", "memo"])
+        for _ in range(200):
+            if registry.current is not first:
+                break
+            await asyncio.sleep(0.01)
+        stop.set()
+        await task
+
+    asyncio.run(go())
+    assert registry.current.index.ntotal == 2
+
+
+def test_classifier_batch_keeps_each_request_on_its_snapshot(mocker):
+    def snapshot(label):
+        index = SimpleNamespace(search=lambda emb, k: (np.full((len(emb), 1), 0.9, "float32"),
+                                                      np.zeros((len(emb), 1), int)))
+        return SimpleNamespace(index=index, metadata=[{"label": label, "path": "x"}], centroids=None)
+
+    old, new = snapshot("old"), snapshot("new")
+    mocker.patch.object(clf, "embedding_model").encode.side_effect = lambda texts, **kw: np.ones((len(texts), 3))
+
+    results = clf._classify_batch([("a", 1, old), ("b", 1, new), ("c", 1, old)])
+
+    assert [r[0] for r in results] == ["old", "new", "old"]
+
+
+def test_mismatched_files_do_not_crash_and_load_once_fixed(tmp_path):
+    write_files(tmp_path, ["invoice", "memo"])
+    with open(tmp_path / "metadata.pkl", "wb") as f:
+        pickle.dump([{"label": "invoice", "path": "0.png"}], f)     # 2 vectores, 1 fila
+    registry = make_registry(tmp_path)
+
+    assert registry.try_load() is None
+    assert not registry.loaded and registry.changed()
+
+    write_files(tmp_path, ["invoice", "memo"])
+    reloaded, snapshot = registry.reload()
+    assert reloaded and registry.try_load() is snapshot
+
+
+def test_requests_get_503_while_the_index_loads_in_the_background(tmp_path):
+    import threading
+    import time
+    import main
+
+    calls, release = [], threading.Event()
+
+    def loader():
+        calls.append(threading.current_thread().name)
+        release.wait(5)        # un índice grande: la carga tarda
+        raise ValueError("Index has 2 vectors but metadata has 1 rows")
+
+    registry = Registry(loader=loader, paths=lambda: [])
+    client = TestClient(main.app)
+    with patch("main.registry", registry):
+        started = time.perf_counter()
+        for _ in range(2):
+            response = client.post("/extract_entities/", files={"files": ("a.png", b"x", "image/png")})
+            assert response.status_code == 503
+            assert response.json()["detail"]["error"] == "IndexUnavailable"
+        assert time.perf_counter() - started < 2        # sin esperar al loader
+        release.set()
+        for _ in range(50):
+            if not registry._loading:
+                break
+            time.sleep(0.02)
+
+        # una sola carga, fuera del event loop, y el siguiente reintento espera (backoff)
+        assert calls == ["registry-load"]
+        assert not registry.load_in_background()
+
+
+def test_admin_reload_is_closed_without_admin_token(tmp_path):
+    import main
+
+    write_files(tmp_path, ["invoice"])
+    registry = make_registry(tmp_path)
+    client = TestClient(main.app)
+    with patch("main.registry", registry), patch("main.ADMIN_TOKEN", None):
+        response = client.post("/admin/reload?force=true")
+
+    assert response.status_code == 403
+    assert not registry.loaded
+
+
+@patch("main.ocr_image", return_value="texto")
+@patch("main.classify_document", return_value=("invoice", 0.9, []))
+@patch("main.extract_entities_with_ollama", return_value=({}, "{}"))
+def test_responses_report_the_version_and_admin_reload(mock_ollama, mock_classify, mock_ocr, tmp_path):
+    import main
+
+    write_files(tmp_path, ["invoice"])
+    registry = make_registry(tmp_path)
+    client = TestClient(main.app)
+    with patch("main.registry", registry), patch("main.ADMIN_TOKEN", "s3cret"):
+        version = registry.current.index_version
+        response = client.post("/extract_entities/",
+                               files={"files": ("a.png", b"registry", "image/png")})
+        assert response.json()["results"][0]["index_version"] == version
+        assert mock_classify.call_args.kwargs["snapshot"] is registry.current
+
+        assert client.post("/admin/reload").status_code == 403
+        write_files(tmp_path, ["invoice", "memo"])
+        body = client.post("/admin/reload", headers={"X-Admin-Token": "s3cret"}).json()
+
+    assert body["reloaded"] is True
+    assert body["previous_version"].startswith(version)
+    assert body["vectors"] == 2
+
+
+def test_schema_entries_may_carry_routing(tmp_path):
+    write_files(tmp_path, ["invoice", "memo"], schema={
+        "invoice": {"fields": ["total"], "routing": {"models": ["llama3.2:1b", "llama3:8b"]}},
+        "memo": ["author"],
+    })
+
+    snapshot = make_registry(tmp_path).current
+
+    assert snapshot.schema == {"invoice": ["total"], "memo": ["author"]}
+    assert snapshot.routing == {"invoice": {"models": ["llama3.2:1b", "llama3:8b"]}}
@@ -0,0 +1,85 @@
+from rules import combine, extract_fields
+
+INVOICE = """ACME Corp
+Invoice No: F-2024-17
+Invoice Date: 12/03/2024
+Due Date: March 30, 2024
+Subtotal: 90.00 EUR
+Total: 100.00 EUR"""
+
+
+def test_invoice_fields_from_labels():
+    found = extract_fields("invoice", ["invoice_number", "vendor_name", "date", "total_amount", "due_date",
+                                       "currency"], INVOICE)
+
+    assert {f: v["value"] for f, v in found.items()} == {
+        "invoice_number": "F-2024-17",
+        "date": "12/03/2024",
+        "due_date": "March 30, 2024",
+        "total_amount": "100.00 EUR",   # no el subtotal
+        "currency": "EUR",
+    }
+    assert all(v["confidence"] >= 0.9 and v["source"] == "rules" for v in found.values())
+
+
+def test_value_on_the_line_below_the_label():
+    found = extract_fields("form", ["form_id", "title"], "Form ID\nAB-77\nTotal 3 items")
+
+    assert found == {"form_id": {"value": "AB-77", "confidence": 0.85, "source": "rules"}}
+
+
+def test_memo_header_and_unlabelled_date():
+    text = "MEMORANDUM\nTo: All staff\nFrom: Jane Doe\nSubject: Parking\nThe lot closes on 2024-01-05."
+    found = extract_fields("memo", ["author", "recipient", "subject", "date", "content"], text)
+
+    assert found["author"]["value"] == "Jane Doe"
+    assert found["recipient"]["value"] == "All staff"
+    assert found["subject"]["value"] == "Parking"
+    assert found["date"] == {"value": "2024-01-05", "confidence": 0.7, "source": "rules"}
+    assert "content" not in found
+
+
+def test_combine_keeps_the_most_confident_value():
+    llm = {"date": {"value": "5 Jan 2024", "confidence": 0.9},
+           "total_amount": {"value": "not found", "confidence": 0.0}}
+    ruled = {"date": {"value": "2024-01-05", "confidence": 0.7, "source": "rules"},
+             "total_amount": {"value": "10.00", "confidence": 0.7, "source": "rules"},
+             "invoice_number": {"value": "F-1", "confidence": 0.95, "source": "rules"}}
+
+    merged = combine(llm, ruled)
+
+    assert merged["date"]["value"] == "5 Jan 2024"
+    assert merged["total_amount"]["value"] == "10.00"
+    assert merged["invoice_number"]["value"] == "F-1"
+
+
+def test_generic_date_labels_only_fill_the_plain_date_field():
+    found = extract_fields("invoice", ["date", "due_date"], "Invoice Date: 12/05/2024")
+    assert found["date"]["value"] == "12/05/2024"
+    assert "due_date" not in found
+
+    assert extract_fields("budget", ["date_created"], "Date: 12/05/2024") == {}
+
+
+def test_phone_rejects_year_ranges_and_unlabelled_numbers():
+    resume = "ACME Corp 2015 - 2019\nUniversity 2010-2014\nCall 555 123 4567"
+    assert extract_fields("resume", ["phone"], resume) == {}
+    assert extract_fields("resume", ["phone"], "Tel: 2015 - 2019") == {}
+    assert extract_fields("resume", ["phone"], "Tel: 555 123 4567")["phone"]["value"] == "555 123 4567"
+
+
+def test_bare_prefix_and_years_are_not_identifiers():
+    assert extract_fields("budget", ["budget_id"], "Budget 2024\nMarketing plan") == {}
+    assert extract_fields("report", ["report_id"], "Report 17 of the committee") == {}
+    assert extract_fields("budget", ["budget_id"], "Budget ID: 2024") == {}
+    assert extract_fields("report", ["report_id"], "Report: R-17")["report_id"]["value"] == "R-17"
+    assert extract_fields("report", ["report_id"], "Report No: 17")["report_id"]["value"] == "17"
+
+
+def test_unlabelled_values_do_not_skip_the_llm():
+    from rules import RULES_MIN_CONFIDENCE
+
+    found = extract_fields("email", ["email", "date"], "Write to jane@acme.com before 2024-01-05")
+
+    assert found["email"]["value"] == "jane@acme.com"
+    assert all(v["confidence"] < RULES_MIN_CONFIDENCE for v in found.values())